@@ -101,7 +101,7 @@ const Home = () => {
             >
               <input
                 type="file"
-                accept=".csv,.xlsx"
+                accept=".csv,.csv.gz,.csv.zst,.parquet,.pq,.arrow,.feather,.pmu,.xlsx"
                 onChange={handleFileChange}
                 className="hidden"
                 id="file-upload"
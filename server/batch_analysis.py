@@ -0,0 +1,319 @@
+# batch_analysis.py
+"""
+Offline forced-oscillation analysis of archived recordings, without the server.
+
+    cd server && python batch_analysis.py "/archive/2019/**/*.csv" /archive/events/ --output results.parquet
+
+Every recording matching the given files, directories (searched
+recursively) and glob patterns is classified, located and timed with the
+same models, feature plans and duration pipeline as the API. Files are
+spread over a process pool. The output is one row per file, written as
+Parquet or CSV by the --output suffix:
+
+    path, filename, size, mtime
+    predicted_class, predicted_source          (the two XGBoost models)
+    start_time, end_time, duration, engine     (CWT + --engine, after the spectral screen)
+    dominant_frequency                         (spectral screen; empty when no clear peak)
+    error                                      (why a field is missing, if one is)
+    parse_seconds, features_seconds, predict_seconds, screen_seconds, cwt_seconds, anomaly_seconds,
+    total_seconds
+
+Resuming: each finished file is appended to <output>.partial.jsonl as soon
+as its worker returns. Rerunning the same command after an interruption
+skips files already in the journal or in the output, unless their size or
+modification time changed. The output is rewritten from both at the end
+and the journal removed.
+
+Memory: models load once in the parent and forked workers share them
+copy-on-write. --max-memory-mb caps the address space each worker may grow
+by past that starting point, so an oversized recording fails with a
+MemoryError recorded in its row instead of exhausting the machine. If a
+worker dies outright, the pool is restarted and the files it held are
+retried once.
+"""
+
+import argparse
+import errno
+import glob
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+import config
+import metrics
+from dataset_cache import decode_upload
+from compiled_trees import TreePredictors
+from features import PREDICTION_MODELS, FeaturePlans
+from formats import supported_suffixes, upload_format
+from metrics import stage
+from model_registry import ModelRegistry
+from spectral import configured_screen
+from utils import (
+    CONTAMINATION_VALUES,
+    CWT_SCALES,
+    DURATION_ENGINES,
+    MIN_ANOMALY_DURATION,
+    MIN_POWER_THRESHOLD,
+    detect_anomaly_window,
+    detect_oscillation_start_cwt,
+)
+
+STAGES = ('parse', 'features', 'predict', 'screen', 'cwt', 'anomaly')
+RESULT_COLUMNS = (
+    ['path', 'filename', 'size', 'mtime']
+    + [key for key, _, _, _ in PREDICTION_MODELS]
+    + ['start_time', 'end_time', 'duration', 'dominant_frequency', 'engine', 'error']
+    + [f'{name}_seconds' for name in STAGES] + ['total_seconds']
+)
+# Channel the duration pipeline runs on, as in /api/detect_duration
+DURATION_COLUMNS = ('Time', 'P1')
+
+_models = None
+_plans = None
+_predictors = None
+
+
+def load_models():
+    """Registry, feature plans and tree predictors, loaded once per process (in the parent, before workers fork)."""
+    global _models, _plans, _predictors
+    if _models is None:
+        _models = ModelRegistry(config.MODEL_DIR, prefer=config.MODEL_FORMAT)
+        _models.warm_up(background=False)
+        _plans = FeaturePlans(_models)
+        _predictors = TreePredictors(_models)
+        for _, model_name, _, importances_name in PREDICTION_MODELS:
+            _predictors.compiled(model_name, _plans.get(model_name, importances_name))
+    return _models, _plans, _predictors
+
+
+def _address_space_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[0]) * resource.getpagesize()
+
+
+def init_worker(max_memory_mb):
+    if max_memory_mb and os.path.exists("/proc/self/statm"):
+        limit = _address_space_bytes() + max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def file_key(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def analyse_file(path, engine):
+    """One result row for one recording; failures are recorded in 'error' rather than raised."""
+    models, plans, predictors = load_models()
+    size, mtime = file_key(path)
+    row = {'path': path, 'filename': os.path.basename(path), 'size': size, 'mtime': mtime, 'engine': engine}
+    errors = []
+    trace, token = metrics.start_trace("BATCH", path)
+    try:
+        model_plans = [(key, model_name, encoder_name, plans.get(model_name, importances_name))
+                       for key, model_name, encoder_name, importances_name in PREDICTION_MODELS]
+        columns = set(DURATION_COLUMNS).union(*(plan.columns for _, _, _, plan in model_plans))
+        with stage("parse"):
+            dataset = decode_upload(row['filename'], path, columns=columns)
+
+        for key, model_name, encoder_name, plan in model_plans:
+            problem = plan.problem(dataset)
+            if problem:
+                errors.append(f"{key}: {problem}")
+                continue
+            with stage("features"):
+                weighted = plan.value_matrix([dataset])
+            with stage("predict"):
+                labels = predictors.predict(model_name, plan, weighted)
+            row[key] = str(models.get(encoder_name).inverse_transform(labels)[0])
+
+        if all(name in dataset for name in DURATION_COLUMNS):
+            # The API's spectral screen first: without a clear peak there is no oscillation to time
+            with stage("screen"):
+                screened = configured_screen(dataset['P1'], dataset['Time'])[0]
+            window = None
+            if screened['passed']:
+                row['dominant_frequency'] = screened['dominant_frequency']
+                with stage("cwt"):
+                    avg_power, _, _ = detect_oscillation_start_cwt(
+                        dataset['P1'], CWT_SCALES, cwt_backend=config.CWT_BACKEND, dtype=config.CWT_DTYPE)
+                with stage("anomaly"):
+                    _, window = detect_anomaly_window(avg_power, dataset['Time'], CONTAMINATION_VALUES,
+                                                      MIN_ANOMALY_DURATION, MIN_POWER_THRESHOLD, engine)
+            if window is not None:
+                row['start_time'], row['end_time'], row['duration'] = (float(value) for value in window)
+        else:
+            errors.append("duration: Time and P1 columns are required")
+    except Exception as e:
+        if isinstance(e, MemoryError) or (isinstance(e, OSError) and e.errno == errno.ENOMEM):
+            # Allocations and file mappings both fail this way once the worker reaches its cap
+            errors.append("MemoryError: the recording does not fit in the per-worker memory cap")
+        else:
+            errors.append(f"{type(e).__name__}: {e}")
+    finally:
+        metrics.end_trace(token)
+
+    totals = trace.totals()
+    for name in STAGES:
+        row[f'{name}_seconds'] = totals.get(name, 0.0)
+    row['total_seconds'] = time.perf_counter() - trace.started
+    row['error'] = "; ".join(errors) or None
+    return row
+
+
+def find_recordings(patterns):
+    """Supported recordings among files, directories (recursive) and glob patterns, sorted and unique."""
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = glob.glob(os.path.join(pattern, "**", "*"), recursive=True)
+        else:
+            candidates = glob.glob(pattern, recursive=True)
+        found.update(os.path.abspath(path) for path in candidates
+                     if os.path.isfile(path) and upload_format(path) is not None)
+    return sorted(found)
+
+
+def journal_path(output):
+    return output + ".partial.jsonl"
+
+
+def read_results(path):
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def read_journal(path):
+    rows = []
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    pass  # a line cut short by the interruption
+    return rows
+
+
+def completed_rows(output, retry_errors):
+    """Rows from earlier runs, by path, for files that haven't changed since."""
+    previous = read_results(output).to_dict("records") + read_journal(journal_path(output))
+    done = {}
+    for row in previous:
+        path = row['path']
+        if not os.path.exists(path) or file_key(path) != (row['size'], row['mtime']):
+            continue
+        if retry_errors and isinstance(row.get('error'), str):
+            continue
+        done[path] = row
+    return done
+
+
+def write_results(output, rows):
+    frame = pd.DataFrame(rows, columns=RESULT_COLUMNS).sort_values('path', ignore_index=True)
+    tmp_path = output + ".tmp"
+    if output.endswith(".parquet"):
+        frame.to_parquet(tmp_path, index=False)
+    else:
+        frame.to_csv(tmp_path, index=False, compression='gzip' if output.endswith('.gz') else None)
+    os.replace(tmp_path, output)
+    return frame
+
+
+def run(paths, output, engine, workers, max_memory_mb, retry_errors=False):
+    done = completed_rows(output, retry_errors)
+    pending = [path for path in paths if path not in done]
+    print(f"{len(paths)} recordings, {len(done)} already analysed, {len(pending)} to go")
+
+    load_models()  # before the pool forks, so every worker shares them
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+    attempts = {}
+    started = time.perf_counter()
+    finished = 0
+    with open(journal_path(output), "a") as journal:
+        while pending:
+            retry = []
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                     initializer=init_worker, initargs=(max_memory_mb,)) as pool:
+                queue = list(reversed(pending))
+                in_flight = {}
+                try:
+                    while queue or in_flight:
+                        # Keep a couple of files per worker queued; submitting everything up front
+                        # would lose more work to a crashed pool
+                        while queue and len(in_flight) < 2 * workers:
+                            path = queue.pop()
+                            in_flight[pool.submit(analyse_file, path, engine)] = path
+                        completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in completed:
+                            path = in_flight.pop(future)
+                            row = future.result()
+                            journal.write(json.dumps(row) + "\n")
+                            journal.flush()
+                            done[path] = row
+                            finished += 1
+                            if finished % 50 == 0 or not (queue or in_flight):
+                                rate = finished / (time.perf_counter() - started)
+                                print(f"{len(done)}/{len(paths)} done, {rate:.1f} files/s")
+                except BrokenProcessPool:
+                    # A worker died without returning (e.g. killed by the OS); retry the files in flight
+                    # once, since any of them may have been the cause, and requeue the rest
+                    for path in in_flight.values():
+                        attempts[path] = attempts.get(path, 0) + 1
+                        if attempts[path] > 1:
+                            row = {'path': path, 'filename': os.path.basename(path), 'engine': engine,
+                                   'error': "Worker process died while analysing this file"}
+                            row['size'], row['mtime'] = file_key(path)
+                            journal.write(json.dumps(row) + "\n")
+                            journal.flush()
+                            done[path] = row
+                        else:
+                            retry.append(path)
+                    retry.extend(reversed(queue))
+                    print(f"Worker pool broke, restarting with {len(retry)} files left")
+            pending = retry
+
+    # Rows from earlier runs over other files are kept, so one output can collect several archives
+    frame = write_results(output, list(done.values()))
+    os.remove(journal_path(output))
+    return frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="recordings, directories or glob patterns (quote them)")
+    parser.add_argument("--output", required=True, help="results file, .parquet or .csv[.gz]")
+    parser.add_argument("--engine", default=config.DURATION_ENGINE, choices=DURATION_ENGINES)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-memory-mb", type=int, default=2048,
+                        help="address space each worker may add while analysing a file, 0 for no cap")
+    parser.add_argument("--retry-errors", action="store_true", help="re-analyse files whose earlier row has an error")
+    args = parser.parse_args()
+
+    if not args.output.endswith((".parquet", ".csv", ".csv.gz")):
+        sys.exit("--output must end in .parquet, .csv or .csv.gz")
+    paths = find_recordings(args.inputs)
+    if not paths:
+        sys.exit(f"No recordings found; supported suffixes are {', '.join(supported_suffixes())}")
+
+    try:
+        frame = run(paths, os.path.abspath(args.output), args.engine, args.workers, args.max_memory_mb,
+                    args.retry_errors)
+    except KeyboardInterrupt:
+        sys.exit(f"Interrupted; finished files are in {journal_path(args.output)}, rerun the same command to resume")
+    errors = frame['error'].notna().sum()
+    print(f"Wrote {len(frame)} rows to {args.output} ({errors} with errors)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Compare the duration engines on labelled synthetic events: speed and start/end accuracy.
+
+Every case is a synthetic recording (benchmarks/synthetic.py) with a known
+onset and end, drawn over a grid of oscillation frequencies, amplitudes,
+onsets and lengths, plus event-free recordings to count false alarms. The
+CWT power is computed once per case and every engine labels the same power,
+so only the labelling step (Isolation Forest sweep or change-point detector
+plus window search) is timed.
+
+Frequencies stay within 0.3-1 Hz: at 30 samples/s the Savitzky-Golay
+filter in front of the CWT suppresses faster oscillations, and the 1-100
+scales barely reach slower ones, so no engine could see them. Event-free
+recordings are reported for reference only: the power is min-max scaled
+before any engine sees it, so the largest noise burst always reaches 1.
+
+    cd server && python benchmarks/bench_changepoint.py --cases 40 --json changepoint.json
+
+A case counts as detected when both the start and end are within
+--tolerance seconds of the truth.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import generate_pmu_frame  # noqa: E402
+from utils import (  # noqa: E402
+    CONTAMINATION_VALUES,
+    CWT_SCALES,
+    DURATION_ENGINES,
+    MIN_ANOMALY_DURATION,
+    MIN_POWER_THRESHOLD,
+    detect_anomaly_window,
+    detect_oscillation_start_cwt,
+)
+
+
+def make_cases(count, num_samples, event_free, seed):
+    rng = np.random.default_rng(seed)
+    span = num_samples / 30.0
+    cases = []
+    for i in range(count + event_free):
+        has_event = i < count
+        length = rng.uniform(0.15, 0.5) * span
+        onset = rng.uniform(0.05 * span, span - length - 0.05 * span)
+        frame, truth = generate_pmu_frame(
+            num_samples=num_samples,
+            frequency=rng.uniform(0.3, 1.0),
+            amplitude=rng.choice([0.01, 0.02, 0.05]),
+            source=1 if has_event else None,
+            onset=onset,
+            length=length,
+            seed=int(rng.integers(1 << 31)),
+        )
+        power, _, _ = detect_oscillation_start_cwt(frame['P1'].to_numpy(), CWT_SCALES)
+        cases.append((power, frame['Time'].to_numpy(), truth))
+    return cases
+
+
+def evaluate(engine, cases, repeats, tolerance):
+    seconds, start_errors, end_errors = [], [], []
+    detected = missed = false_alarms = 0
+    for power, times, truth in cases:
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            _, window = detect_anomaly_window(power, times, CONTAMINATION_VALUES, MIN_ANOMALY_DURATION,
+                                              MIN_POWER_THRESHOLD, engine)
+            timings.append(time.perf_counter() - started)
+        seconds.append(min(timings))
+
+        if truth['source'] is None:
+            false_alarms += window is not None
+            continue
+        if window is None:
+            missed += 1
+            continue
+        start_error = abs(float(window[0]) - truth['start_time'])
+        end_error = abs(float(window[1]) - truth['end_time'])
+        start_errors.append(start_error)
+        end_errors.append(end_error)
+        detected += start_error <= tolerance and end_error <= tolerance
+
+    events = sum(truth['source'] is not None for _, _, truth in cases)
+    return {
+        'engine': engine,
+        'mean_ms': 1000 * float(np.mean(seconds)),
+        'start_error_median': float(np.median(start_errors)) if start_errors else None,
+        'end_error_median': float(np.median(end_errors)) if end_errors else None,
+        'start_error_p90': float(np.percentile(start_errors, 90)) if start_errors else None,
+        'end_error_p90': float(np.percentile(end_errors, 90)) if end_errors else None,
+        'detected': detected,
+        'missed': missed,
+        'events': events,
+        'false_alarms': false_alarms,
+        'event_free': len(cases) - events,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=40, help="recordings with an injected event")
+    parser.add_argument("--event-free", type=int, default=10, help="recordings without one")
+    parser.add_argument("--samples", type=int, default=3001)
+    parser.add_argument("--engines", nargs="+", default=list(DURATION_ENGINES), choices=DURATION_ENGINES)
+    parser.add_argument("--tolerance", type=float, default=2.0, help="seconds")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    cases = make_cases(args.cases, args.samples, args.event_free, args.seed)
+    results = [evaluate(engine, cases, args.repeats, args.tolerance) for engine in args.engines]
+
+    def fmt(value):
+        return f"{value:.2f}" if value is not None else "-"
+
+    print(f"{'engine':>16} {'mean ms':>8} {'start med/p90 (s)':>18} {'end med/p90 (s)':>16} "
+          f"{'within tol':>10} {'missed':>6} {'false alarms':>12}")
+    for r in results:
+        print(f"{r['engine']:>16} {r['mean_ms']:>8.2f} "
+              f"{fmt(r['start_error_median']) + ' / ' + fmt(r['start_error_p90']):>18} "
+              f"{fmt(r['end_error_median']) + ' / ' + fmt(r['end_error_p90']):>16} "
+              f"{r['detected']:>4}/{r['events']:<5} {r['missed']:>6} {r['false_alarms']:>5}/{r['event_free']:<6}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
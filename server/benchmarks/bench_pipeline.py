@@ -0,0 +1,184 @@
+"""
+Time every stage of the server pipeline on synthetic recordings of several sizes.
+
+Stages: parse (CSV decode), parse_pruned (only Time and P1, as the duration
+endpoints load them), cwt (detect_oscillation_start_cwt), anomaly
+(Isolation Forest contamination sweep), predict (feature weighting at the
+used positions + both models, scored by FO_TREE_ENGINE, only at the sample
+count the models were trained on) and render (the four duration plots). For each stage and size the best-of-N
+wall time, throughput and peak Python-allocated memory (tracemalloc, which
+numpy reports to) are recorded.
+
+    cd server && python benchmarks/bench_pipeline.py --sizes 3001 30001 --json results.json
+
+Regression checks, exit status 1 when any fails:
+
+    --thresholds benchmarks/thresholds.json   absolute seconds per stage and size
+    --baseline results.json --tolerance 1.5   no stage slower than 1.5x a saved run
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from dataset_cache import decode_upload  # noqa: E402
+from compiled_trees import TreePredictors  # noqa: E402
+from features import FeaturePlans  # noqa: E402
+from model_registry import ModelRegistry  # noqa: E402
+from synthetic import generate_pmu_frame  # noqa: E402
+from utils import (  # noqa: E402
+    CONTAMINATION_VALUES,
+    CWT_SCALES,
+    MIN_POWER_THRESHOLD,
+    PLOT_TYPES,
+    detect_anomalies_with_optimized_isolation_forest,
+    detect_oscillation_start_cwt,
+    render_plot,
+)
+
+STAGES = ('parse', 'parse_pruned', 'cwt', 'anomaly', 'predict', 'render')
+PREDICT_MODELS = (
+    ("xgb_model_weighted", "rf_feature_importances"),
+    ("xgb_model_weighted_detection", "rf_feature_importances_detection"),
+)
+
+
+def best_of(repeats, fn):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def stage_functions(size, predictors, plans, skip_render):
+    """Zero-argument callables for every stage at one size; each stage feeds the next."""
+    frame, _ = generate_pmu_frame(num_samples=size, source=1, onset=size / 30 * 0.3, length=size / 30 * 0.4, seed=0)
+    content = frame.to_csv(index=False).encode()
+    dataset = decode_upload('bench.csv', content)
+    signal, times = dataset['P1'], dataset['Time']
+    avg_power, filtered, detrended = detect_oscillation_start_cwt(
+        signal, CWT_SCALES, cwt_backend=config.CWT_BACKEND, dtype=config.CWT_DTYPE)
+    anomalies, _ = detect_anomalies_with_optimized_isolation_forest(avg_power, CONTAMINATION_VALUES, MIN_POWER_THRESHOLD)
+
+    def predict():
+        for model_name, importances_name in PREDICT_MODELS:
+            plan = plans.get(model_name, importances_name)
+            predictors.predict(model_name, plan, plan.value_matrix([dataset]))
+
+    def render():
+        series = {'original_signal': signal, 'detrended_signal': detrended,
+                  'filtered_signal': filtered, 'cwt_power_with_anomalies': avg_power}
+        for plot_type in PLOT_TYPES:
+            render_plot(plot_type, times, series[plot_type], times[0], times[-1], anomalies=anomalies)
+
+    model_samples = plans.get(*PREDICT_MODELS[0]).num_samples
+    functions = {
+        'parse': (lambda: decode_upload('bench.csv', content), len(content)),
+        'parse_pruned': (lambda: decode_upload('bench.csv', content, columns=('Time', 'P1')), len(content)),
+        'cwt': (lambda: detect_oscillation_start_cwt(
+            signal, CWT_SCALES, cwt_backend=config.CWT_BACKEND, dtype=config.CWT_DTYPE), None),
+        'anomaly': (lambda: detect_anomalies_with_optimized_isolation_forest(
+            avg_power, CONTAMINATION_VALUES, MIN_POWER_THRESHOLD), None),
+        'predict': (predict, None) if size == model_samples else None,
+        'render': (render, None) if not skip_render else None,
+    }
+    return functions
+
+
+def run(sizes, repeats, skip_render):
+    registry = ModelRegistry(config.MODEL_DIR, prefer=config.MODEL_FORMAT)
+    plans = FeaturePlans(registry)
+    predictors = TreePredictors(registry)
+    results = []
+    for size in sizes:
+        for stage, spec in stage_functions(size, predictors, plans, skip_render).items():
+            if spec is None:
+                continue
+            fn, nbytes = spec
+            fn()  # warm caches and lazily loaded models outside the measurement
+            seconds = best_of(repeats, fn)
+            results.append({
+                'stage': stage,
+                'samples': size,
+                'seconds': seconds,
+                'samples_per_second': size / seconds,
+                'mb_per_second': nbytes / seconds / 1e6 if nbytes else None,
+                'peak_bytes': peak_memory(fn),
+            })
+    return results
+
+
+def check_thresholds(results, thresholds):
+    failures = []
+    for result in results:
+        limit = thresholds.get(result['stage'], {}).get(str(result['samples']))
+        if limit is not None and result['seconds'] > limit:
+            failures.append(f"{result['stage']} @ {result['samples']}: {result['seconds']:.3f}s > {limit:.3f}s limit")
+    return failures
+
+
+def check_baseline(results, baseline, tolerance):
+    previous = {(r['stage'], r['samples']): r['seconds'] for r in baseline}
+    failures = []
+    for result in results:
+        before = previous.get((result['stage'], result['samples']))
+        if before is not None and result['seconds'] > before * tolerance:
+            failures.append(f"{result['stage']} @ {result['samples']}: {result['seconds']:.3f}s vs "
+                            f"{before:.3f}s baseline (> {tolerance:.2f}x)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3001, 30001])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--skip-render", action="store_true", help="skip the kaleido plot rendering stage")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--thresholds", help="JSON {stage: {samples: max seconds}} to check against")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown versus --baseline")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeats, args.skip_render)
+
+    print(f"{'stage':>12} {'samples':>8} {'seconds':>9} {'samples/s':>11} {'MB/s':>7} {'peak MB':>8}")
+    for r in results:
+        mb_per_second = f"{r['mb_per_second']:.1f}" if r['mb_per_second'] else "-"
+        print(f"{r['stage']:>12} {r['samples']:>8} {r['seconds']:>9.4f} {r['samples_per_second']:>11.0f} "
+              f"{mb_per_second:>7} {r['peak_bytes'] / 1e6:>8.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failures = []
+    if args.thresholds:
+        with open(args.thresholds) as f:
+            failures += check_thresholds(results, json.load(f))
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures += check_baseline(results, json.load(f), args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Spectral pre-screen (spectral.py) on synthetic recordings: cost, gate accuracy and frequency estimates.
+
+Every recording holds all 40 channels. In event recordings
+(benchmarks/synthetic.py) the source generator oscillates at a random
+frequency and amplitude over a random span, and the other generators carry
+attenuated copies. Per amplitude the report gives:
+
+  pass      source P channels the gate lets through (they should all pass)
+  freq err  median / largest |estimated - injected| frequency on those channels
+  skipped   share of all channels screened out
+
+Event-free recordings give the false-pass rate, i.e. channels on which the
+expensive stages would have run for nothing. The last lines compare the
+screen over all 40 channels with the CWT + Isolation Forest pipeline on one.
+
+    cd server && python benchmarks/bench_screen.py --cases 20 --min-peak-ratio 50
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from features import FEATURE_COLUMNS  # noqa: E402
+from spectral import spectral_screen  # noqa: E402
+from synthetic import generate_pmu_frame  # noqa: E402
+from utils import CONTAMINATION_VALUES, CWT_SCALES, run_duration_pipeline  # noqa: E402
+
+
+def best_of(repeats, fn):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def screen(frame, args):
+    return spectral_screen(frame[FEATURE_COLUMNS].to_numpy(), frame['Time'].to_numpy(), band=tuple(args.band),
+                           segment_seconds=args.segment_seconds, min_peak_ratio=args.min_peak_ratio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=20, help="event recordings per amplitude")
+    parser.add_argument("--event-free", type=int, default=20)
+    parser.add_argument("--amplitudes", type=float, nargs="+", default=[0.002, 0.005, 0.01, 0.05])
+    parser.add_argument("--band", type=float, nargs=2, default=list(config.SCREEN_BAND_HZ))
+    parser.add_argument("--segment-seconds", type=float, default=config.SCREEN_SEGMENT_SECONDS)
+    parser.add_argument("--min-peak-ratio", type=float, default=config.SCREEN_MIN_PEAK_RATIO)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    source_index = {generator: FEATURE_COLUMNS.index(f"P{generator}") for generator in range(1, 11)}
+
+    print(f"band {args.band[0]}-{args.band[1]} Hz, {args.segment_seconds} s segments, "
+          f"min peak ratio {args.min_peak_ratio}")
+    print(f"{'amplitude':>9} {'pass':>9} {'freq err med/max (Hz)':>22} {'skipped':>8}")
+    for amplitude in args.amplitudes:
+        passed, errors, skipped = 0, [], 0
+        for case in range(args.cases):
+            source = int(rng.integers(1, 11))
+            frequency = float(rng.uniform(max(args.band[0], 0.1), min(args.band[1], 5.0)))
+            frame, _ = generate_pmu_frame(frequency=frequency, amplitude=amplitude, source=source,
+                                          onset=float(rng.uniform(5, 60)), length=float(rng.uniform(10, 40)),
+                                          seed=args.seed * 1000 + case)
+            results = screen(frame, args)
+            source_result = results[source_index[source]]
+            if source_result["passed"]:
+                passed += 1
+                errors.append(abs(source_result["dominant_frequency"] - frequency))
+            skipped += sum(not result["passed"] for result in results)
+        error = f"{np.median(errors):.4f} / {max(errors):.4f}" if errors else "-"
+        print(f"{amplitude:>9} {passed:>4}/{args.cases:<4} {error:>22} "
+              f"{skipped / (args.cases * len(FEATURE_COLUMNS)):>7.0%}")
+
+    false_passes, ratios = 0, []
+    for case in range(args.event_free):
+        frame, _ = generate_pmu_frame(source=None, seed=10_000 + case)
+        results = screen(frame, args)
+        false_passes += sum(result["passed"] for result in results)
+        ratios += [result["peak_ratio"] for result in results]
+    print(f"event-free: {false_passes}/{args.event_free * len(FEATURE_COLUMNS)} channels passed, "
+          f"peak ratio median {np.median(ratios):.1f}, max {max(ratios):.1f}")
+
+    frame, _ = generate_pmu_frame(seed=args.seed)
+    signal, times = frame['P1'].to_numpy(), frame['Time'].to_numpy()
+    screen_seconds = best_of(args.repeats, lambda: screen(frame, args))
+    pipeline_seconds = best_of(args.repeats, lambda: run_duration_pipeline(
+        signal, times, CWT_SCALES, CONTAMINATION_VALUES, cwt_backend=config.CWT_BACKEND, dtype=config.CWT_DTYPE))
+    print(f"screen, {len(FEATURE_COLUMNS)} channels: {screen_seconds * 1000:.1f} ms; "
+          f"CWT + Isolation Forest, 1 channel: {pipeline_seconds * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
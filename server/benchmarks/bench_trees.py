@@ -0,0 +1,118 @@
+"""
+Compiled tree arrays (compiled_trees.py) against the XGBoost models they were compiled from.
+
+For both models and every batch size, rows are taken from windows of a
+synthetic recording (plus a share of rows with missing values) and scored
+two ways from the same feature-plan values:
+
+  xgboost   sparse full-width rows -> XGBClassifier.predict, the previous path
+  compiled  CompiledTrees.predict on the compact rows
+
+Reported per batch size: best-of-N latency of each path, and the peak
+Python-side memory of one call (tracemalloc; XGBoost's own C++ buffers are
+not visible to it). Per model: compile time, the size of the compiled arrays
+against the serialized booster, and whether margins and labels are
+identical over all rows, with the largest probability difference.
+
+    cd server && python benchmarks/bench_trees.py --batch-sizes 1 16 256 --repeats 20
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import xgboost as xgb
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from compiled_trees import CompiledTrees  # noqa: E402
+from dataset_cache import decode_upload  # noqa: E402
+from features import PREDICTION_MODELS, FeaturePlans  # noqa: E402
+from model_registry import ModelRegistry  # noqa: E402
+from synthetic import generate_pmu_frame  # noqa: E402
+
+
+def best_of(repeats, fn):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def sample_rows(plan, num_rows, seed):
+    """Weighted rows from windows of a synthetic recording, every fifth with some values missing."""
+    frame, _ = generate_pmu_frame(num_samples=plan.num_samples + num_rows * 10, source=seed % 10 + 1, seed=seed)
+    dataset = decode_upload('bench.csv', frame.to_csv(index=False).encode(), columns=plan.columns)
+    values, _ = plan.window_values(dataset, 10)
+    values = values[:num_rows]
+    rng = np.random.default_rng(seed)
+    missing = rng.random(values.shape) < 0.2
+    missing[1::5] = False
+    values[missing] = np.nan
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 256])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--check-rows", type=int, default=2000, help="rows compared for exactness")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(config.MODEL_DIR, prefer=config.MODEL_FORMAT)
+    plans = FeaturePlans(registry)
+
+    for _, model_name, _, importances_name in PREDICTION_MODELS:
+        model = registry.get(model_name)
+        plan = plans.get(model_name, importances_name)
+        start = time.perf_counter()
+        trees = CompiledTrees.from_model(model, plan.positions)
+        compile_seconds = time.perf_counter() - start
+
+        rows = sample_rows(plan, max(args.check_rows, max(args.batch_sizes)), seed=len(plan.positions))
+        reference = model.get_booster().predict(xgb.DMatrix(plan.sparse(rows)), output_margin=True)
+        margins_equal = np.array_equal(reference.reshape(len(rows), -1), trees.predict_margin(rows))
+        labels_equal = np.array_equal(model.predict(plan.sparse(rows)), trees.predict(rows))
+        probability_diff = np.abs(model.predict_proba(plan.sparse(rows)) - trees.predict_proba(rows)).max()
+
+        print(f"{model_name}: {len(trees.roots)} trees, {len(trees.feature)} nodes, depth {trees.depth}, "
+              f"{len(plan.positions)} of {plan.num_features} features")
+        print(f"  compile {compile_seconds * 1000:.1f} ms, arrays {trees.nbytes / 1024:.0f} KiB "
+              f"(serialized booster {len(model.get_booster().save_raw()) / 1024:.0f} KiB)")
+        print(f"  {len(rows)} rows: margins identical {margins_equal}, labels identical {labels_equal}, "
+              f"max probability difference {probability_diff:.2e}")
+        print(f"  {'rows':>6} {'xgboost ms':>11} {'compiled ms':>12} {'speedup':>8} {'xgboost KiB':>12} "
+              f"{'compiled KiB':>13}")
+        for batch_size in args.batch_sizes:
+            batch = rows[:batch_size]
+
+            def xgboost_path():
+                model.predict(plan.sparse(batch))
+
+            def compiled_path():
+                trees.predict(batch)
+
+            xgboost_seconds = best_of(args.repeats, xgboost_path)
+            compiled_seconds = best_of(args.repeats, compiled_path)
+            print(f"  {batch_size:>6} {xgboost_seconds * 1000:>11.3f} {compiled_seconds * 1000:>12.3f} "
+                  f"{xgboost_seconds / compiled_seconds:>7.1f}x {peak_memory(xgboost_path) / 1024:>12.0f} "
+                  f"{peak_memory(compiled_path) / 1024:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
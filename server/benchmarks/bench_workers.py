@@ -0,0 +1,130 @@
+"""
+Throughput of the pre-fork server (serve.py) as the number of workers grows.
+
+For every worker count the server is started on a scratch database and blob
+store, ``--files`` distinct synthetic recordings are uploaded, and two loads
+are run with ``--concurrency`` clients against the file id routes:
+
+  cold  every request names a different file, so each one parses the upload
+        and runs the models (locate_source) or the CWT + detector
+        (detect_duration?plots=false)
+  warm  the same requests again, answered from the shared results table
+
+    cd server && python benchmarks/bench_workers.py --workers 1 2 4 --files 48 --concurrency 16
+
+By default the worker counts are 1, 2, 4 and the machine's core count.
+Cold throughput is bounded by CPU cores; one worker process is bound to a
+single core for everything that holds the GIL, so it should grow with the
+worker count up to the number of cores and then level off.
+
+Last run, on a 1-core host (cpus=1, --files 24 --concurrency 8,
+detect_duration with cusum); req/s, cold / warm:
+
+    workers  locate_source    detect_duration
+          1  21.6 / 210       45.8 / 187
+          2  21.9 / 214       22.5 / 198
+          4  19.6 / 168       19.2 / 173
+
+With one core extra workers only add contention, so this shows no
+scaling either way; the multi-core curve still needs a run on a host
+with 4 or more cores.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import percentile, request, upload  # noqa: E402
+from synthetic import generate_pmu_frame, write_pmu_file  # noqa: E402
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUTES = {
+    "locate_source": "/api/locate_source/{file_id}",
+    "detect_duration": "/api/detect_duration/{file_id}?plots=false&engine={engine}",
+}
+
+
+def wait_until_up(base_url, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/openapi.json", timeout=2):
+                return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.25)
+    raise RuntimeError(f"Server at {base_url} did not come up within {timeout}s")
+
+
+def start_server(workers, port, scratch):
+    env = dict(os.environ,
+               FO_DATABASE_URL=f"sqlite:///{os.path.join(scratch, 'bench.db')}",
+               FO_BLOB_STORE_DIR=os.path.join(scratch, "blobs"))
+    return subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--port", str(port), "--log-level", "warning"],
+        cwd=SERVER_DIR, env=env)
+
+
+def run_load(base_url, paths, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda path: request("GET", f"{base_url}{path}"), paths))
+    wall = time.perf_counter() - start
+    ok = [elapsed for status, elapsed in results if status == 200]
+    return len(ok) / wall, percentile(ok, 50), len(results) - len(ok)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--files", type=int, default=48, help="distinct recordings, one cold request each")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--routes", nargs="+", default=list(ROUTES), choices=ROUTES)
+    parser.add_argument("--engine", default="cusum", help="detect_duration engine")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="fo-bench-data-")
+    paths = []
+    for seed in range(args.files):
+        frame, _ = generate_pmu_frame(source=seed % 10 + 1, seed=seed)
+        path = os.path.join(data_dir, f"recording_{seed}.csv")
+        write_pmu_file(path, frame)
+        paths.append(path)
+
+    print(f"cpus={os.cpu_count()} files={args.files} concurrency={args.concurrency}")
+    print(f"{'workers':>7} {'route':<16} {'cold req/s':>10} {'cold p50 s':>10} {'warm req/s':>10} "
+          f"{'warm p50 s':>10} {'err':>4}")
+    try:
+        for workers in args.workers:
+            scratch = tempfile.mkdtemp(prefix="fo-bench-server-")
+            server = start_server(workers, args.port, scratch)
+            base_url = f"http://127.0.0.1:{args.port}"
+            try:
+                wait_until_up(base_url)
+                file_ids = [upload(base_url, path) for path in paths]
+                for route in args.routes:
+                    urls = [ROUTES[route].format(file_id=file_id, engine=args.engine) for file_id in file_ids]
+                    cold_rps, cold_p50, cold_err = run_load(base_url, urls, args.concurrency)
+                    warm_rps, warm_p50, warm_err = run_load(base_url, urls, args.concurrency)
+                    print(f"{workers:>7} {route:<16} {cold_rps:>10.2f} {cold_p50:>10.3f} {warm_rps:>10.2f} "
+                          f"{warm_p50:>10.3f} {cold_err + warm_err:>4}")
+            finally:
+                server.terminate()
+                server.wait(timeout=60)
+                shutil.rmtree(scratch, ignore_errors=True)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Concurrent load test against a running server.
+
+Uploads one recording, fires ``--requests`` calls at each endpoint with
+``--concurrency`` clients, and meanwhile probes a trivial route to show
+whether the event loop stays responsive while heavy requests are in flight.
+
+    cd server && uvicorn main:app --port 8000 &
+    python benchmarks/load_test.py --file recording.csv --concurrency 8
+
+Only the standard library is used, so the same script can be pointed at
+older builds of the server for before/after comparisons.
+"""
+
+import argparse
+import json
+import mimetypes
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+def request(method, url, body=None, headers=None):
+    req = urllib.request.Request(url, data=body, method=method, headers=headers or {})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=600) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - start
+
+
+def upload(base_url, path):
+    boundary = uuid.uuid4().hex
+    filename = os.path.basename(path)
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    with open(path, "rb") as f:
+        content = f.read()
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    req = urllib.request.Request(
+        f"{base_url}/api/upload", data=body, method="POST",
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    with urllib.request.urlopen(req) as response:
+        return json.loads(response.read())["file_id"]
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def run_endpoint(base_url, method, path, body, concurrency, total):
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    payload = json.dumps(body).encode() if body is not None else None
+
+    probe_latencies = []
+    done = threading.Event()
+
+    def probe():
+        while not done.is_set():
+            _, elapsed = request("GET", f"{base_url}/openapi.json")
+            probe_latencies.append(elapsed)
+            time.sleep(0.05)
+
+    prober = threading.Thread(target=probe, daemon=True)
+    prober.start()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: request(method, f"{base_url}{path}", payload, headers), range(total)))
+    wall = time.perf_counter() - start
+    done.set()
+    prober.join()
+
+    ok = [elapsed for status, elapsed in results if status == 200]
+    rejected = sum(1 for status, _ in results if status == 429)
+    failed = len(results) - len(ok) - rejected
+    print(f"{path:<28} {len(ok) / wall:>8.2f} {percentile(ok, 50):>8.2f} {percentile(ok, 95):>8.2f} "
+          f"{rejected:>5} {failed:>5} {percentile(probe_latencies, 50) * 1000:>9.1f} "
+          f"{max(probe_latencies, default=float('nan')) * 1000:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--file", required=True, help="CSV/XLSX recording to upload")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=32, help="Requests per endpoint")
+    parser.add_argument("--endpoints", nargs="+",
+                        default=["analyze", "predict_class", "locate_source", "detect_duration"])
+    args = parser.parse_args()
+
+    file_id = upload(args.url, args.file)
+    routes = {
+        "analyze": ("POST", f"/api/analyze/{file_id}", {"generators": ["G1", "G2"], "properties": ["P", "V"]}),
+        "predict_class": ("GET", "/api/predict_class", None),
+        "locate_source": ("GET", "/api/locate_source", None),
+        "detect_duration": ("GET", "/api/detect_duration", None),
+    }
+
+    print(f"concurrency={args.concurrency} requests/endpoint={args.requests}")
+    print(f"{'endpoint':<28} {'req/s':>8} {'p50 s':>8} {'p95 s':>8} {'429':>5} {'err':>5} "
+          f"{'probe p50':>9} {'probe max':>9}")
+    for name in args.endpoints:
+        method, path, body = routes[name]
+        run_endpoint(args.url, method, path, body, args.concurrency, args.requests)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Synthetic PMU recordings with an injected forced oscillation.
+
+Produces the layout the server expects: a Time column followed by the 40
+P1..P10, Q1..Q10, V1..V10, A1..A10 channels. Every channel is a slowly
+drifting operating point plus measurement noise. Between ``onset`` and
+``onset + length`` seconds a sinusoid of ``frequency`` Hz is added, with
+full ``amplitude`` at the source generator and attenuated, phase-shifted
+copies at the others, the way the oscillation propagates through the grid.
+
+    cd server && python benchmarks/synthetic.py event.csv --source 3 --frequency 0.8 --onset 30 --length 40
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from features import FEATURE_COLUMNS  # noqa: E402
+
+NUM_GENERATORS = 10
+
+# Operating point and relative oscillation size of each measured quantity
+BASE_LEVELS = {'P': 1.0, 'Q': 0.3, 'V': 1.02, 'A': 0.1}
+PROPERTY_GAIN = {'P': 1.0, 'Q': 0.6, 'V': 0.2, 'A': 0.4}
+
+
+def generate_pmu_frame(num_samples=3001, sample_rate=30.0, frequency=0.8, amplitude=0.05, source=3,
+                       onset=30.0, length=40.0, noise=0.002, coupling=0.15, seed=None):
+    """
+    Build one synthetic recording.
+
+    Args:
+        num_samples: Samples per channel (the trained models expect 3001)
+        sample_rate: Samples per second
+        frequency: Oscillation frequency in Hz
+        amplitude: Oscillation amplitude at the source generator's P channel
+        source: Generator number (1-10) the oscillation is injected at, or None for an event-free recording
+        onset: Oscillation start time in seconds
+        length: Oscillation length in seconds
+        noise: Standard deviation of the measurement noise
+        coupling: Largest amplitude seen at a non-source generator, relative to the source
+        seed: Seed for the noise and propagation pattern
+
+    Returns:
+        tuple: (frame, truth) where frame is a DataFrame with Time + FEATURE_COLUMNS and
+        truth describes the injected event (source, start_time, end_time, frequency, amplitude)
+    """
+    rng = np.random.default_rng(seed)
+    time = np.arange(num_samples) / sample_rate
+    active = (time >= onset) & (time < onset + length) if source is not None else np.zeros(num_samples, bool)
+    # Short ramps at both ends so the envelope has no step discontinuities
+    ramp = min(1.0, length / 4)
+    envelope = np.clip(np.minimum(time - onset, onset + length - time) / ramp, 0, 1) * active
+
+    # Propagated size and phase of the oscillation at every generator
+    gains = rng.uniform(0.02, coupling, NUM_GENERATORS)
+    phases = rng.uniform(0, 2 * np.pi, NUM_GENERATORS)
+    if source is not None:
+        gains[source - 1], phases[source - 1] = 1.0, 0.0
+
+    columns = {'Time': time}
+    for name in FEATURE_COLUMNS:
+        prop, gen = name[0], int(name[1:])
+        level = BASE_LEVELS[prop] * (gen if prop == 'A' else 1)
+        drift = 0.0005 * time + 0.002 * np.sin(2 * np.pi * time / (time[-1] + 1) + gen)
+        oscillation = (amplitude * PROPERTY_GAIN[prop] * gains[gen - 1]
+                       * np.sin(2 * np.pi * frequency * time + phases[gen - 1]) * envelope)
+        columns[name] = level + drift + oscillation + noise * rng.standard_normal(num_samples)
+
+    truth = {
+        'source': source,
+        'start_time': float(onset) if source is not None else None,
+        'end_time': float(min(onset + length, time[-1])) if source is not None else None,
+        'frequency': frequency,
+        'amplitude': amplitude,
+    }
+    return pd.DataFrame(columns), truth
+
+
+def write_pmu_file(path, frame):
+    """Write a frame as .csv or .xlsx, chosen by the file extension."""
+    if path.endswith('.xlsx'):
+        frame.to_excel(path, index=False)
+    else:
+        frame.to_csv(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output", help=".csv or .xlsx file to write")
+    parser.add_argument("--samples", type=int, default=3001)
+    parser.add_argument("--sample-rate", type=float, default=30.0)
+    parser.add_argument("--frequency", type=float, default=0.8)
+    parser.add_argument("--amplitude", type=float, default=0.05)
+    parser.add_argument("--source", type=int, default=3, help="0 for no oscillation")
+    parser.add_argument("--onset", type=float, default=30.0)
+    parser.add_argument("--length", type=float, default=40.0)
+    parser.add_argument("--noise", type=float, default=0.002)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    frame, truth = generate_pmu_frame(
+        args.samples, args.sample_rate, args.frequency, args.amplitude, args.source or None,
+        args.onset, args.length, args.noise, seed=args.seed)
+    write_pmu_file(args.output, frame)
+    print(f"Wrote {args.output}: {len(frame)} samples, {truth}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# blob_store.py
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, max_bytes):
+        super().__init__(f"Upload exceeds the {max_bytes} byte limit")
+        self.max_bytes = max_bytes
+
+
+class BlobStore:
+    """
+    Content-addressed file store: each blob is saved once under its sha256.
+
+    Blobs live at ``root/<first 2 hex chars>/<full digest>``. Writes go to a
+    temporary file in the same directory tree and are renamed into place, so
+    a blob path either doesn't exist or holds the complete content.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    async def write_stream(self, read_chunk, max_bytes=None, chunk_size=1024 * 1024):
+        """
+        Hash and store the bytes produced by ``await read_chunk(chunk_size)``.
+
+        Returns:
+            tuple: (digest, size, created) where ``created`` is False when an
+            identical blob was already stored
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, "tmp"))
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                while True:
+                    chunk = await read_chunk(chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise UploadTooLarge(max_bytes)
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            hexdigest = digest.hexdigest()
+            created = self._commit(tmp_path, hexdigest)
+            return hexdigest, size, created
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def write_bytes(self, content):
+        """Store an in-memory blob (e.g. a converted upload) and return its digest."""
+        digest = hashlib.sha256(content).hexdigest()
+        if self.exists(digest):
+            return digest
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, "tmp"))
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(content)
+            self._commit(tmp_path, digest)
+            return digest
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _commit(self, tmp_path, digest):
+        path = self.path(digest)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return True
+
+    def delete(self, digest):
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for entry in os.listdir(self.root):
+            if entry != "tmp":
+                shutil.rmtree(os.path.join(self.root, entry), ignore_errors=True)
@@ -0,0 +1,117 @@
+# cache.py
+
+import threading
+from collections import OrderedDict
+
+
+def nbytes_of(value):
+    """Approximate in-memory size of a cached value (numpy arrays, bytes, tuples/dicts of them)."""
+    if value is None:
+        return 0
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray, memoryview, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(nbytes_of(v) for v in value.values())
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes_of(v) for v in value)
+    return 64
+
+
+class ByteLRUCache:
+    """
+    Thread-safe LRU cache bounded by total size in bytes and entry count.
+
+    Entries are evicted least-recently-used first once either the total size
+    exceeds ``max_bytes`` or the entry count exceeds ``max_entries``. A value
+    larger than ``max_bytes`` on its own is never stored.
+    """
+
+    def __init__(self, max_bytes, max_entries=None, sizeof=nbytes_of):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.sizeof = sizeof
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key):
+        """Like get(), but a missing key isn't counted as a miss (for opportunistic lookups)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            # Computed outside the lock so one slow entry doesn't block the others
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self._entries and (
+            self._bytes > self.max_bytes
+            or (self.max_entries is not None and len(self._entries) > self.max_entries)
+        ):
+            _, (_, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def invalidate(self, predicate):
+        """Drop every entry whose key satisfies ``predicate``."""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
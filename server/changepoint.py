@@ -0,0 +1,171 @@
+# changepoint.py
+
+import numpy as np
+
+# Linear-time alternatives to the Isolation Forest for locating an oscillation in scaled CWT power
+CHANGEPOINT_METHODS = ('cusum', 'threshold', 'hysteresis')
+
+# MAD -> standard deviation for normally distributed noise
+MAD_SCALE = 1.4826
+
+
+def noise_floor(power):
+    """
+    Robust level and spread of the quiet part of a power envelope.
+
+    Estimated from the lower half of the samples only, so an oscillation
+    covering a large part of the recording doesn't raise the floor.
+    """
+    quiet = power[power <= np.median(power)]
+    level = np.median(quiet)
+    spread = MAD_SCALE * np.median(np.abs(quiet - level))
+    return level, spread
+
+
+def adaptive_threshold(power, fraction, sigmas, min_power_threshold):
+    """
+    ``fraction`` of the way from the noise floor to the peak, and at least ``sigmas``
+    noise spreads above the floor and ``min_power_threshold``.
+    """
+    level, spread = noise_floor(power)
+    return max(level + fraction * (power.max() - level), level + sigmas * spread, min_power_threshold)
+
+
+def _runs(mask):
+    """Start and (exclusive) end index of every run of True in ``mask``."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def _bridge(starts, ends, max_gap):
+    """Merge runs separated by at most ``max_gap`` samples, e.g. the dips between power ripples."""
+    if len(starts) < 2:
+        return starts, ends
+    keep = (starts[1:] - ends[:-1]) > max_gap
+    return starts[np.concatenate(([True], keep))], ends[np.concatenate((keep, [True]))]
+
+
+def _labels(starts, ends, num_samples):
+    # -1 inside the detected runs and 1 elsewhere, like IsolationForest.predict
+    change = np.zeros(num_samples + 1, dtype=np.int8)
+    np.add.at(change, starts, 1)
+    np.add.at(change, ends, -1)
+    return np.where(np.cumsum(change[:-1]) > 0, -1, 1)
+
+
+def _cusum_runs(increments, alarm):
+    """
+    Runs of the one-sided CUSUM S[t] = max(0, S[t-1] + increments[t]) that exceed ``alarm``.
+
+    The recursion has the closed form S = C - min(0, running minimum of C)
+    with C the cumulative sum, so it needs no Python loop. Each run starts at
+    the sample after S was last zero, which is the change point estimate.
+    """
+    cumulative = np.cumsum(increments)
+    statistic = cumulative - np.minimum(np.minimum.accumulate(cumulative), 0)
+    starts, ends = _runs(statistic > 0)
+    if len(starts) == 0:
+        return starts, ends
+    alarmed = np.maximum.reduceat(statistic, starts) > alarm
+    return starts[alarmed], ends[alarmed]
+
+
+def cusum_detector(power, reference_fraction=0.15, alarm=2.0, min_power_threshold=0.02, **_):
+    """
+    CUSUM of the power above an adaptive reference level, run forwards and backwards in time.
+
+    The forward pass finds the onset. Once an oscillation has built up the
+    statistic it takes far longer to drain than the oscillation lasted, so the
+    end comes from the same test run backwards, and the event is where both
+    passes agree. Ripple dips only dent the statistic, so they need no bridging.
+    """
+    reference = adaptive_threshold(power, reference_fraction, 6.0, min_power_threshold)
+    increments = power - reference
+
+    forward = _cusum_runs(increments, alarm)
+    backward_starts, backward_ends = _cusum_runs(increments[::-1], alarm)
+    backward = (len(power) - backward_ends, len(power) - backward_starts)
+
+    mask = (_labels(*forward, len(power)) == -1) & (_labels(*backward, len(power)) == -1)
+    return _runs(mask)
+
+
+def threshold_detector(power, threshold_fraction=0.15, max_gap=60, min_power_threshold=0.02, **_):
+    """Samples above an adaptive threshold, with ripple dips of up to ``max_gap`` samples bridged."""
+    threshold = adaptive_threshold(power, threshold_fraction, 6.0, min_power_threshold)
+    return _bridge(*_runs(power > threshold), max_gap)
+
+
+def hysteresis_detector(power, on_fraction=0.4, off_fraction=0.15, max_gap=60, min_power_threshold=0.02, **_):
+    """
+    Runs above the low (off) threshold that reach the high (on) threshold.
+
+    The high threshold keeps noise from triggering; the low one places the
+    onset and end closer to where the power leaves, and returns to, the noise
+    floor than the trigger level would.
+    """
+    on = adaptive_threshold(power, on_fraction, 12.0, min_power_threshold)
+    off = min(adaptive_threshold(power, off_fraction, 3.0, min_power_threshold / 2), on)
+    starts, ends = _bridge(*_runs(power > off), max_gap)
+    if len(starts) == 0:
+        return starts, ends
+    triggered = np.maximum.reduceat(power, starts) > on
+    return starts[triggered], ends[triggered]
+
+
+def _strongest_runs(power, starts, ends, min_energy_ratio):
+    """Drop runs holding less than ``min_energy_ratio`` of the power of the strongest one (edge effects, bursts)."""
+    if len(starts) < 2:
+        return starts, ends
+    # reduceat over [start, end) pairs: every other entry is the sum of a run
+    bounds = np.stack((starts, ends), axis=1).ravel()
+    energy = np.add.reduceat(np.append(power, 0.0), bounds)[::2]
+    keep = energy >= min_energy_ratio * energy.max()
+    return starts[keep], ends[keep]
+
+
+DETECTORS = {
+    'cusum': cusum_detector,
+    'threshold': threshold_detector,
+    'hysteresis': hysteresis_detector,
+}
+
+
+def detect_changepoints(power, method='hysteresis', min_anomaly_duration=2, min_power_threshold=0.02,
+                        min_energy_ratio=0.2, **options):
+    """
+    Label an oscillation in a scaled CWT power envelope in O(N).
+
+    Args:
+        power: Scaled (0-1) scale-averaged CWT power
+        method: One of CHANGEPOINT_METHODS
+        min_anomaly_duration: Runs shorter than this many samples are discarded
+        min_power_threshold: Floor for the adaptive thresholds
+        min_energy_ratio: Runs with less summed power than this fraction of the strongest run are discarded
+        options: Detector-specific tuning, e.g. threshold_fraction or max_gap
+
+    Returns:
+        np.ndarray: -1 for samples inside a detected oscillation, 1 elsewhere
+    """
+    if method not in DETECTORS:
+        raise ValueError(f"Unknown change-point method '{method}', expected one of {list(DETECTORS)}")
+    power = np.asarray(power, dtype=np.float64)
+    starts, ends = DETECTORS[method](power, min_power_threshold=min_power_threshold, **options)
+    long_enough = (ends - starts) >= min_anomaly_duration
+    starts, ends = _strongest_runs(power, starts[long_enough], ends[long_enough], min_energy_ratio)
+    return _labels(starts, ends, len(power))
+
+
+def changepoint_window(anomalies, time):
+    """
+    Start and end of the labelled region, from its first to its last sample.
+
+    Returns:
+        tuple: (start_time, end_time, duration), or None if nothing was labelled
+    """
+    indices = np.flatnonzero(anomalies == -1)
+    if len(indices) == 0:
+        return None
+    start_time = time[indices[0]]
+    end_time = time[indices[-1]]
+    return start_time, end_time, end_time - start_time
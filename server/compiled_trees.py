@@ -0,0 +1,329 @@
+# compiled_trees.py
+"""
+The boosted trees of the XGBoost models as flat numpy arrays, and a
+vectorized predictor over them.
+
+Every node of every tree is one entry in a handful of arrays (the feature it
+tests, its threshold, its children, which way missing values go and, for
+leaves, the leaf value). Features are renumbered to positions in a feature
+plan's compact row, so prediction reads only the few hundred values the
+trees split on instead of building a sparse 120040-wide row and an XGBoost
+DMatrix. The comparisons are done in float32 and the leaf values are added
+up tree by tree in float32, as XGBoost does, so margins and predicted labels
+are identical to the original model (probabilities to the last bit).
+
+    cd server && python compiled_trees.py    # export <model>.trees.npz next to the models
+
+An exported file is used instead of compiling on load as long as it was
+made from the model file currently in use.
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+
+import config
+from features import PREDICTION_MODELS, used_feature_positions
+
+# 'compiled' scores with the flat arrays below, 'xgboost' with the loaded model itself
+TREE_ENGINES = ('compiled', 'xgboost')
+
+
+def _base_margin(learner, objective):
+    params = learner['learner_model_param']
+    # num_class is 0 for binary models
+    num_groups = max(1, int(params.get('num_class', 0)))
+    # Older XGBoost stores one base_score for all classes, newer ones one per class
+    base_score = np.asarray(json.loads(params['base_score']), dtype=np.float32).reshape(-1)
+    base_score = np.broadcast_to(base_score, (num_groups,)).copy()
+    if objective in ('binary:logistic', 'reg:logistic'):
+        # Stored as a probability; the trees add to its logit
+        return -np.log(np.float32(1) / base_score - np.float32(1))
+    if objective in ('multi:softprob', 'multi:softmax'):
+        return base_score
+    raise ValueError(f"Objective '{objective}' is not supported by the compiled predictor")
+
+
+class CompiledTrees:
+    """
+    Tree ensemble flattened into node arrays.
+
+    Leaves point to themselves, so every row can take the same number of
+    steps (the deepest tree's depth) through every tree at once. Each step is
+    a few gathers over a (rows, trees) array of node indices.
+    """
+
+    BLOCK_NODES = 1 << 16
+
+    ARRAYS = ('feature', 'threshold', 'left', 'right', 'default_left', 'value', 'roots', 'groups',
+              'base_margin', 'positions')
+
+    def __init__(self, feature, threshold, left, right, default_left, value, roots, groups, base_margin,
+                 positions, objective, depth, source_digest=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.groups = groups
+        self.base_margin = base_margin
+        self.positions = positions
+        self.objective = objective
+        self.depth = int(depth)
+        self.source_digest = source_digest
+        self.num_groups = len(base_margin)
+        # Left and right child of node i at 2i and 2i + 1, so a step is one gather
+        self._children = np.stack((left, right), axis=1).ravel().astype(np.intp)
+        self._feature = feature.astype(np.intp)
+        self._roots = roots.astype(np.intp)
+        # Trees of each output group in boosting order, one row per group
+        self._group_trees = np.stack([np.flatnonzero(groups == g) for g in range(self.num_groups)])
+
+    @classmethod
+    def from_model(cls, model, positions=None, source_digest=None):
+        """
+        Compile an XGBClassifier (or Booster).
+
+        ``positions`` are the flattened feature indices of the compact rows
+        the predictor will be given, sorted; by default the features the
+        trees split on, which is what a FeaturePlan for the model gathers.
+        """
+        booster = model.get_booster() if hasattr(model, "get_booster") else model
+        raw = json.loads(booster.save_raw("json"))
+        learner = raw['learner']
+        objective = learner['objective']['name']
+        booster_model = learner['gradient_booster']
+        if booster_model['name'] != 'gbtree':
+            raise ValueError(f"Booster '{booster_model['name']}' is not supported by the compiled predictor")
+        trees = booster_model['model']['trees']
+        groups = np.asarray(booster_model['model']['tree_info'], dtype=np.intp)
+
+        best_iteration = booster.attr('best_iteration')
+        if best_iteration is not None:
+            # XGBClassifier.predict stops at the best iteration of early stopping
+            per_round = len(trees) // booster.num_boosted_rounds()
+            trees = trees[:(int(best_iteration) + 1) * per_round]
+            groups = groups[:len(trees)]
+
+        if positions is None:
+            positions = used_feature_positions(model)
+        positions = np.asarray(positions, dtype=np.intp)
+
+        features, thresholds, lefts, rights, defaults, values, roots = [], [], [], [], [], [], []
+        offset = 0
+        depth = 0
+        for tree in trees:
+            if any(tree['split_type']):
+                raise ValueError("Categorical splits are not supported by the compiled predictor")
+            left = np.asarray(tree['left_children'], dtype=np.intp)
+            right = np.asarray(tree['right_children'], dtype=np.intp)
+            split_index = np.asarray(tree['split_indices'], dtype=np.intp)
+            condition = np.asarray(tree['split_conditions'], dtype=np.float32)
+            is_leaf = left == -1
+            nodes = np.arange(len(left))
+
+            compact = np.searchsorted(positions, split_index[~is_leaf])
+            if np.any(compact >= len(positions)) or np.any(positions[np.minimum(compact, len(positions) - 1)]
+                                                           != split_index[~is_leaf]):
+                raise ValueError("The trees split on features outside the given positions")
+            feature = np.zeros(len(left), dtype=np.intp)
+            feature[~is_leaf] = compact
+
+            features.append(feature)
+            thresholds.append(np.where(is_leaf, np.float32(0), condition))
+            # A leaf stores its value in split_conditions
+            values.append(np.where(is_leaf, condition, np.float32(0)))
+            lefts.append(np.where(is_leaf, nodes, left) + offset)
+            rights.append(np.where(is_leaf, nodes, right) + offset)
+            defaults.append(np.asarray(tree['default_left'], dtype=bool))
+            roots.append(offset)
+            depth = max(depth, _tree_depth(left, right))
+            offset += len(left)
+
+        return cls(
+            feature=np.concatenate(features).astype(np.int32),
+            threshold=np.concatenate(thresholds).astype(np.float32),
+            left=np.concatenate(lefts).astype(np.int32),
+            right=np.concatenate(rights).astype(np.int32),
+            default_left=np.concatenate(defaults),
+            value=np.concatenate(values).astype(np.float32),
+            roots=np.asarray(roots, dtype=np.int32),
+            groups=groups,
+            base_margin=_base_margin(learner, objective),
+            positions=positions,
+            objective=objective,
+            depth=depth,
+            source_digest=source_digest,
+        )
+
+    def save(self, path):
+        np.savez(path, objective=self.objective, depth=self.depth, source_digest=self.source_digest or "",
+                 **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in cls.ARRAYS}
+            return cls(objective=str(data['objective']), depth=int(data['depth']),
+                       source_digest=str(data['source_digest']) or None, **arrays)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def leaves(self, values):
+        """Leaf node each row reaches in each tree, shape (rows, trees)."""
+        values = np.ascontiguousarray(np.atleast_2d(values), dtype=np.float32)
+        num_rows, width = values.shape
+        flat = values.ravel()
+        row_offsets = (np.arange(num_rows) * width)[:, None]
+        has_missing = np.isnan(flat).any()
+        node = np.broadcast_to(self._roots, (num_rows, len(self._roots))).copy()
+        for _ in range(self.depth):
+            x = flat[row_offsets + self._feature[node]]
+            go_right = ~(x < self.threshold[node])
+            if has_missing:
+                # NaN compares False, so it would go right; send it left where the node says so
+                go_right &= ~(np.isnan(x) & self.default_left[node])
+            node = self._children[2 * node + go_right]
+        return node
+
+    def predict_margin(self, values):
+        """Raw scores, shape (rows, output groups), from compact rows of the plan positions."""
+        values = np.atleast_2d(values)
+        # Rows are scored in blocks of about BLOCK_NODES (row, tree) pairs, which bounds the
+        # temporaries and keeps them in cache
+        block = max(1, self.BLOCK_NODES // len(self.roots))
+        if len(values) > block:
+            return np.concatenate([self.predict_margin(values[i:i + block]) for i in range(0, len(values), block)])
+        leaf_values = self.value[self.leaves(values)]
+        # Base margin first, then one tree at a time: float32 addition in XGBoost's order
+        per_group = leaf_values[:, self._group_trees]
+        base = np.broadcast_to(self.base_margin[None, :, None], (len(leaf_values), self.num_groups, 1))
+        return np.add.accumulate(np.concatenate((base, per_group), axis=2), axis=2)[:, :, -1]
+
+    def predict_proba(self, values):
+        """
+        Class probabilities, as XGBClassifier.predict_proba.
+
+        The exponentials are taken in float64 and rounded, which tracks the C
+        library's expf better than numpy's float32 exp; a probability can
+        still differ from XGBoost's in the last bit.
+        """
+        margin = self.predict_margin(values)
+        if self.num_groups == 1:
+            positive = np.float32(1) / (_exp32(-margin[:, 0]) + np.float32(1))
+            return np.stack((np.float32(1) - positive, positive), axis=1)
+        exp = _exp32(margin - margin.max(axis=1, keepdims=True))
+        # XGBoost sums the exponentials in double precision before dividing in float32
+        return exp / exp.sum(axis=1, keepdims=True, dtype=np.float64).astype(np.float32)
+
+    def predict(self, values):
+        """Encoded class labels, as XGBClassifier.predict."""
+        margin = self.predict_margin(values)
+        if self.num_groups == 1:
+            # probability > 0.5 is the same test as margin > 0
+            return (margin[:, 0] > 0).astype(np.int64)
+        return np.argmax(margin, axis=1)
+
+
+def _exp32(x):
+    return np.exp(x.astype(np.float64)).astype(np.float32)
+
+
+def _tree_depth(left, right):
+    depth = np.zeros(len(left), dtype=np.intp)
+    # Children always come after their parent in XGBoost's node numbering
+    for node in range(len(left)):
+        if left[node] != -1:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+
+def compiled_path(base_dir, model_name):
+    return os.path.join(base_dir, f"{model_name}.trees.npz")
+
+
+class TreePredictors:
+    """
+    Scores feature-plan rows with the compiled trees or with the XGBoost model.
+
+    Compiled trees are cached per model version, loaded from an exported
+    file when one matches the model file in use and compiled otherwise. A
+    model that can't be compiled is scored by XGBoost instead.
+    """
+
+    def __init__(self, registry, engine=config.TREE_ENGINE):
+        if engine not in TREE_ENGINES:
+            raise ValueError(f"Unknown tree engine '{engine}', expected one of {list(TREE_ENGINES)}")
+        self.registry = registry
+        self.engine = engine
+        self._compiled = {}
+        self._lock = threading.Lock()
+
+    def compiled(self, model_name, plan):
+        """Compiled trees for the model version in use, or None when the engine is 'xgboost' or compiling failed."""
+        if self.engine != 'compiled':
+            return None
+        key = (model_name, self.registry.version(model_name))
+        if key in self._compiled:
+            return self._compiled[key]
+        with self._lock:
+            if key not in self._compiled:
+                digest = self.registry.digest(model_name)
+                trees = None
+                path = compiled_path(self.registry.base_dir, model_name)
+                if os.path.exists(path):
+                    trees = CompiledTrees.load(path)
+                    if trees.source_digest != digest or not np.array_equal(trees.positions, plan.positions):
+                        trees = None
+                if trees is None:
+                    try:
+                        trees = CompiledTrees.from_model(self.registry.get(model_name), plan.positions, digest)
+                    except ValueError as e:
+                        print(f"Scoring {model_name} with XGBoost: {e}")
+                # Drop compiled trees for versions that were swapped out
+                self._compiled = {k: v for k, v in self._compiled.items() if k[0] != model_name}
+                self._compiled[key] = trees
+        return self._compiled[key]
+
+    def predict(self, model_name, plan, values):
+        """Encoded labels for rows of ``plan.values``."""
+        trees = self.compiled(model_name, plan)
+        if trees is not None:
+            return trees.predict(values)
+        return np.asarray(self.registry.get(model_name).predict(plan.sparse(values))).reshape(-1)
+
+    def predict_proba(self, model_name, plan, values):
+        """Class probabilities for rows of ``plan.values``."""
+        trees = self.compiled(model_name, plan)
+        if trees is not None:
+            return trees.predict_proba(values)
+        return self.registry.get(model_name).predict_proba(plan.sparse(values))
+
+
+def export_compiled(base_dir):
+    """Compile every XGBoost model in ``base_dir`` to <name>.trees.npz."""
+    from features import FeaturePlans
+    from model_registry import ModelRegistry
+
+    registry = ModelRegistry(base_dir, prefer=config.MODEL_FORMAT)
+    plans = FeaturePlans(registry)
+    written = []
+    for _, model_name, _, importances_name in PREDICTION_MODELS:
+        plan = plans.get(model_name, importances_name)
+        trees = CompiledTrees.from_model(registry.get(model_name), plan.positions, registry.digest(model_name))
+        path = compiled_path(base_dir, model_name)
+        trees.save(path)
+        written.append((path, trees))
+    return written
+
+
+if __name__ == "__main__":
+    for path, trees in export_compiled(config.MODEL_DIR):
+        print(f"Wrote {path}: {len(trees.roots)} trees, {len(trees.feature)} nodes, {len(trees.positions)} features, "
+              f"{trees.nbytes / 1024:.0f} KiB")
@@ -0,0 +1,124 @@
+# config.py
+
+import os
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    return value.strip().lower() in ("1", "true", "yes", "on") if value not in (None, "") else default
+
+
+def _env_limits(name):
+    # "detect_duration=2:8,predict_class=4" -> {endpoint: (concurrency, queue size)}
+    limits = {}
+    for item in filter(None, os.environ.get(name, "").split(",")):
+        endpoint, _, spec = item.partition("=")
+        concurrency, _, queue_size = spec.partition(":")
+        limits[endpoint.strip()] = (int(concurrency), int(queue_size or ENDPOINT_QUEUE_SIZE))
+    return limits
+
+
+# Uploads are stored once per sha256 under this directory and streamed in chunks with a size cap
+BLOB_STORE_DIR = os.environ.get("FO_BLOB_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "blobs"))
+UPLOAD_MAX_BYTES = _env_int("FO_UPLOAD_MAX_BYTES", 200 * 1024 * 1024)
+UPLOAD_CHUNK_BYTES = _env_int("FO_UPLOAD_CHUNK_BYTES", 1024 * 1024)
+
+# Persisted endpoint results: rows unread for RESULTS_MAX_AGE_SECONDS are dropped, then the
+# least recently read beyond RESULTS_MAX_ROWS
+RESULTS_MAX_ROWS = _env_int("FO_RESULTS_MAX_ROWS", 10000)
+RESULTS_MAX_AGE_SECONDS = _env_int("FO_RESULTS_MAX_AGE_SECONDS", 30 * 24 * 3600)
+# A read refreshes a row's last-read time only once it is this old, so cache hits rarely write
+RESULTS_TOUCH_SECONDS = _env_int("FO_RESULTS_TOUCH_SECONDS", 3600)
+
+# Upper bound on the decoded uploads kept in memory by the dataset cache
+DATASET_CACHE_MAX_BYTES = _env_int("FO_DATASET_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+DATASET_CACHE_MAX_ENTRIES = _env_int("FO_DATASET_CACHE_MAX_ENTRIES", 32)
+
+# Duration pipeline outputs (power, filtered signals, labels) and rendered PNGs kept in memory
+DURATION_CACHE_MAX_BYTES = _env_int("FO_DURATION_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+PLOT_CACHE_MAX_BYTES = _env_int("FO_PLOT_CACHE_MAX_BYTES", 128 * 1024 * 1024)
+
+# CWT engine for duration detection: 'fft' (batched FFT, chunked for long signals), 'chunked'
+# (always fixed-size time blocks) or 'pywt' (pywt.cwt)
+CWT_BACKEND = os.environ.get("FO_CWT_BACKEND", "fft")
+CWT_DTYPE = os.environ.get("FO_CWT_DTYPE", "float64")
+
+# Default engine locating the oscillation in the CWT power: 'isolation_forest' (contamination sweep)
+# or an O(N) change-point detector, 'cusum', 'threshold' or 'hysteresis'; ?engine= overrides it per request
+DURATION_ENGINE = os.environ.get("FO_DURATION_ENGINE", "isolation_forest")
+
+# Spectral pre-screen ahead of duration detection: oscillation band (Hz), short-time spectrum window,
+# and the spectral peak-to-median ratio a channel needs for the CWT and anomaly stages to run on it.
+# Opt-in: the default 0 screens nothing out, because on P1 a weak event at another generator can
+# score below an event-free recording (see benchmarks/bench_screen.py before raising it)
+SCREEN_BAND_HZ = tuple(float(f) for f in os.environ.get("FO_SCREEN_BAND_HZ", "0.1,5.0").split(","))
+SCREEN_SEGMENT_SECONDS = _env_float("FO_SCREEN_SEGMENT_SECONDS", 20.0)
+SCREEN_MIN_PEAK_RATIO = _env_float("FO_SCREEN_MIN_PEAK_RATIO", 0.0)
+
+# Worker processes for per-channel anomaly detection in /api/detect_duration/channels
+CHANNEL_WORKERS = _env_int("FO_CHANNEL_WORKERS", os.cpu_count() or 1)
+
+# Live PMU streams: open stream limit and largest accepted chunk of samples
+STREAM_MAX_STREAMS = _env_int("FO_STREAM_MAX_STREAMS", 64)
+STREAM_MAX_CHUNK = _env_int("FO_STREAM_MAX_CHUNK", 10000)
+# Largest per-stream buffers a client may ask for (samples): every stream allocates them up front
+STREAM_MAX_WINDOW = _env_int("FO_STREAM_MAX_WINDOW", 100000)
+STREAM_MAX_HOP = _env_int("FO_STREAM_MAX_HOP", 3000)
+
+# Executor for blocking request stages: 'thread' or 'process' pool for CPU-bound work
+EXECUTOR_KIND = os.environ.get("FO_EXECUTOR_KIND", "thread")
+EXECUTOR_WORKERS = _env_int("FO_EXECUTOR_WORKERS", os.cpu_count() or 1)
+
+# Requests of one endpoint allowed to run at once, and to wait, before answering 429
+ENDPOINT_CONCURRENCY = _env_int("FO_ENDPOINT_CONCURRENCY", 4)
+ENDPOINT_QUEUE_SIZE = _env_int("FO_ENDPOINT_QUEUE_SIZE", 16)
+ENDPOINT_LIMITS = _env_limits("FO_ENDPOINT_LIMITS")
+
+# Model artifacts: directory, XGBoost format preference ('native' or 'pickle'),
+# and when to load them ('background', 'eager' at startup, or 'lazy' on first use)
+MODEL_DIR = os.environ.get("FO_MODEL_DIR", os.path.dirname(os.path.abspath(__file__)))
+MODEL_FORMAT = os.environ.get("FO_MODEL_FORMAT", "native")
+MODEL_WARMUP = os.environ.get("FO_MODEL_WARMUP", "background")
+# How the XGBoost models are scored: 'compiled' (flat tree arrays, see compiled_trees.py) or 'xgboost'
+TREE_ENGINE = os.environ.get("FO_TREE_ENGINE", "compiled")
+
+# Speculative pre-analysis: whether an upload queues a background job computing predict_class,
+# locate_source and detect_duration right away (?preanalyze= overrides it per upload), how many
+# jobs run at once, and whether the job renders the duration plots as the default GET does
+PREANALYZE_UPLOADS = _env_bool("FO_PREANALYZE_UPLOADS", False)
+PREANALYSIS_CONCURRENCY = _env_int("FO_PREANALYSIS_CONCURRENCY", 1)
+PREANALYSIS_PLOTS = _env_bool("FO_PREANALYSIS_PLOTS", True)
+
+# Batch prediction: files per request, and rows scored per predict call
+BATCH_MAX_FILES = _env_int("FO_BATCH_MAX_FILES", 1000)
+BATCH_PREDICT_ROWS = _env_int("FO_BATCH_PREDICT_ROWS", 128)
+
+# Source timeline: default samples between window starts, and the most windows scored per recording
+TIMELINE_STRIDE = _env_int("FO_TIMELINE_STRIDE", 300)
+TIMELINE_MAX_WINDOWS = _env_int("FO_TIMELINE_MAX_WINDOWS", 20000)
+
+# SQLite database, connection pool per process, how long a writer waits for the lock, and the
+# journal mode ('wal' lets readers and a writer, in any worker process, proceed together)
+DATABASE_URL = os.environ.get("FO_DATABASE_URL", "sqlite:///./sql_app.db")
+DB_POOL_SIZE = _env_int("FO_DB_POOL_SIZE", 8)
+DB_MAX_OVERFLOW = _env_int("FO_DB_MAX_OVERFLOW", 8)
+DB_BUSY_TIMEOUT_SECONDS = _env_int("FO_DB_BUSY_TIMEOUT_SECONDS", 30)
+DB_JOURNAL_MODE = os.environ.get("FO_DB_JOURNAL_MODE", "wal")
+
+# Pre-fork serving (serve.py): worker processes, bind address and port
+SERVE_WORKERS = _env_int("FO_WORKERS", 1)
+SERVE_HOST = os.environ.get("FO_HOST", "127.0.0.1")
+SERVE_PORT = _env_int("FO_PORT", 8000)
+
+# Per-request stage breakdowns as JSON lines: a file path, "-" for stdout, empty to disable
+TRACE_LOG = os.environ.get("FO_TRACE_LOG", "")
@@ -1,10 +1,18 @@
 # crud.py
 
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from models import FileUpload
+from models import FileUpload, AnalysisResult
 
-def create_file_upload(db: Session, filename: str, content: bytes):
-    file_upload = FileUpload(filename=filename, content=content)
+def create_file_upload(db: Session, filename: str, content_hash: str, size: int, format: str = None,
+                       source_hash: str = None):
+    file_upload = FileUpload(filename=filename, content_hash=content_hash, size=size, format=format,
+                             source_hash=source_hash or content_hash)
     db.add(file_upload)
     db.commit()
     db.refresh(file_upload)
@@ -13,9 +21,80 @@ def create_file_upload(db: Session, filename: str, content: bytes):
 def get_file_upload(db: Session, file_id: int):
     return db.query(FileUpload).filter(FileUpload.id == file_id).first()
 
+def get_file_upload_by_hash(db: Session, digest: str):
+    # Matches the bytes as uploaded, or an upload whose stored (possibly converted) blob is identical
+    return db.query(FileUpload).filter(
+        or_(FileUpload.source_hash == digest, FileUpload.content_hash == digest)
+    ).order_by(FileUpload.id).first()
+
+def get_file_uploads(db: Session, file_ids):
+    return db.query(FileUpload).filter(FileUpload.id.in_(file_ids)).order_by(FileUpload.id).all()
+
 def get_most_recent_file_upload(db: Session):
     return db.query(FileUpload).order_by(FileUpload.id.desc()).first()
 
 def delete_all_files(db: Session):
     db.query(FileUpload).delete()
-    db.commit()
\ No newline at end of file
+    db.commit()
+
+def _utcnow():
+    # Naive UTC, matching what SQLite's CURRENT_TIMESTAMP stores
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def get_analysis_result(db: Session, content_hash: str, endpoint: str, params_key: str, model_version: str,
+                        touch_after_seconds: int = 0):
+    result = db.query(AnalysisResult).filter(
+        AnalysisResult.content_hash == content_hash,
+        AnalysisResult.endpoint == endpoint,
+        AnalysisResult.params_key == params_key,
+        AnalysisResult.model_version == model_version,
+    ).first()
+    now = _utcnow()
+    # Pruning only needs the read time to within touch_after_seconds, so most reads write nothing
+    if result is not None and (result.last_accessed_at is None
+                               or result.last_accessed_at < now - timedelta(seconds=touch_after_seconds)):
+        result.last_accessed_at = now
+        db.commit()
+    return result
+
+def save_analysis_result(db: Session, content_hash: str, endpoint: str, params_key: str, model_version: str, response):
+    body = json.dumps(response, sort_keys=True)
+    result = AnalysisResult(
+        content_hash=content_hash,
+        endpoint=endpoint,
+        params_key=params_key,
+        model_version=model_version,
+        result=body,
+        etag=hashlib.sha256(body.encode()).hexdigest()[:32],
+        last_accessed_at=_utcnow(),
+    )
+    db.add(result)
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent request stored the same result first
+        db.rollback()
+        return get_analysis_result(db, content_hash, endpoint, params_key, model_version)
+    return result
+
+def delete_analysis_results(db: Session, endpoints=None):
+    query = db.query(AnalysisResult)
+    if endpoints is not None:
+        query = query.filter(AnalysisResult.endpoint.in_(endpoints))
+    deleted = query.delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+def prune_analysis_results(db: Session, max_rows: int, max_age_seconds: int):
+    """Drop results not read for max_age_seconds, then the least recently read beyond max_rows."""
+    deleted = db.query(AnalysisResult).filter(
+        AnalysisResult.last_accessed_at < _utcnow() - timedelta(seconds=max_age_seconds)
+    ).delete(synchronize_session=False)
+    keep = db.query(AnalysisResult.id).order_by(AnalysisResult.last_accessed_at.desc()).limit(max_rows)
+    deleted += db.query(AnalysisResult).filter(AnalysisResult.id.not_in(keep.scalar_subquery())).delete(
+        synchronize_session=False)
+    db.commit()
+    return deleted
+
+def count_analysis_results(db: Session):
+    return db.query(AnalysisResult).count()
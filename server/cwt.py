@@ -0,0 +1,223 @@
+# cwt.py
+
+import inspect
+from functools import lru_cache
+from math import floor
+
+import numpy as np
+import pywt
+from scipy import fft as sp_fft
+
+from cache import ByteLRUCache
+
+# Upper bound on the (scales x channels x nfft) block held at once by the FFT backend
+FFT_BLOCK_BYTES = 32 * 1024 * 1024
+
+# Upper bound on the cached kernel spectra, (scales x nfft) complex arrays per FFT size
+KERNEL_CACHE_BYTES = 128 * 1024 * 1024
+
+# Samples per time block of the chunked backend; the 'fft' backend switches to chunked
+# processing for signals longer than CHUNKED_MIN_SAMPLES
+CHUNK_SAMPLES = 16384
+CHUNKED_MIN_SAMPLES = 4 * CHUNK_SAMPLES
+
+kernel_cache = ByteLRUCache(max_bytes=KERNEL_CACHE_BYTES)
+
+# Integrated-wavelet resolution pywt.cwt uses by default (10 before pywt 1.8, 12 since)
+_cwt_precision = inspect.signature(pywt.cwt).parameters.get('precision')
+PYWT_PRECISION = _cwt_precision.default if _cwt_precision is not None else 10
+
+
+def _wavelet_name(wavelet):
+    return wavelet.name if isinstance(wavelet, pywt.ContinuousWavelet) else str(wavelet)
+
+
+def _scaled_kernels(scales, wavelet, precision):
+    """
+    Build the per-scale kernels reproducing ``pywt.cwt(method='conv')``.
+
+    pywt convolves with the integrated wavelet, differentiates, multiplies by
+    -sqrt(scale) and crops the centre. Folding the difference and the gain into
+    each kernel, and returning the crop offset alongside it, lets a single
+    convolution produce the cropped coefficients directly:
+    ``coef[n] = sum_k x[k] * kernel[n + offset - k]``.
+    """
+    wav = pywt.ContinuousWavelet(wavelet)
+    int_psi, x = pywt.integrate_wavelet(wav, precision=precision)
+    if wav.complex_cwt:
+        int_psi = np.conj(int_psi)
+    step = x[1] - x[0]
+
+    kernels = []
+    for scale in scales:
+        j = (np.arange(scale * (x[-1] - x[0]) + 1) / (scale * step)).astype(int)
+        j = j[j < int_psi.size]
+        int_psi_scale = int_psi[j][::-1]
+        if int_psi_scale.size < 2:
+            raise ValueError(f"Selected scale of {scale} too small.")
+        kernel = -np.sqrt(scale) * np.diff(np.concatenate(([0], int_psi_scale, [0])))
+        offset = floor((int_psi_scale.size - 2) / 2) + 1
+        kernels.append((kernel, offset))
+    return kernels
+
+
+def kernel_support(scales, wavelet='morl', precision=PYWT_PRECISION):
+    """
+    Samples before and after ``n`` that the coefficient at ``n`` depends on.
+
+    A coefficient more than this far from either end of a segment is the
+    same whether it is computed on the segment or on the whole signal.
+    """
+    kernels = _scaled_kernels([float(s) for s in scales], _wavelet_name(wavelet), precision)
+    before = max(kernel.size - 1 - offset for kernel, offset in kernels)
+    after = max(offset for _, offset in kernels)
+    return before, after
+
+
+@lru_cache(maxsize=8)
+def _cached_kernels(scales, wavelet, precision):
+    return tuple(_scaled_kernels(scales, wavelet, precision))
+
+
+def _fft_size(n, real=True):
+    """A fast FFT length of at least ``n``, from a fixed set of eight sizes per octave."""
+    step = 1 << max(0, (n - 1).bit_length() - 4)
+    return sp_fft.next_fast_len(-(-n // step) * step, real=real)
+
+
+def _kernel_spectra(length, scales, wavelet, dtype, precision=PYWT_PRECISION):
+    """
+    FFT of every scaled wavelet kernel, sized for signals of ``length``.
+
+    The FFT size is rounded up to one of a few fixed sizes, so recordings of
+    nearby lengths share an entry of the byte-bounded kernel cache.
+    """
+    kernels = _cached_kernels(scales, wavelet, precision)
+    nfft = _fft_size(length + max(kernel.size for kernel, _ in kernels), real=not np.iscomplexobj(kernels[0][0]))
+    return kernel_cache.get_or_compute((nfft, scales, wavelet, dtype, precision),
+                                        lambda: _compute_kernel_spectra(kernels, nfft, dtype))
+
+
+def _compute_kernel_spectra(kernels, nfft, dtype):
+    is_complex = np.iscomplexobj(kernels[0][0])
+    aligned = np.zeros((len(kernels), nfft), dtype=kernels[0][0].dtype)
+    for i, (kernel, offset) in enumerate(kernels):
+        aligned[i, (np.arange(kernel.size) - offset) % nfft] = kernel
+
+    complex_dtype = np.result_type(dtype, np.complex64)
+    if is_complex:
+        spectra = sp_fft.fft(aligned, axis=-1)
+    else:
+        spectra = sp_fft.rfft(aligned, axis=-1)
+    spectra = spectra.astype(complex_dtype)
+    spectra.flags.writeable = False
+    return spectra, nfft, is_complex
+
+
+def _fft_power(signal, scales, wavelet, dtype):
+    data = np.asarray(signal, dtype=dtype)
+    if data.shape[0] > CHUNKED_MIN_SAMPLES:
+        # One FFT over the whole recording would need (scales x nfft) kernel spectra
+        return cwt_average_power_chunked(data, scales, wavelet, dtype)
+    return _fft_block_power(data, scales, wavelet, dtype)
+
+
+def _fft_block_power(signal, scales, wavelet, dtype):
+    data = np.asarray(signal, dtype=dtype)
+    squeeze = data.ndim == 1
+    if squeeze:
+        data = data[:, np.newaxis]
+    length, channels = data.shape
+
+    spectra, nfft, is_complex = _kernel_spectra(
+        length, tuple(float(s) for s in scales), _wavelet_name(wavelet), np.dtype(dtype).name)
+
+    # Channels along the last axis in the time domain, along the first in frequency
+    if is_complex:
+        data_spectrum = sp_fft.fft(data.T, n=nfft, axis=-1)
+    else:
+        data_spectrum = sp_fft.rfft(data.T, n=nfft, axis=-1)
+
+    # Accumulate |coef|^2 a block of scales at a time so the full
+    # (scales x samples) coefficient matrix never exists at once
+    block = max(1, FFT_BLOCK_BYTES // (channels * nfft * spectra.itemsize))
+    power = np.zeros((channels, length), dtype=dtype)
+    for start in range(0, len(scales), block):
+        product = spectra[start:start + block, np.newaxis, :] * data_spectrum[np.newaxis, :, :]
+        if is_complex:
+            coefficients = sp_fft.ifft(product, axis=-1)[..., :length]
+            power += np.sum(coefficients.real ** 2 + coefficients.imag ** 2, axis=0)
+        else:
+            coefficients = sp_fft.irfft(product, n=nfft, axis=-1)[..., :length]
+            power += np.einsum('sct,sct->ct', coefficients, coefficients)
+    power /= len(scales)
+
+    power = power.T
+    return power[:, 0] if squeeze else power
+
+
+def cwt_average_power_chunked(signal, scales, wavelet='morl', dtype=np.float64, block_size=CHUNK_SAMPLES):
+    """
+    Scale-averaged CWT power computed over fixed-size time blocks.
+
+    Each block is extended by the kernel support on both sides (with zeros
+    past the ends of the signal, as in the full convolution), so every
+    coefficient kept from a block sees exactly the samples it would see in
+    the full-signal transform and the result matches the 'fft' backend.
+    Every block has the same padded length, so one set of kernel spectra
+    sized by ``block_size`` serves the whole recording and working memory
+    no longer grows with the recording length.
+    """
+    data = np.asarray(signal, dtype=dtype)
+    squeeze = data.ndim == 1
+    if squeeze:
+        data = data[:, np.newaxis]
+    length, channels = data.shape
+    before, after = kernel_support(scales, wavelet)
+
+    power = np.empty((length, channels), dtype=dtype)
+    segment = np.empty((before + block_size + after, channels), dtype=dtype)
+    for start in range(0, length, block_size):
+        stop = min(start + block_size, length)
+        lo, hi = start - before, stop + after
+        segment.fill(0)
+        segment[max(lo, 0) - lo:min(hi, length) - lo] = data[max(lo, 0):min(hi, length)]
+        block_power = _fft_block_power(segment, scales, wavelet, dtype)
+        power[start:stop] = block_power[before:before + stop - start]
+    return power[:, 0] if squeeze else power
+
+
+def _pywt_power(signal, scales, wavelet, dtype):
+    data = np.asarray(signal, dtype=dtype)
+    coefficients, _ = pywt.cwt(data, scales, wavelet, axis=0)
+    power = np.abs(coefficients) ** 2
+    return np.mean(power, axis=0)
+
+
+CWT_BACKENDS = {
+    'fft': _fft_power,
+    'chunked': lambda signal, scales, wavelet, dtype: cwt_average_power_chunked(signal, scales, wavelet, dtype),
+    'pywt': _pywt_power,
+}
+
+
+def cwt_average_power(signal, scales, wavelet='morl', backend='fft', dtype=np.float64):
+    """
+    Scale-averaged CWT power, i.e. ``mean(|pywt.cwt(signal)|**2, axis=0)``.
+
+    Args:
+        signal (array-like): 1-D signal, or a 2-D (samples x channels) array
+        scales (array-like): Wavelet scales
+        wavelet (str): Continuous wavelet name understood by pywt
+        backend (str): 'fft' for the batched FFT engine (chunked automatically for long signals),
+            'chunked' to always process fixed-size time blocks, 'pywt' for pywt.cwt
+        dtype: np.float64 or np.float32 working precision
+
+    Returns:
+        np.ndarray: Average power with the same shape as ``signal``
+    """
+    try:
+        power_fn = CWT_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown CWT backend '{backend}', expected one of {sorted(CWT_BACKENDS)}")
+    return power_fn(signal, np.asarray(scales), wavelet, dtype)
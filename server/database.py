@@ -1,14 +1,42 @@
 # database.py
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
+import config
 
+SQLALCHEMY_DATABASE_URL = config.DATABASE_URL
+
+# A bounded pool of connections reused across requests and executor threads; SQLite waits up to
+# the busy timeout for another connection's (or worker process's) write lock instead of failing
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": config.DB_BUSY_TIMEOUT_SECONDS},
+    poolclass=QueuePool,
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
\ No newline at end of file
+@event.listens_for(engine, "connect")
+def configure_sqlite(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the single writer, across threads and worker processes;
+    # with WAL, synchronous=NORMAL only risks the last commits on power loss, never corruption
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={config.DB_JOURNAL_MODE}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+Base = declarative_base()
+
+def add_missing_columns(table):
+    # create_all() never alters an existing table, so add columns introduced since the DB was created
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    with engine.begin() as conn:
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
@@ -0,0 +1,149 @@
+# dataset_cache.py
+
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from cache import ByteLRUCache
+from formats import read_columns, upload_format
+from metrics import stage
+
+
+class DecodedDataset:
+    """
+    Columnar, read-only view of a parsed upload.
+
+    Every column is kept as its own contiguous numpy array so endpoints can
+    pull out just the channels they need without going back through pandas.
+    """
+
+    def __init__(self, columns):
+        self.columns = OrderedDict()
+        for name, values in columns.items():
+            array = np.ascontiguousarray(values)
+            array.flags.writeable = False  # entries are shared between requests
+            self.columns[name] = array
+        self.column_names = list(self.columns)
+        self.num_samples = len(next(iter(self.columns.values()))) if self.columns else 0
+        self.nbytes = sum(array.nbytes for array in self.columns.values())
+        self.content_hash = None  # set by DatasetCache once the upload bytes are hashed
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def frame(self, columns=None):
+        """Build a DataFrame over the requested columns (all columns by default)."""
+        names = self.column_names if columns is None else list(columns)
+        return pd.DataFrame({name: self.columns[name] for name in names}, columns=names)
+
+    def subset(self, columns):
+        """A dataset over the requested columns present here, sharing their arrays."""
+        dataset = DecodedDataset({name: self.columns[name] for name in columns if name in self.columns})
+        dataset.content_hash = self.content_hash
+        return dataset
+
+    def stack(self, columns, dtype=np.float64):
+        """Return the requested columns as a (samples x columns) array."""
+        out = np.empty((self.num_samples, len(columns)), dtype=dtype)
+        for i, name in enumerate(columns):
+            out[:, i] = self.columns[name]
+        return out
+
+
+def decode_upload(filename, source, fmt=None, columns=None):
+    """
+    Parse an upload into a DecodedDataset.
+
+    ``source`` is either a path to the stored blob or the raw bytes (rows
+    saved before uploads moved to the blob store). ``fmt`` defaults to the
+    format implied by ``filename``; see formats.UPLOAD_FORMATS. ``columns``
+    limits parsing to those columns.
+    """
+    fmt = fmt or upload_format(filename) or 'xlsx'
+    return DecodedDataset(read_columns(fmt, source, columns))
+
+
+def content_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+class DatasetCache(ByteLRUCache):
+    """
+    Decoded uploads keyed by (file id, content hash, requested columns), shared by every endpoint.
+
+    A request is served from any entry of the same upload whose requested
+    columns cover it (all columns covers everything), so an upload decoded
+    once with the union of what the endpoints read is never parsed again.
+    Misses on the same upload decode one at a time, so concurrent requests
+    for a new upload parse it once and the others are served from that entry.
+    """
+
+    def __init__(self, max_bytes, max_entries=None):
+        super().__init__(max_bytes, max_entries, sizeof=lambda dataset: dataset.nbytes)
+        self._loads = {}  # (file id, digest) -> (lock, number of requests holding or waiting for it)
+
+    def get_or_load(self, file_id, digest, filename, source, fmt=None, columns=None, decode_columns=None):
+        """
+        ``source()`` returns the blob path or bytes to parse; it is only called
+        on a cache miss, so hits never touch the stored upload. ``columns``
+        (None for all) are the columns the caller reads. On a miss,
+        ``decode_columns`` (a superset of ``columns``, by default the same)
+        are decoded and cached, so other endpoints' columns can come along.
+        """
+        wanted = None if columns is None else frozenset(columns)
+        covering = self._covering(file_id, digest, wanted)
+        if covering is None:
+            with self._loading((file_id, digest)):
+                # Another request may have decoded it while this one waited
+                covering = self._covering(file_id, digest, wanted, count_miss=True)
+                if covering is None:
+                    decode_columns = columns if decode_columns is None else decode_columns
+                    with stage("parse"):
+                        covering = decode_upload(filename, source(), fmt, decode_columns)
+                    covering.content_hash = digest
+                    self.put((file_id, digest, None if decode_columns is None else frozenset(decode_columns)),
+                             covering)
+        if wanted is None or set(covering.column_names) <= wanted:
+            return covering
+        return covering.subset(columns)
+
+    def _covering(self, file_id, digest, wanted, count_miss=False):
+        # The most recently used entry of this upload whose requested columns include ``wanted``
+        with self._lock:
+            for key in reversed(self._entries):
+                requested = key[2]
+                if key[:2] == (file_id, digest) and (requested is None or (wanted is not None and wanted <= requested)):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key][0]
+            if count_miss:
+                self.misses += 1
+        return None
+
+    @contextmanager
+    def _loading(self, upload):
+        # Per-upload lock, dropped once no request holds or waits for it
+        with self._lock:
+            lock, users = self._loads.get(upload, (None, 0))
+            lock = lock or threading.Lock()
+            self._loads[upload] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                lock, users = self._loads[upload]
+                if users == 1:
+                    del self._loads[upload]
+                else:
+                    self._loads[upload] = (lock, users - 1)
+
+    def invalidate_file(self, file_id):
+        self.invalidate(lambda key: key[0] == file_id)
@@ -0,0 +1,91 @@
+# downsample.py
+
+import numpy as np
+
+DOWNSAMPLE_METHODS = ('lttb', 'minmax')
+
+
+def time_range_slice(time, start_time=None, end_time=None):
+    """Index slice of the samples with start_time <= time <= end_time (time must be sorted)."""
+    start = 0 if start_time is None else int(np.searchsorted(time, start_time, side='left'))
+    stop = len(time) if end_time is None else int(np.searchsorted(time, end_time, side='right'))
+    return slice(start, max(start, stop))
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: indices of ``threshold`` points that keep the visual shape of y(x).
+
+    The first and last points are always kept; every bucket in between keeps
+    the point forming the largest triangle with the previously kept point and
+    the average of the next bucket, which preserves peaks and troughs.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Bucket edges over the interior points 1 .. n-2
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.intp)
+    indices = np.empty(threshold, dtype=np.intp)
+    indices[0], indices[-1] = 0, n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+        # Twice the triangle area; the constant factor doesn't change the argmax
+        areas = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
+
+
+def minmax_indices(y, threshold):
+    """Indices of the minimum and maximum of each of ``threshold // 2`` equal buckets, in time order."""
+    n = len(y)
+    num_buckets = threshold // 2
+    if threshold >= n or num_buckets < 1:
+        return np.arange(n)
+
+    bucket_size = -(-n // num_buckets)
+    # Pad with the last value so the samples reshape into equal buckets
+    padded = np.empty(num_buckets * bucket_size, dtype=np.float64)
+    padded[:n] = y
+    padded[n:] = y[-1]
+    buckets = padded.reshape(num_buckets, bucket_size)
+    offsets = np.arange(num_buckets) * bucket_size
+    lows = np.minimum(offsets + np.argmin(buckets, axis=1), n - 1)
+    highs = np.minimum(offsets + np.argmax(buckets, axis=1), n - 1)
+    return np.unique(np.concatenate([lows, highs]))
+
+
+def downsample_indices(x, series, max_points, method='lttb'):
+    """
+    Shared sample indices for several series plotted against the same x.
+
+    Each series gets an equal share of ``max_points``, and the union of the
+    points every series keeps is returned, so all series stay aligned on one
+    x axis and the total never exceeds ``max_points``. When the share is
+    below the fewest points a method keeps per series (3 for lttb, 2 for
+    minmax), the union is thinned evenly to ``max_points``, first and last
+    point included.
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Unknown downsampling method '{method}'")
+    n = len(x)
+    if max_points is None or max_points >= n or not series:
+        return np.arange(n)
+
+    per_series = max(max_points // len(series), 3 if method == 'lttb' else 2)
+    keep = [
+        lttb_indices(x, y, per_series) if method == 'lttb' else minmax_indices(y, per_series)
+        for y in series
+    ]
+    indices = np.unique(np.concatenate(keep))
+    if len(indices) > max_points:
+        indices = indices[np.unique(np.linspace(0, len(indices) - 1, max(max_points, 1)).round().astype(np.intp))]
+    return indices
@@ -0,0 +1,144 @@
+# executor.py
+
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+
+def server_process_pool(max_workers=None):
+    """
+    Process pool that is safe to start from the running, multithreaded server.
+
+    A forked worker inherits whatever locks other threads held at the moment
+    of the fork and can deadlock on them, so workers are started from a
+    forkserver (spawned where there is none) instead.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+
+
+class ExecutorSaturated(Exception):
+    """Raised when an endpoint already has as many requests running and queued as it allows."""
+
+    def __init__(self, endpoint, retry_after=1):
+        super().__init__(f"Too many concurrent '{endpoint}' requests, try again shortly")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class _EndpointGate:
+    def __init__(self, concurrency, queue_size):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.running = 0
+        self.waiting = 0
+
+
+class StageExecutor:
+    """
+    Runs the blocking stages of a request off the event loop.
+
+    ``run`` uses a thread pool and is meant for stages that touch in-process
+    state (the dataset cache, loaded models). ``run_cpu`` goes to a pool of
+    ``kind`` 'thread' or 'process' and is meant for pure functions of numpy
+    arrays such as the CWT, Isolation Forest and plot rendering; with
+    'process' the function and its arguments must be picklable.
+
+    ``slot(endpoint)`` bounds how many requests of one endpoint run at once.
+    Up to ``queue_size`` further requests wait for a free slot; beyond that
+    ExecutorSaturated is raised immediately so the caller can answer 429.
+    """
+
+    def __init__(self, kind='thread', max_workers=None, default_concurrency=4, default_queue_size=16,
+                 limits=None):
+        if kind not in ('thread', 'process'):
+            raise ValueError("Executor kind must be 'thread' or 'process'")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.default_concurrency = default_concurrency
+        self.default_queue_size = default_queue_size
+        self.limits = dict(limits or {})
+        self._gates = {}
+        self._thread_pool = None
+        self._cpu_pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def thread_pool(self):
+        with self._lock:
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fo-stage")
+            return self._thread_pool
+
+    @property
+    def cpu_pool(self):
+        if self.kind == 'thread':
+            return self.thread_pool
+        with self._lock:
+            if self._cpu_pool is None:
+                self._cpu_pool = server_process_pool(self.max_workers)
+            return self._cpu_pool
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # Run in a copy of the caller's context so request-scoped state (e.g. the stage trace) follows
+        call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        return await loop.run_in_executor(self.thread_pool, call)
+
+    async def run_cpu(self, fn, *args, **kwargs):
+        if self.kind == 'thread':
+            return await self.run(fn, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.cpu_pool, functools.partial(fn, *args, **kwargs))
+
+    def _gate(self, endpoint):
+        gate = self._gates.get(endpoint)
+        if gate is None:
+            concurrency, queue_size = self.limits.get(endpoint, (self.default_concurrency, self.default_queue_size))
+            gate = self._gates[endpoint] = _EndpointGate(concurrency, queue_size)
+        return gate
+
+    @asynccontextmanager
+    async def slot(self, endpoint):
+        gate = self._gate(endpoint)
+        if gate.semaphore.locked() and gate.waiting >= gate.queue_size:
+            raise ExecutorSaturated(endpoint)
+
+        gate.waiting += 1
+        try:
+            await gate.semaphore.acquire()
+        finally:
+            gate.waiting -= 1
+
+        gate.running += 1
+        try:
+            yield
+        finally:
+            gate.running -= 1
+            gate.semaphore.release()
+
+    def stats(self):
+        return {
+            endpoint: {
+                "running": gate.running,
+                "waiting": gate.waiting,
+                "concurrency": gate.concurrency,
+                "queue_size": gate.queue_size,
+            }
+            for endpoint, gate in self._gates.items()
+        }
+
+    def shutdown(self):
+        # The pools are recreated on next use, so the app can be started again in the same process
+        with self._lock:
+            pools = (self._thread_pool, self._cpu_pool)
+            self._thread_pool = self._cpu_pool = None
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,128 @@
+# features.py
+
+import threading
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import sparse
+
+# Column order the XGBoost models were trained on; one row is these 40 values per sample, flattened
+FEATURE_COLUMNS = ['P1', 'P2', 'P3', 'P4', 'P5', 'P6', 'P7', 'P8', 'P9', 'P10', 'Q1', 'Q2', 'Q3', 'Q4', 'Q5',
+                   'Q6', 'Q7', 'Q8', 'Q9', 'Q10', 'V1', 'V2', 'V3', 'V4', 'V5', 'V6', 'V7', 'V8', 'V9', 'V10',
+                   'A1', 'A2', 'A3', 'A4', 'A5', 'A6', 'A7', 'A8', 'A9', 'A10']
+
+# (prediction key, model, label encoder, importances) for every model a recording is scored with
+PREDICTION_MODELS = [
+    ("predicted_class", "xgb_model_weighted_detection", "label_encoder_detection", "rf_feature_importances_detection"),
+    ("predicted_source", "xgb_model_weighted", "label_encoder", "rf_feature_importances"),
+]
+
+
+def used_feature_positions(model):
+    """Sorted flattened feature positions any tree of an XGBoost model splits on."""
+    booster = model.get_booster()
+    names = booster.feature_names
+    positions = [
+        names.index(feature) if names else int(feature[1:])
+        for feature in booster.get_score(importance_type='weight')
+    ]
+    return np.array(sorted(positions), dtype=np.intp)
+
+
+class FeaturePlan:
+    """
+    The part of the flattened, importance-weighted row a model actually reads.
+
+    The trees only split on a few hundred of the 120040 positions, so only
+    those are gathered and weighted. The compiled trees read these compact
+    rows directly; for XGBoost they become a sparse row, where positions
+    left out are treated as missing, which cannot change a prediction
+    because no split tests them.
+    """
+
+    def __init__(self, positions, importances, num_features):
+        num_columns = len(FEATURE_COLUMNS)
+        self.positions = positions
+        self.num_features = num_features
+        self.num_samples = num_features // num_columns
+        self.weights = np.asarray(importances)[positions % num_columns]
+        samples, column_index = np.divmod(positions, num_columns)
+        # Columns the model needs, each with the positions it fills and the samples it reads
+        self.columns = [FEATURE_COLUMNS[i] for i in np.unique(column_index)]
+        self._gather = [
+            (FEATURE_COLUMNS[i], np.flatnonzero(column_index == i), samples[column_index == i])
+            for i in np.unique(column_index)
+        ]
+
+    def problem(self, dataset):
+        """Why a dataset can't be scored with this plan, or None if it can."""
+        if any(name not in dataset for name in self.columns):
+            return "Uploaded file does not contain the required features."
+        if dataset.num_samples != self.num_samples:
+            # The models take a fixed-width row, so every file needs the sample count they were trained on
+            return f"Expected {self.num_samples} samples, got {dataset.num_samples}"
+        return None
+
+    def values(self, dataset, out=None):
+        """Weighted values at the used positions, i.e. ``weighted_row[positions]``."""
+        if out is None:
+            out = np.empty(len(self.positions))
+        for name, slots, samples in self._gather:
+            out[slots] = dataset[name][samples]
+        out *= self.weights
+        return out
+
+    def value_matrix(self, datasets):
+        """Weighted values at the used positions, one row per dataset."""
+        values = np.empty((len(datasets), len(self.positions)))
+        for i, dataset in enumerate(datasets):
+            self.values(dataset, out=values[i])
+        return values
+
+    def sparse(self, values):
+        """CSR matrix of full model width holding rows of ``values`` at the used positions."""
+        values = np.atleast_2d(values)
+        indptr = np.arange(len(values) + 1) * len(self.positions)
+        indices = np.tile(self.positions, len(values))
+        return sparse.csr_matrix((values.ravel(), indices, indptr), shape=(len(values), self.num_features))
+
+    def window_starts(self, num_samples, stride):
+        """First sample of every model-sized window over a recording of ``num_samples``."""
+        return np.arange(0, num_samples - self.num_samples + 1, stride)
+
+    def window_values(self, dataset, stride):
+        """
+        Weighted values at the used positions for every window of ``num_samples`` samples, ``stride`` apart.
+
+        Each column is windowed as a strided view, so nothing is copied until
+        the used positions of every window are gathered in one indexing step.
+        """
+        starts = self.window_starts(dataset.num_samples, stride)
+        values = np.empty((len(starts), len(self.positions)))
+        for name, slots, samples in self._gather:
+            windows = sliding_window_view(dataset[name], self.num_samples)[::stride]
+            values[:, slots] = windows[:, samples]
+        values *= self.weights
+        return values, starts
+
+
+class FeaturePlans:
+    """FeaturePlan per (model, importances) pair, rebuilt when either artifact is reloaded."""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._plans = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name, importances_name):
+        key = (model_name, self.registry.version(model_name), importances_name, self.registry.version(importances_name))
+        plan = self._plans.get(key)
+        if plan is None:
+            model = self.registry.get(model_name)
+            plan = FeaturePlan(used_feature_positions(model), self.registry.get(importances_name),
+                               model.n_features_in_)
+            with self._lock:
+                # Drop plans for versions that were swapped out
+                self._plans = {k: v for k, v in self._plans.items() if k[0] != model_name or k[2] != importances_name}
+                self._plans[key] = plan
+        return plan
@@ -0,0 +1,180 @@
+# formats.py
+
+import mmap
+import os
+import struct
+import sys
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+# Filename suffix -> upload format, longest suffixes first
+UPLOAD_FORMATS = (
+    ('.csv.gz', 'csv.gz'),
+    ('.csv.zst', 'csv.zst'),
+    ('.csv', 'csv'),
+    ('.parquet', 'parquet'),
+    ('.pq', 'parquet'),
+    ('.arrow', 'arrow'),
+    ('.feather', 'arrow'),
+    ('.pmu', 'pmu'),
+    ('.xlsx', 'xlsx'),
+)
+
+# Compact PMU frame: fixed header, newline-separated column names padded to 8 bytes,
+# then every column as little-endian floats, one after the other
+PMU_MAGIC = b'FOPMU\x01'
+PMU_HEADER = struct.Struct('<6scxQII')  # magic, dtype code, pad, samples, columns, names length
+PMU_DTYPES = {b'd': np.dtype('<f8'), b'f': np.dtype('<f4')}
+
+
+def upload_format(filename):
+    """Format of an upload judged by its file name, or None if it isn't supported."""
+    name = filename.lower()
+    for suffix, fmt in UPLOAD_FORMATS:
+        if name.endswith(suffix):
+            return fmt
+    return None
+
+
+def supported_suffixes():
+    return [suffix for suffix, _ in UPLOAD_FORMATS]
+
+
+def encode_pmu_frame(columns, dtype=np.float64):
+    """Serialize {name: 1-D array} to the PMU frame format."""
+    code = {np.dtype(np.float64): b'd', np.dtype(np.float32): b'f'}[np.dtype(dtype)]
+    arrays = [np.asarray(values, dtype=PMU_DTYPES[code]) for values in columns.values()]
+    num_samples = len(arrays[0]) if arrays else 0
+    if any(len(array) != num_samples for array in arrays):
+        raise ValueError("All columns must have the same length")
+
+    names = '\n'.join(columns).encode()
+    header = PMU_HEADER.pack(PMU_MAGIC, code, num_samples, len(arrays), len(names))
+    padding = b'\0' * (-(len(header) + len(names)) % 8)
+    return b''.join([header, names, padding] + [array.tobytes() for array in arrays])
+
+
+def decode_pmu_frame(buffer):
+    """
+    Columns of a PMU frame as numpy views onto ``buffer`` (bytes or an mmap); nothing is copied.
+    """
+    magic, code, num_samples, num_columns, names_length = PMU_HEADER.unpack_from(buffer, 0)
+    if magic != PMU_MAGIC or code not in PMU_DTYPES:
+        raise ValueError("Not a PMU frame file")
+    dtype = PMU_DTYPES[code]
+    start = PMU_HEADER.size
+    names = bytes(buffer[start:start + names_length]).decode().split('\n') if num_columns else []
+    offset = start + names_length + (-(start + names_length) % 8)
+    columns = {}
+    for name in names:
+        columns[name] = np.frombuffer(buffer, dtype=dtype, count=num_samples, offset=offset)
+        offset += num_samples * dtype.itemsize
+    return columns
+
+
+def _map_file(path):
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _arrow_columns(table, columns=None):
+    if columns is not None:
+        table = table.select([name for name in table.column_names if name in columns])
+    out = {}
+    for name, column in zip(table.column_names, table.columns):
+        if column.num_chunks == 1:
+            # Primitive columns without nulls come out as views onto the Arrow buffers
+            out[name] = column.chunk(0).to_numpy(zero_copy_only=False)
+        else:
+            out[name] = column.to_numpy()
+    return out
+
+
+def _read_arrow(source, columns=None):
+    import pyarrow as pa
+
+    def open_source():
+        return pa.memory_map(source) if isinstance(source, str) else pa.BufferReader(source)
+
+    try:
+        table = pa.ipc.open_file(open_source()).read_all()
+    except pa.ArrowInvalid:
+        # Arrow IPC stream rather than the random-access file (Feather v2) layout
+        table = pa.ipc.open_stream(open_source()).read_all()
+    return _arrow_columns(table, columns)
+
+
+def _read_parquet(source, columns=None):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(source, memory_map=True) if isinstance(source, str) else \
+        pq.ParquetFile(pa.BufferReader(source))
+    if columns is not None:
+        # Parquet is columnar on disk, so unrequested columns are never decoded
+        columns = [name for name in parquet_file.schema_arrow.names if name in columns]
+    return _arrow_columns(parquet_file.read(columns=columns))
+
+
+def _frame_columns(df):
+    return {name: df[name].to_numpy() for name in df.columns}
+
+
+def read_columns(fmt, source, columns=None):
+    """
+    Decode an upload into {column name: numpy array}.
+
+    ``source`` is a file path or the raw bytes. Binary formats are read
+    without copying where the format allows it: PMU frames and Arrow files
+    are memory-mapped and their columns are views onto the mapping.
+
+    ``columns`` restricts the result to those columns, and the text and
+    Parquet readers skip parsing the others. Requested columns that aren't
+    in the file are left out rather than raising, so callers can report
+    them.
+    """
+    wanted = None if columns is None else set(columns)
+    is_path = isinstance(source, str)
+    if fmt == 'pmu':
+        frame = decode_pmu_frame(_map_file(source) if is_path else source)
+        return frame if wanted is None else {name: values for name, values in frame.items() if name in wanted}
+    if fmt == 'arrow':
+        return _read_arrow(source, wanted)
+    if fmt == 'parquet':
+        return _read_parquet(source, wanted)
+
+    data = source if is_path else BytesIO(source)
+    usecols = None if wanted is None else wanted.__contains__
+    if fmt == 'csv':
+        return _frame_columns(pd.read_csv(data, memory_map=is_path, usecols=usecols))
+    if fmt in ('csv.gz', 'csv.zst'):
+        compression = {'csv.gz': 'gzip', 'csv.zst': 'zstd'}[fmt]
+        return _frame_columns(pd.read_csv(data, compression=compression, usecols=usecols))
+    if fmt == 'xlsx':
+        return _frame_columns(pd.read_excel(data, usecols=usecols))
+    raise ValueError(f"Unsupported upload format '{fmt}'")
+
+
+def convert_to_pmu_frame(fmt, source):
+    """Decode an upload once and re-encode it as a PMU frame, or return None if a column isn't numeric."""
+    columns = read_columns(fmt, source)
+    try:
+        return encode_pmu_frame(columns)
+    except (TypeError, ValueError):
+        return None
+
+
+if __name__ == "__main__":
+    # python formats.py recording.xlsx recording.pmu -> convert any supported upload to a PMU frame
+    src, dst = sys.argv[1], sys.argv[2]
+    fmt = upload_format(src)
+    if fmt is None:
+        sys.exit(f"Unsupported input, expected one of {', '.join(supported_suffixes())}")
+    frame = convert_to_pmu_frame(fmt, os.path.abspath(src))
+    if frame is None:
+        sys.exit("Input has non-numeric columns")
+    with open(dst, 'wb') as f:
+        f.write(frame)
+    print(f"Wrote {dst}")
@@ -1,27 +1,103 @@
 # main.py
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from contextlib import asynccontextmanager
+import asyncio
+import base64
+import hashlib
+import json
+import time
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import List
-import pandas as pd
+from pydantic import BaseModel, Field
+from typing import List, Optional
 import numpy as np
-import time
-from io import BytesIO
-import base64
-import pickle
-from database import SessionLocal, engine, Base
+import pandas as pd
+from database import SessionLocal, engine, Base, add_missing_columns
 from models import FileUpload
 import crud
+import config
+from cache import ByteLRUCache
+from dataset_cache import DatasetCache, content_hash
+from downsample import DOWNSAMPLE_METHODS, downsample_indices, time_range_slice
+from blob_store import BlobStore, UploadTooLarge
+from formats import convert_to_pmu_frame, supported_suffixes, upload_format
+from streaming import StreamRegistry
+from executor import StageExecutor, ExecutorSaturated, server_process_pool
+import metrics
+from metrics import stage
+from model_registry import ModelRegistry
+from features import FEATURE_COLUMNS, PREDICTION_MODELS, FeaturePlans
+from compiled_trees import TreePredictors
+from spectral import configured_screen
+from preanalysis import AnalysisCancelled, InFlight, PreAnalysisJobs
+from cwt import kernel_cache as cwt_kernel_cache
 from utils import (
-    detect_anomalies_with_optimized_isolation_forest,
+    CONTAMINATION_VALUES,
+    CWT_SCALES,
+    DURATION_ENGINES,
+    MIN_ANOMALY_DURATION,
+    MIN_POWER_THRESHOLD,
+    PLOT_TYPES,
+    detect_anomaly_window,
     detect_oscillation_start_cwt,
-    plot_signal,
-    plot_cwt_power_with_anomalies
+    detect_oscillation_windows_multichannel,
+    render_plot,
 )
 
-app = FastAPI()
+executor = StageExecutor(
+    kind=config.EXECUTOR_KIND,
+    max_workers=config.EXECUTOR_WORKERS,
+    default_concurrency=config.ENDPOINT_CONCURRENCY,
+    default_queue_size=config.ENDPOINT_QUEUE_SIZE,
+    limits=config.ENDPOINT_LIMITS,
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _channel_pool
+    if config.MODEL_WARMUP != "lazy":
+        models.warm_up(background=config.MODEL_WARMUP == "background")
+    yield
+    executor.shutdown()
+    if _channel_pool is not None:
+        _channel_pool.shutdown(wait=False, cancel_futures=True)
+        _channel_pool = None
+
+app = FastAPI(lifespan=lifespan)
+
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+trace_log = metrics.TraceLog(config.TRACE_LOG)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Per-request stage timings: Server-Timing header, latency histogram and the optional JSON log
+    trace, token = metrics.start_trace(request.method, request.url.path)
+    metrics.REQUESTS_IN_FLIGHT.inc(method=request.method)
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if trace.stages:
+            response.headers["Server-Timing"] = trace.server_timing()
+        return response
+    finally:
+        metrics.REQUESTS_IN_FLIGHT.dec(method=request.method)
+        metrics.end_trace(token)
+        seconds = time.perf_counter() - trace.started
+        # Route templates rather than raw paths keep the label set bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        metrics.REQUEST_SECONDS.observe(seconds, method=request.method, route=route, status=status)
+        trace_log.write(trace, route, status, seconds)
 
 # Configure CORS
 app.add_middleware(
@@ -35,28 +111,67 @@ app.add_middleware(
 class AnalysisOptions(BaseModel):
     generators: List[str]
     properties: List[str]
+    # "records" (one dict per sample, the original shape), "columnar" (one array per series),
+    # "binary" (column-major, little-endian: float64 timestamps, float32 values; see X-Column-Types) or "arrow" (Arrow IPC stream, needs pyarrow)
+    format: str = "records"
+    # Peak-preserving downsampling to at most this many points ("lttb" or "minmax" buckets)
+    max_points: Optional[int] = None
+    downsample: str = "lttb"
+    # Only return samples inside [start_time, end_time], e.g. the visible window when zooming
+    start_time: Optional[float] = None
+    end_time: Optional[float] = None
+
+# The single-channel duration pipeline and its plots only read these
+DURATION_COLUMNS = ('Time', 'P1')
 
-with open("xgb_model_weighted.pkl", "rb") as f:
-    xgb_model_weighted = pickle.load(f)
+# Model artifacts behind each memoized endpoint; reloading one of them drops that endpoint's stored results
+RESULT_MODELS = {
+    "locate_source": ("xgb_model_weighted", "label_encoder", "rf_feature_importances"),
+    "predict_class": ("xgb_model_weighted_detection", "label_encoder_detection", "rf_feature_importances_detection"),
+    "detect_duration": (),
+    "locate_source_timeline": ("xgb_model_weighted", "label_encoder", "rf_feature_importances"),
+}
 
-with open("xgb_model_weighted_detection.pkl", "rb") as f:
-    xgb_model_weighted_detection = pickle.load(f)
+class BatchPredictionRequest(BaseModel):
+    file_ids: List[int]
 
-with open("label_encoder.pkl", "rb") as f:
-    label_encoder = pickle.load(f)
+class StreamOptions(BaseModel):
+    # Bounded so one stream's buffers (window, hop and the wavelet support of max_scale) stay small
+    max_scale: int = Field(100, ge=2, le=int(CWT_SCALES.max()))
+    hop: int = Field(30, ge=1, le=config.STREAM_MAX_HOP)
+    window: int = Field(3000, ge=1, le=config.STREAM_MAX_WINDOW)
+    warmup: int = Field(300, ge=0, le=config.STREAM_MAX_WINDOW)
+    on_ratio: float = Field(8.0, gt=0)
+    off_ratio: float = Field(3.0, gt=0)
+    hold_samples: int = Field(30, ge=1, le=config.STREAM_MAX_WINDOW)
 
-with open("label_encoder_detection.pkl", "rb") as f:
-    label_encoder_detection = pickle.load(f)
+class StreamChunk(BaseModel):
+    time: List[float]
+    values: List[float]
 
-with open("scaler.pkl", "rb") as f:
-    scaler = pickle.load(f)
+def select_channels(options: AnalysisOptions):
+    # G3 + P -> "P3", in generator-major order
+    return [f"{prop}{gen[1:]}" for gen in options.generators for prop in options.properties]
+
+# Artifacts load on first use (or in the background warm-up started with the app)
+models = ModelRegistry(config.MODEL_DIR, prefer=config.MODEL_FORMAT)
+feature_plans = FeaturePlans(models)
+tree_predictors = TreePredictors(models)
+
+dataset_cache = DatasetCache(
+    max_bytes=config.DATASET_CACHE_MAX_BYTES,
+    max_entries=config.DATASET_CACHE_MAX_ENTRIES,
+)
+duration_cache = ByteLRUCache(max_bytes=config.DURATION_CACHE_MAX_BYTES)
+plot_cache = ByteLRUCache(max_bytes=config.PLOT_CACHE_MAX_BYTES)
 
-with open("rf_feature_importances.pkl", "rb") as f:
-    rf_feature_importances = pickle.load(f)
+# Results being computed right now, shared by every request and job asking for them,
+# and the background analysis jobs queued by uploads
+in_flight = InFlight()
+# Duration pipeline runs, which clearing the files leaves alone: they hold no file state
+duration_in_flight = InFlight()
+preanalysis_jobs = PreAnalysisJobs(concurrency=config.PREANALYSIS_CONCURRENCY)
 
-with open("rf_feature_importances_detection.pkl", "rb") as f:
-    rf_feature_importances_detection = pickle.load(f)
- 
 def get_db():
     db = SessionLocal()
     try:
@@ -66,156 +181,295 @@ def get_db():
         
 # Create database tables
 Base.metadata.create_all(bind=engine)
+metrics.instrument_engine(engine)
+add_missing_columns(FileUpload.__table__)
+
+blob_store = BlobStore(config.BLOB_STORE_DIR)
+
+stream_registry = StreamRegistry(max_streams=config.STREAM_MAX_STREAMS)
+
+_channel_pool = None
+
+def get_channel_pool():
+    # Created on first use so plain single-channel deployments never start workers
+    global _channel_pool
+    if _channel_pool is None:
+        _channel_pool = server_process_pool(config.CHANNEL_WORKERS)
+    return _channel_pool
+
+# Everything the model, timeline and duration endpoints read; decoded together on the first of them
+PMU_COLUMNS = ('Time', *FEATURE_COLUMNS)
+
+def load_dataset(file_upload, columns=None):
+    # Decoded once per upload and shared by every endpoint; ``columns`` are what the caller reads.
+    # Requests within the PMU channels decode all of them, so the other endpoints' requests hit
+    decode_columns = PMU_COLUMNS if columns is not None and set(columns) <= set(PMU_COLUMNS) else columns
+    if file_upload.content_hash is None:
+        # Row from before the blob store: the bytes are still in the database
+        content = file_upload.content
+        return dataset_cache.get_or_load(file_upload.id, content_hash(content), file_upload.filename,
+                                         lambda: content, columns=columns, decode_columns=decode_columns)
+    return dataset_cache.get_or_load(
+        file_upload.id, file_upload.content_hash, file_upload.filename,
+        lambda: blob_store.path(file_upload.content_hash), fmt=file_upload.format, columns=columns,
+        decode_columns=decode_columns,
+    )
 
 
+def preanalysis_steps(file_id):
+    # The same results, with the same parameters, as the default GETs the frontend makes after an upload
+    async def step(result, *args):
+        with SessionLocal() as db:
+            await result(db, file_upload_or_404(db, file_id), *args)
+
+    return [
+        ("predict_class", lambda: step(predict_class_result)),
+        ("locate_source", lambda: step(locate_source_result)),
+        ("detect_duration", lambda: step(detect_duration_result, config.PREANALYSIS_PLOTS, None)),
+    ]
+
+def start_preanalysis(file_id, preanalyze):
+    if not (config.PREANALYZE_UPLOADS if preanalyze is None else preanalyze):
+        return {}
+    job = preanalysis_jobs.submit(file_id, preanalysis_steps(file_id))
+    return {"analysis": {"state": job.state, "status_url": f"/api/files/{file_id}/analysis"}}
+
 @app.post("/api/upload")
-async def upload_file(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    if not file.filename.endswith(('.csv', '.xlsx')):
-        raise HTTPException(status_code=400, detail="Invalid file type")
+async def upload_file(file: UploadFile = File(...), preanalyze: Optional[bool] = None,
+                      db: Session = Depends(get_db)):
+    fmt = upload_format(file.filename)
+    if fmt is None:
+        raise HTTPException(status_code=400,
+                            detail=f"Invalid file type, expected one of {', '.join(supported_suffixes())}")
+
+    # Hashed and written to the blob store chunk by chunk instead of read into memory whole
+    try:
+        digest, size, _ = await blob_store.write_stream(
+            file.read, max_bytes=config.UPLOAD_MAX_BYTES, chunk_size=config.UPLOAD_CHUNK_BYTES
+        )
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    existing = crud.get_file_upload_by_hash(db, digest)
+    if existing is not None:
+        if existing.content_hash != digest:
+            # A converted workbook: the raw bytes just written again are not referenced by any upload
+            blob_store.delete(digest)
+        return {"message": "File already uploaded", "file_id": existing.id,
+                **start_preanalysis(existing.id, preanalyze)}
 
-    file_content = await file.read()
-    file_upload = crud.create_file_upload(db, file.filename, file_content)
+    stored_hash, stored_format = digest, fmt
+    if fmt == 'xlsx':
+        # Parse the workbook once now so no analysis request ever goes through the xlsx reader
+        try:
+            with stage("convert"):
+                frame = await executor.run(convert_to_pmu_frame, fmt, blob_store.path(digest))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Could not read workbook: {e}")
+        if frame is not None:
+            stored_hash, stored_format = blob_store.write_bytes(frame), 'pmu'
+            blob_store.delete(digest)
+
+    file_upload = crud.create_file_upload(db, file.filename, stored_hash, size, stored_format, source_hash=digest)
     
-    return {"message": "File uploaded successfully", "file_id": file_upload.id}
+    return {"message": "File uploaded successfully", "file_id": file_upload.id,
+            **start_preanalysis(file_upload.id, preanalyze)}
 
-@app.post("/api/analyze/{file_id}")
-async def analyze_data(file_id: int, options: AnalysisOptions, db: Session = Depends(get_db)):
-    file_upload = crud.get_file_upload(db, file_id)
-    if not file_upload:
-        raise HTTPException(status_code=404, detail="File not found")
+@app.get("/api/files/{file_id}/analysis")
+async def preanalysis_status(file_id: int):
+    # Progress of the background analysis an upload queued; the results themselves come from the usual GETs
+    job = preanalysis_jobs.get(file_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No pre-analysis job for this file")
+    return job.describe()
 
-    try:
-        time.sleep(2)
+ANALYSIS_FORMATS = ('records', 'columnar', 'binary', 'arrow')
 
-        # Read the uploaded file
-        file_content = BytesIO(file_upload.content)
-        if file_upload.filename.endswith('.csv'):
-            df = pd.read_csv(file_content)
-        else:
-            df = pd.read_excel(file_content)
+def select_analysis_series(dataset, options: AnalysisOptions):
+    """
+    Pick the requested time window and series, downsampled if asked.
 
-        if 'Time' not in df.columns:
-            raise HTTPException(status_code=400, detail="Time column not found in the data file")
+    Returns (series, total_points) where series maps the response names
+    (timestamp, G1_P, ...) to arrays sharing one set of sample indices.
+    """
+    if 'Time' not in dataset:
+        raise HTTPException(status_code=400, detail="Time column not found in the data file")
 
-        selected_columns = ['Time']
-        for gen in options.generators:
-            gen_number = gen[1:]  # Extract number from G1, G2, etc.
-            for prop in options.properties:
-                selected_columns.append(f"{prop}{gen_number}")
+    selected_columns = ['Time'] + select_channels(options)
 
-        # Filter the dataframe to keep only the selected columns
-        if not set(selected_columns).issubset(df.columns):
-            raise HTTPException(status_code=400, detail="Selected columns not found in the data file")
+    # Filter the dataframe to keep only the selected columns
+    if not set(selected_columns).issubset(dataset.column_names):
+        raise HTTPException(status_code=400, detail="Selected columns not found in the data file")
 
-        filtered_data = df[selected_columns]
+    window = time_range_slice(dataset['Time'], options.start_time, options.end_time)
+    time = dataset['Time'][window]
+    # Rename columns to match frontend expectations: P3 -> G3_P
+    series = {'timestamp': time}
+    for gen in options.generators:
+        for prop in options.properties:
+            series[f"{gen}_{prop}"] = dataset[f"{prop}{gen[1:]}"][window]
 
-        # Convert DataFrame to list of dictionaries to send as JSON
-        data = filtered_data.to_dict('records')
-        
-        # Rename columns to match frontend expectations
-        for item in data:
-            item['timestamp'] = item.pop('Time')
-            for gen in options.generators:
-                for prop in options.properties:
-                    old_key = f"{prop}{gen[1:]}"
-                    new_key = f"{gen}_{prop}"
-                    if old_key in item:
-                        item[new_key] = item.pop(old_key)
-
-        return data
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    
-@app.get("/api/locate_source")
-async def locate_source(db: Session = Depends(get_db)):
-    # Get the most recent file upload
-    file= crud.get_most_recent_file_upload(db)
-    if not file:
-        raise HTTPException(status_code=404, detail="No uploaded files found")
-    
-    print(file.filename)
+    total_points = len(time)
+    if options.max_points is not None:
+        values = [array for name, array in series.items() if name != 'timestamp']
+        keep = downsample_indices(time, values, options.max_points, options.downsample)
+        if len(keep) < total_points:
+            series = {name: array[keep] for name, array in series.items()}
+    return series, total_points
 
-    # Read the file into a DataFrame
-    file_content = BytesIO(file.content)
-    if file.filename.endswith('.csv'):
-        df = pd.read_csv(file_content)
-    else:
-        df = pd.read_excel(file_content)
+def build_analysis_response(dataset, options: AnalysisOptions):
+    series, total_points = select_analysis_series(dataset, options)
+    num_points = len(series['timestamp'])
 
-    # Assuming the file has similar features as the training data
-    FEATURE_COLUMNS = ['P1', 'P2', 'P3', 'P4', 'P5', 'P6', 'P7', 'P8', 'P9', 'P10', 'Q1', 'Q2', 'Q3', 'Q4', 'Q5',
-                       'Q6', 'Q7', 'Q8', 'Q9', 'Q10', 'V1', 'V2', 'V3', 'V4', 'V5', 'V6', 'V7', 'V8', 'V9', 'V10',
-                       'A1', 'A2', 'A3', 'A4', 'A5', 'A6', 'A7', 'A8', 'A9', 'A10']
+    if options.format == 'records':
+        # Same list-of-dicts shape as before, built column-wise instead of renaming keys row by row
+        return pd.DataFrame(series).to_dict('records')
 
-    # Filter the relevant columns
-    if not all(col in df.columns for col in FEATURE_COLUMNS):
-        raise HTTPException(status_code=400, detail="Uploaded file does not contain the required features.")
+    if options.format == 'columnar':
+        return {
+            "columns": {name: array.tolist() for name, array in series.items()},
+            "num_points": num_points,
+            "total_points": total_points,
+        }
+
+    headers = {
+        "X-Columns": ",".join(series),
+        "X-Num-Points": str(num_points),
+        "X-Total-Points": str(total_points),
+    }
+    if options.format == 'binary':
+        # Timestamps stay float64 (as in the Arrow output) so long recordings keep sub-sample precision
+        types = ['<f8' if name == 'timestamp' else '<f4' for name in series]
+        headers["X-Column-Types"] = ",".join(np.dtype(t).str[1:] for t in types)
+        content = b"".join(np.ascontiguousarray(array, dtype=t).tobytes() for array, t in zip(series.values(), types))
+        return Response(content=content, media_type="application/octet-stream", headers=headers)
+
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise HTTPException(status_code=400, detail="Arrow output needs pyarrow installed on the server")
+    table = pa.table({
+        name: pa.array(array, type=pa.float64() if name == 'timestamp' else pa.float32())
+        for name, array in series.items()
+    })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return Response(
+        content=sink.getvalue().to_pybytes(),
+        media_type="application/vnd.apache.arrow.stream",
+        headers=headers,
+    )
+
+@app.post("/api/analyze/{file_id}")
+async def analyze_data(file_id: int, options: AnalysisOptions, db: Session = Depends(get_db)):
+    file_upload = file_upload_or_404(db, file_id)
 
-    test_features = df[FEATURE_COLUMNS]
-    test_features_array=np.array(test_features)
+    if options.format not in ANALYSIS_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(ANALYSIS_FORMATS)}")
+    if options.downsample not in DOWNSAMPLE_METHODS:
+        raise HTTPException(status_code=400, detail=f"downsample must be one of {', '.join(DOWNSAMPLE_METHODS)}")
+    if options.max_points is not None and options.max_points < 2:
+        raise HTTPException(status_code=400, detail="max_points must be at least 2")
 
-    # Step 1: Reshape and scale the test data
-    num_samples, num_features = test_features.shape  # Should be (3001, 40)
-    test_features_flattened = test_features_array.reshape(1, num_samples * num_features)  # Flatten to (1, 120040)
-    # test_features_scaled = scaler.transform(test_features_flattened)
+    async with executor.slot("analyze"):
+        try:
+            # Read the uploaded file, only the selected series
+            dataset = await executor.run(load_dataset, file_upload, ['Time'] + select_channels(options))
+            return await executor.run(build_analysis_response, dataset, options)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
-    # Step 2: Apply RF feature importance weighting
-    rf_feature_importances_repeated = np.tile(rf_feature_importances, num_samples)
-    test_features_weighted = test_features_flattened * rf_feature_importances_repeated
+def weighted_feature_row(dataset, plan):
+    # Filter the relevant columns
+    problem = plan.problem(dataset)
+    if problem:
+        raise HTTPException(status_code=400, detail=problem)
+
+    with stage("features"):
+        # Step 1 + 2: flatten (3001, 40) -> (1, 120040) and apply the RF feature importance weighting,
+        # only at the positions the model's trees read; the rest are never read by a split
+        # test_features_scaled = scaler.transform(test_features_flattened)
+        return plan.value_matrix([dataset])
+
+def predict_source(dataset):
+    plan = feature_plans.get(*SOURCE_PLAN)
+    test_features_weighted = weighted_feature_row(dataset, plan)
 
     # Step 3: Use the XGBoost model to make predictions
-    predictions= xgb_model_weighted.predict(test_features_weighted)
-   
+    with stage("predict"):
+        predictions = tree_predictors.predict("xgb_model_weighted", plan, test_features_weighted)
+
     # Step 4: Decode the predicted label
-    predicted_class = label_encoder.inverse_transform(predictions)
+    predicted_class = models.get("label_encoder").inverse_transform(predictions)
     print(predicted_class[0])
-    predicted_class_str = str(predicted_class[0])  # Convert to string to ensure JSON serialization
-    return {"predicted_source": predicted_class_str}
-
-@app.get("/api/predict_class")
-async def predict_class(db: Session = Depends(get_db)):
-    # Get the most recent file upload
-    file = crud.get_most_recent_file_upload(db)
-    if not file:
-        raise HTTPException(status_code=404, detail="No uploaded files found")
-    
-    print(file.filename)
-
-    # Read the file into a DataFrame
-    file_content = BytesIO(file.content)
-    if file.filename.endswith('.csv'):
-        df = pd.read_csv(file_content)
-    else:
-        df = pd.read_excel(file_content)
+    return str(predicted_class[0])  # Convert to string to ensure JSON serialization
 
-    # Assuming the file has similar features as the training data
-    FEATURE_COLUMNS = ['P1', 'P2', 'P3', 'P4', 'P5', 'P6', 'P7', 'P8', 'P9', 'P10', 'Q1', 'Q2', 'Q3', 'Q4', 'Q5',
-                       'Q6', 'Q7', 'Q8', 'Q9', 'Q10', 'V1', 'V2', 'V3', 'V4', 'V5', 'V6', 'V7', 'V8', 'V9', 'V10',
-                       'A1', 'A2', 'A3', 'A4', 'A5', 'A6', 'A7', 'A8', 'A9', 'A10']
+def predict_source_timeline(dataset, stride):
+    """
+    Source probabilities for every model-sized window of a longer recording, ``stride`` samples apart.
 
-    # Filter the relevant columns
-    if not all(col in df.columns for col in FEATURE_COLUMNS):
+    All windows are gathered from strided views of the columns and scored
+    with a single predict_proba call.
+    """
+    plan = feature_plans.get(*SOURCE_PLAN)
+    if any(name not in dataset for name in plan.columns) or 'Time' not in dataset:
         raise HTTPException(status_code=400, detail="Uploaded file does not contain the required features.")
+    if dataset.num_samples < plan.num_samples:
+        raise HTTPException(status_code=400,
+                            detail=f"Expected at least {plan.num_samples} samples, got {dataset.num_samples}")
+    num_windows = len(plan.window_starts(dataset.num_samples, stride))
+    if num_windows > config.TIMELINE_MAX_WINDOWS:
+        raise HTTPException(status_code=400,
+                            detail=f"{num_windows} windows exceed the limit of {config.TIMELINE_MAX_WINDOWS}, "
+                                   f"use a larger stride")
 
-    test_features = df[FEATURE_COLUMNS]
-    test_features_array = np.array(test_features)
+    with stage("features"):
+        values, starts = plan.window_values(dataset, stride)
+    with stage("predict"):
+        probabilities = tree_predictors.predict_proba("xgb_model_weighted", plan, values)
+    label_encoder = models.get("label_encoder")
+    labels = label_encoder.inverse_transform(np.argmax(probabilities, axis=1))
+    classes = [str(label) for label in label_encoder.inverse_transform(np.arange(probabilities.shape[1]))]
 
-    # Step 1: Reshape and scale the test data
-    num_samples, num_features = test_features.shape  # Should be (3001, 40)
-    test_features_flattened = test_features_array.reshape(1, num_samples * num_features)  # Flatten to (1, 120040)
-    # test_features_scaled = scaler.transform(test_features_flattened)
+    time_values = dataset['Time']
+    windows = [
+        {
+            "start_time": float(time_values[start]),
+            "end_time": float(time_values[start + plan.num_samples - 1]),
+            "predicted_source": str(label),
+            "probabilities": [round(float(p), 6) for p in row],
+        }
+        for start, label, row in zip(starts, labels, probabilities)
+    ]
+    # Where the most likely source differs from the previous window's
+    source_changes = [
+        {"time": current["start_time"], "from": previous["predicted_source"], "to": current["predicted_source"]}
+        for previous, current in zip(windows, windows[1:])
+        if previous["predicted_source"] != current["predicted_source"]
+    ]
+    return {
+        "window_samples": plan.num_samples,
+        "stride": stride,
+        "classes": classes,
+        "windows": windows,
+        "source_changes": source_changes,
+    }
 
-    # Step 2: Apply RF feature importance weighting
-    rf_feature_importances_repeated = np.tile(rf_feature_importances_detection, num_samples)
-    test_features_weighted = test_features_flattened * rf_feature_importances_repeated
+def predict_detection_class(dataset):
+    plan = feature_plans.get(*DETECTION_PLAN)
+    test_features_weighted = weighted_feature_row(dataset, plan)
 
     # Step 3: Use the XGBoost model to make predictions
-    predictions = xgb_model_weighted_detection.predict(test_features_weighted)
+    with stage("predict"):
+        predictions = tree_predictors.predict("xgb_model_weighted_detection", plan, test_features_weighted)
     predictions = np.array(predictions).reshape(-1)  # Ensure it's a 1D array
 
     # Step 4: Decode the predicted label
     try:
-        predicted_class = label_encoder_detection.inverse_transform(predictions)
+        predicted_class = models.get("label_encoder_detection").inverse_transform(predictions)
         if len(predicted_class) == 0:
             raise HTTPException(status_code=500, detail="Prediction resulted in an empty class.")
         predicted_class_str = str(predicted_class[0])  # Convert to string for JSON response
@@ -223,71 +477,747 @@ async def predict_class(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Error decoding predicted class: {str(e)}")
 
     print(predicted_class_str)
-    return {"Predicted class": predicted_class_str}
+    return predicted_class_str
 
-    
+# (model, importances) behind /api/locate_source and /api/predict_class
+SOURCE_PLAN = ("xgb_model_weighted", "rf_feature_importances")
+DETECTION_PLAN = ("xgb_model_weighted_detection", "rf_feature_importances_detection")
 
-@app.get("/api/detect_duration")
-async def detect_duration(db: Session = Depends(get_db)):
+def predict_batch(file_uploads):
+    """
+    Classify and locate many uploads, one predict call per model for every
+    block of BATCH_PREDICT_ROWS files.
+
+    Files are parsed keeping only the columns some model reads. Each block
+    is loaded, every model gathers its weighted features from the block's
+    rows into one matrix and scores them together, and the block is dropped
+    before the next one is loaded, so memory follows the block size rather
+    than the size of the batch.
+    """
+    results, errors, block = [], [], []
+    plans = {model_name: feature_plans.get(model_name, importances_name)
+             for _, model_name, _, importances_name in PREDICTION_MODELS}
+    columns = sorted(set().union(*(plan.columns for plan in plans.values())))
+    for file in file_uploads:
+        try:
+            dataset = load_dataset(file, columns)
+        except Exception as e:
+            errors.append({"file_id": file.id, "detail": f"Could not read file: {e}"})
+            continue
+        problem = next(filter(None, (plan.problem(dataset) for plan in plans.values())), None)
+        if problem:
+            errors.append({"file_id": file.id, "detail": problem})
+            continue
+        block.append((file, dataset))
+        if len(block) == config.BATCH_PREDICT_ROWS:
+            results += predict_batch_block(block, plans)
+            block = []
+    if block:
+        results += predict_batch_block(block, plans)
+
+    return {"results": results, "errors": errors}
+
+def predict_batch_block(block, plans):
+    datasets = [dataset for _, dataset in block]
+    predictions = {}
+    for key, model_name, encoder_name, _ in PREDICTION_MODELS:
+        with stage("features"):
+            weighted = plans[model_name].value_matrix(datasets)
+        with stage("predict"):
+            labels = tree_predictors.predict(model_name, plans[model_name], weighted)
+        predictions[key] = models.get(encoder_name).inverse_transform(labels)
+
+    results = []
+    for i, (file, _) in enumerate(block):
+        result = {"file_id": file.id, "filename": file.filename}
+        result.update({key: str(values[i]) for key, values in predictions.items()})
+        results.append(result)
+    return results
+
+@app.post("/api/predict/batch")
+async def predict_batch_endpoint(request: BatchPredictionRequest, db: Session = Depends(get_db)):
+    if not request.file_ids:
+        raise HTTPException(status_code=400, detail="No file ids given")
+    if len(request.file_ids) > config.BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {config.BATCH_MAX_FILES} files per batch")
+
+    file_uploads = crud.get_file_uploads(db, request.file_ids)
+    found = {file.id for file in file_uploads}
+    missing = [{"file_id": file_id, "detail": "File not found"} for file_id in request.file_ids if file_id not in found]
+
+    async with executor.slot("predict_batch"):
+        response = await executor.run(predict_batch, file_uploads)
+    response["errors"] = missing + response["errors"]
+    return response
+
+def result_key(file_upload, endpoint, params):
+    """(content hash, endpoint, params key, model version) a stored result is looked up by."""
+    digest = file_upload.content_hash or content_hash(file_upload.content)
+    params_key = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:32]
+    model_version = ",".join(f"{name}={models.digest(name)}" for name in RESULT_MODELS[endpoint]) or "none"
+    return digest, endpoint, params_key, model_version
+
+def etag_matches(request: Request, etag):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {tag.strip().removeprefix("W/").strip('"') for tag in header.split(",")}
+    return etag in candidates or "*" in candidates
+
+async def memoized_result(db: Session, file_upload, endpoint, params, compute):
+    """
+    The stored result for this content, parameter set and model version,
+    computed with ``compute()`` and stored first if there is none.
+
+    A result already being computed in this process (by a pre-analysis job
+    or another request) is waited for rather than computed again.
+    """
+    key = await executor.run(result_key, file_upload, endpoint, params)
+    stored = await executor.run(stored_result, db, key)
+    if stored is None:
+        async def compute_and_store():
+            response = jsonable_encoder(await compute())
+            await executor.run(store_result, key, response)
+            return response
+
+        try:
+            response = await in_flight.run(key, compute_and_store)
+        except AnalysisCancelled:
+            raise HTTPException(status_code=409, detail="The analysis was cancelled because the files were cleared")
+        stored = await executor.run(stored_result, db, key, response)
+    return stored
+
+def stored_result(db: Session, key, response=None):
+    # Runs in the executor: a lookup may also refresh the row's last-read time
+    stored = crud.get_analysis_result(db, *key, touch_after_seconds=config.RESULTS_TOUCH_SECONDS)
+    if stored is None and response is not None:
+        stored = crud.save_analysis_result(db, *key, response)
+    return stored
+
+def store_result(key, response):
+    # Own session: the computation may outlive the request or job that started it
+    with SessionLocal() as session:
+        crud.save_analysis_result(session, *key, response)
+        crud.prune_analysis_results(session, config.RESULTS_MAX_ROWS, config.RESULTS_MAX_AGE_SECONDS)
+
+async def memoized_response(request: Request, db: Session, file_upload, endpoint, params, compute):
+    """
+    Answer from the results table when this content, parameter set and model
+    version were already computed; otherwise await ``compute()`` and store it.
+
+    Responses carry an ETag so clients can revalidate with If-None-Match and
+    get a 304 instead of the body.
+    """
+    return stored_response(request, await memoized_result(db, file_upload, endpoint, params, compute))
+
+def stored_response(request: Request, stored):
+    headers = {"ETag": f'"{stored.etag}"', "Cache-Control": "private, no-cache"}
+    if etag_matches(request, stored.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=stored.result, media_type="application/json", headers=headers)
+
+def latest_file_upload(db: Session):
     file = crud.get_most_recent_file_upload(db)
     if not file:
         raise HTTPException(status_code=404, detail="No uploaded files found")
+    return file
 
-    file_content = BytesIO(file.content)
-    df = pd.read_excel(file_content) if file.filename.endswith('.xlsx') else pd.read_csv(file_content)
-    
-    time = df['Time'].values
-    signal = df['P1'].values
-
-    scales = np.arange(1, 101)
-    avg_power, signal_filtered, signal_detrended = detect_oscillation_start_cwt(signal, scales)
-
-    contamination_values = np.arange(0.05, 0.3, 0.05)
-    anomalies, best_contamination = detect_anomalies_with_optimized_isolation_forest(avg_power, contamination_values)
-
-    anomaly_indices = np.where(anomalies == -1)[0]
-    min_anomaly_duration=2
-    start_time=0
-    end_time=0
-    duration=0
-    if len(anomaly_indices) > 0:
-        durations = np.diff(anomaly_indices)
-        is_significant_duration = np.insert(durations >= min_anomaly_duration, 0, True)
-        significant_anomalies = anomaly_indices[is_significant_duration]
-    #     start_time = time[anomaly_indices[0]]
-    #     end_time = time[anomaly_indices[-1]]
-    # else:
-    #     start_time = end_time = None
-        if significant_anomalies.size > 0:
-            start_time = time[significant_anomalies[0]]
-            end_time = time[significant_anomalies[-1]]
-            duration = end_time - start_time
-        else:
-            start_time=None,
-            end_time=None,
-            duration=None
-            return ("No significant forced oscillation detected")
-    original_img = plot_signal(signal, time, start_time, end_time, SID=1, plot_type='original')
-    detrended_img = plot_signal(signal_detrended, time, start_time, end_time, SID=1, plot_type='detrended')
-    filtered_img = plot_signal(signal_filtered, time, start_time, end_time, SID=1, plot_type='filtered')
-    cwt_img = plot_cwt_power_with_anomalies(avg_power, time, SID=1, anomalies=anomalies)
-    def convert_to_base64(bytes_io):
-        bytes_io.seek(0)
-        return base64.b64encode(bytes_io.getvalue()).decode()
+def file_upload_or_404(db: Session, file_id: int):
+    file = crud.get_file_upload(db, file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+    return file
+
+async def locate_source_result(db: Session, file):
+    print(file.filename)
+
+    async def compute():
+        async with executor.slot("locate_source"):
+            # Read the columns the model uses into a columnar dataset
+            plan = await executor.run(feature_plans.get, *SOURCE_PLAN)
+            dataset = await executor.run(load_dataset, file, plan.columns)
+            predicted_class_str = await executor.run(predict_source, dataset)
+        return {"predicted_source": predicted_class_str}
+
+    return await memoized_result(db, file, "locate_source", {}, compute)
+
+async def locate_source_response(request: Request, db: Session, file):
+    return stored_response(request, await locate_source_result(db, file))
+
+@app.get("/api/locate_source")
+async def locate_source(request: Request, db: Session = Depends(get_db)):
+    # Most recent upload; the file id route below is safe with concurrent users and several workers
+    return await locate_source_response(request, db, latest_file_upload(db))
+
+@app.get("/api/locate_source/{file_id}")
+async def locate_source_for_file(file_id: int, request: Request, db: Session = Depends(get_db)):
+    return await locate_source_response(request, db, file_upload_or_404(db, file_id))
+
+@app.get("/api/locate_source/{file_id}/timeline")
+async def locate_source_timeline(file_id: int, request: Request, stride: int = config.TIMELINE_STRIDE,
+                                 db: Session = Depends(get_db)):
+    # Source over time for recordings longer than the model's window, e.g. a source that moves
+    if stride < 1:
+        raise HTTPException(status_code=400, detail="stride must be at least 1")
+    file = file_upload_or_404(db, file_id)
+
+    async def compute():
+        async with executor.slot("locate_source"):
+            plan = await executor.run(feature_plans.get, *SOURCE_PLAN)
+            dataset = await executor.run(load_dataset, file, plan.columns + ['Time'])
+            return await executor.run(predict_source_timeline, dataset, stride)
+
+    return await memoized_response(request, db, file, "locate_source_timeline", {"stride": stride}, compute)
+
+async def predict_class_result(db: Session, file):
+    print(file.filename)
+
+    async def compute():
+        async with executor.slot("predict_class"):
+            # Read the columns the model uses into a columnar dataset
+            plan = await executor.run(feature_plans.get, *DETECTION_PLAN)
+            dataset = await executor.run(load_dataset, file, plan.columns)
+            predicted_class_str = await executor.run(predict_detection_class, dataset)
+        return {"Predicted class": predicted_class_str}
+
+    return await memoized_result(db, file, "predict_class", {}, compute)
+
+async def predict_class_response(request: Request, db: Session, file):
+    return stored_response(request, await predict_class_result(db, file))
+
+@app.get("/api/predict_class")
+async def predict_class(request: Request, db: Session = Depends(get_db)):
+    return await predict_class_response(request, db, latest_file_upload(db))
+
+@app.get("/api/predict_class/{file_id}")
+async def predict_class_for_file(file_id: int, request: Request, db: Session = Depends(get_db)):
+    return await predict_class_response(request, db, file_upload_or_404(db, file_id))
+
+def duration_engine(engine):
+    engine = engine or config.DURATION_ENGINE
+    if engine not in DURATION_ENGINES:
+        raise HTTPException(status_code=400, detail=f"Unknown engine '{engine}', expected one of {list(DURATION_ENGINES)}")
+    return engine
+
+def screen_channels(signals, time):
+    # Spectral pre-screen of every column of ``signals``; see spectral.spectral_screen
+    try:
+        return configured_screen(signals, time)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Spectral screen failed: {e}")
+
+async def analyse_duration(dataset, engine, screen=True):
+    # Pipeline outputs are reused by the numeric response and every plot of the same upload.
+    # With ``screen``, a recording without a clear spectral peak skips the CWT and anomaly stages
+    # and its result holds only the screen (the other entries are None).
+    key = (dataset.content_hash, 'P1', config.CWT_BACKEND, config.CWT_DTYPE, engine,
+           screen and (config.SCREEN_BAND_HZ, config.SCREEN_SEGMENT_SECONDS, config.SCREEN_MIN_PEAK_RATIO))
+    result = duration_cache.get(key)
+    if result is None:
+        # Plots rendered side by side ask for the same pipeline run at once; it runs once
+        result = await duration_in_flight.run(key, lambda: run_duration_stages(dataset, engine, screen, key))
+    return result
+
+async def run_duration_stages(dataset, engine, screen, key):
+    screened = None
+    if screen:
+        with stage("screen"):
+            screened = (await executor.run(screen_channels, dataset['P1'], dataset['Time']))[0]
+    if screened is not None and not screened["passed"]:
+        result = (None, None, None, None, None, screened)
+    else:
+        # Same steps as run_duration_pipeline, submitted separately so each stage is timed
+        with stage("cwt"):
+            avg_power, signal_filtered, signal_detrended = await executor.run_cpu(
+                detect_oscillation_start_cwt, dataset['P1'], CWT_SCALES,
+                cwt_backend=config.CWT_BACKEND, dtype=config.CWT_DTYPE)
+        with stage("anomaly"):
+            anomalies, window = await executor.run_cpu(
+                detect_anomaly_window, avg_power, dataset['Time'], CONTAMINATION_VALUES,
+                MIN_ANOMALY_DURATION, MIN_POWER_THRESHOLD, engine)
+        result = (avg_power, signal_filtered, signal_detrended, anomalies, window, screened)
+    duration_cache.put(key, result)
+    return result
+
+def duration_window(result):
+    window = result[4]
+    return window if window is not None else (0, 0, 0)
+
+async def render_duration_plot(dataset, result, plot_type, start_time, end_time, engine):
+    key = (dataset.content_hash, plot_type, float(start_time), float(end_time), engine)
+    png = plot_cache.get(key)
+    if png is None:
+        anomalies = result[3]
+        if plot_type != 'original_signal' and result[0] is None:
+            # Screened out: the derived series were never computed, so compute them for the plot.
+            # Nothing was detected, so no anomalies are marked on the power
+            result = await analyse_duration(dataset, engine, screen=False)
+            anomalies = np.ones(len(result[0]), dtype=int)
+        avg_power, signal_filtered, signal_detrended, _, _, _ = result
+        series = {
+            'original_signal': dataset['P1'],
+            'detrended_signal': signal_detrended,
+            'filtered_signal': signal_filtered,
+            'cwt_power_with_anomalies': avg_power,
+        }[plot_type]
+        with stage("render"):
+            png = await executor.run_cpu(
+                render_plot, plot_type, dataset['Time'], series, start_time, end_time, anomalies=anomalies)
+        plot_cache.put(key, png)
+    return png
+
+def duration_params(**extra):
+    # Everything besides the input content that the duration response depends on
     return {
-        "start_time": start_time,
-        "end_time": end_time,
-        "duration": duration,
-         "original_signal": convert_to_base64(original_img),
-        "detrended_signal": convert_to_base64(detrended_img),
-        "filtered_signal": convert_to_base64(filtered_img),
-        "cwt_power_with_anomalies": convert_to_base64(cwt_img)
+        "channel": "P1",
+        "scales": CWT_SCALES.tolist(),
+        "contamination": np.round(CONTAMINATION_VALUES, 6).tolist(),
+        "min_power_threshold": MIN_POWER_THRESHOLD,
+        "min_anomaly_duration": MIN_ANOMALY_DURATION,
+        "cwt_backend": config.CWT_BACKEND,
+        "dtype": config.CWT_DTYPE,
+        "screen_band_hz": list(config.SCREEN_BAND_HZ),
+        "screen_segment_seconds": config.SCREEN_SEGMENT_SECONDS,
+        "screen_min_peak_ratio": config.SCREEN_MIN_PEAK_RATIO,
+        **extra,
     }
-    
+
+async def detect_duration_result(db: Session, file, plots, engine):
+    engine = duration_engine(engine)
+
+    async def compute():
+        async with executor.slot("detect_duration"):
+            dataset = await executor.run(load_dataset, file, DURATION_COLUMNS)
+            result = await analyse_duration(dataset, engine)
+            start_time, end_time, duration = duration_window(result)
+            screened = result[5]
+
+            response = {
+                "start_time": start_time,
+                "end_time": end_time,
+                "duration": duration,
+                "engine": engine,
+                # Only meaningful when the screen found a clear peak
+                "dominant_frequency": screened["dominant_frequency"] if screened["passed"] else None,
+                "screen": {
+                    "peak_ratio": screened["peak_ratio"],
+                    "band_energy": screened["band_energy"],
+                    "band_energy_ratio": screened["band_energy_ratio"],
+                    "skipped_channels": 0 if screened["passed"] else 1,
+                },
+            }
+            if not plots:
+                # Numeric-only: nothing is rendered, the plots can be fetched on demand
+                response["plot_urls"] = {
+                    plot_type: f"/api/plots/{file.id}/{plot_type}?engine={engine}" for plot_type in PLOT_TYPES
+                }
+                return response
+
+            images = await asyncio.gather(*(
+                render_duration_plot(dataset, result, plot_type, start_time, end_time, engine)
+                for plot_type in PLOT_TYPES
+            ))
+
+        response.update({
+            plot_type: base64.b64encode(png).decode() for plot_type, png in zip(PLOT_TYPES, images)
+        })
+        return response
+
+    return await memoized_result(db, file, "detect_duration", detect_duration_params(file, plots, engine), compute)
+
+def detect_duration_params(file, plots, engine):
+    # plot_urls embed the file id, so numeric-only results are stored per file
+    return duration_params(plots=plots, engine=engine, file_id=None if plots else file.id)
+
+async def detect_duration_response(request: Request, db: Session, file, plots, engine):
+    return stored_response(request, await detect_duration_result(db, file, plots, engine))
+
+@app.get("/api/detect_duration")
+async def detect_duration(request: Request, plots: bool = True, engine: Optional[str] = None,
+                          db: Session = Depends(get_db)):
+    return await detect_duration_response(request, db, latest_file_upload(db), plots, engine)
+
+@app.get("/api/detect_duration/{file_id}")
+async def detect_duration_for_file(file_id: int, request: Request, plots: bool = True, engine: Optional[str] = None,
+                                   db: Session = Depends(get_db)):
+    return await detect_duration_response(request, db, file_upload_or_404(db, file_id), plots, engine)
+
+@app.get("/api/plots/{file_id}/{plot_type}")
+async def duration_plot(file_id: int, plot_type: str, start_time: Optional[float] = None,
+                        end_time: Optional[float] = None, engine: Optional[str] = None,
+                        db: Session = Depends(get_db)):
+    if plot_type not in PLOT_TYPES:
+        raise HTTPException(status_code=404, detail=f"Unknown plot type, expected one of {list(PLOT_TYPES)}")
+    engine = duration_engine(engine)
+    file = file_upload_or_404(db, file_id)
+
+    async with executor.slot("plots"):
+        dataset = await executor.run(load_dataset, file, DURATION_COLUMNS)
+        result = await analyse_duration(dataset, engine)
+        detected_start, detected_end, _ = duration_window(result)
+        png = await render_duration_plot(
+            dataset, result, plot_type,
+            detected_start if start_time is None else start_time,
+            detected_end if end_time is None else end_time,
+            engine,
+        )
+    return Response(content=png, media_type="image/png", headers={"Cache-Control": "private, max-age=3600"})
+
+def sse_event(event, data):
+    # One Server-Sent Events message
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+async def timed_step(name, fn):
+    """Await ``fn()`` under a trace of its own; returns its value, its seconds and its stage totals."""
+    trace, token = metrics.start_trace("STREAM", name)
+    try:
+        value = await fn()
+    finally:
+        metrics.end_trace(token)
+    return value, time.perf_counter() - trace.started, trace.totals()
+
+def step_timing(seconds, stages, started):
+    return {
+        "seconds": round(seconds, 6),
+        # Since the stream opened, i.e. when the client got this result
+        "elapsed": round(time.perf_counter() - started, 6),
+        "stages": {name: round(total, 6) for name, total in stages.items()},
+    }
+
+def step_error(step, e):
+    status_code = 429 if isinstance(e, ExecutorSaturated) else e.status_code
+    detail = str(e) if isinstance(e, ExecutorSaturated) else e.detail
+    return sse_event("error", {"step": step, "status_code": status_code, "detail": detail})
+
+async def analysis_events(file_id, plots, engine):
+    """
+    The whole analysis of an upload as Server-Sent Events, each sent as soon as it is ready:
+    ``predict_class``, ``locate_source``, ``duration`` (start/end/duration without plots),
+    then one ``plot`` per plot type in the order they finish rendering, then ``done``.
+
+    Every event carries a ``timing`` block (seconds for that step, seconds since the stream
+    opened, stage totals). Results come from, and are stored in, the results table like the
+    GETs, so a finished stream also makes the full ``/api/detect_duration`` answer a lookup.
+    A step that fails sends an ``error`` event and the stream moves on.
+    """
+    started = time.perf_counter()
+    errors = 0
+    with SessionLocal() as db:
+        file = file_upload_or_404(db, file_id)
+        steps = [
+            ("predict_class", lambda: predict_class_result(db, file)),
+            ("locate_source", lambda: locate_source_result(db, file)),
+            ("duration", lambda: detect_duration_result(db, file, False, engine)),
+        ]
+        duration_ok = False
+        for event, fn in steps:
+            try:
+                stored, seconds, stages = await timed_step(event, fn)
+            except (HTTPException, ExecutorSaturated) as e:
+                errors += 1
+                yield step_error(event, e)
+                continue
+            duration_ok = event == "duration"
+            yield sse_event(event, {**json.loads(stored.result), "timing": step_timing(seconds, stages, started)})
+
+        if plots and duration_ok:
+            async for message in plot_events(db, file, engine, started):
+                errors += message.startswith("event: error")
+                yield message
+
+    yield sse_event("done", {"file_id": file_id, "errors": errors,
+                             "timing": step_timing(time.perf_counter() - started, {}, started)})
+
+async def plot_events(db: Session, file, engine, started):
+    full_key = await executor.run(result_key, file, "detect_duration", detect_duration_params(file, True, engine))
+    stored = await executor.run(stored_result, db, full_key)
+    if stored is not None:
+        # Already rendered by an earlier request, stream or pre-analysis job
+        result = json.loads(stored.result)
+        for plot_type in PLOT_TYPES:
+            yield sse_event("plot", {"plot_type": plot_type, "image": result[plot_type],
+                                     "timing": step_timing(0.0, {}, started)})
+        return
+
+    async def render(plot_type):
+        async def fn():
+            dataset = await executor.run(load_dataset, file, DURATION_COLUMNS)
+            result = await analyse_duration(dataset, engine)
+            start_time, end_time, _ = duration_window(result)
+            return await render_duration_plot(dataset, result, plot_type, start_time, end_time, engine)
+
+        try:
+            return plot_type, await timed_step(plot_type, fn), None
+        except (HTTPException, ExecutorSaturated) as e:
+            return plot_type, None, e
+
+    tasks, failed = [], False
+    try:
+        async with executor.slot("plots"):
+            tasks += [asyncio.ensure_future(render(plot_type)) for plot_type in PLOT_TYPES]
+            for next_done in asyncio.as_completed(tasks):
+                plot_type, rendered, error = await next_done
+                if error is not None:
+                    failed = True
+                    yield step_error(plot_type, error)
+                    continue
+                png, seconds, stages = rendered
+                yield sse_event("plot", {"plot_type": plot_type, "image": base64.b64encode(png).decode(),
+                                         "timing": step_timing(seconds, stages, started)})
+    except ExecutorSaturated as e:
+        yield step_error("plots", e)
+        return
+    finally:
+        # The client went away: stop rendering what it will never read
+        for task in tasks:
+            task.cancel()
+
+    if not failed:
+        # The plots are in the plot cache now, so this only assembles and stores the full result
+        await detect_duration_result(db, file, True, engine)
+
+def analysis_stream_response(file, plots, engine):
+    return StreamingResponse(
+        analysis_events(file.id, plots, engine),
+        media_type="text/event-stream",
+        # No caching or proxy buffering, or the events arrive all at once at the end
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/analysis/stream")
+async def analysis_stream(plots: bool = True, engine: Optional[str] = None, db: Session = Depends(get_db)):
+    return analysis_stream_response(latest_file_upload(db), plots, duration_engine(engine))
+
+@app.get("/api/analysis/{file_id}/stream")
+async def analysis_stream_for_file(file_id: int, plots: bool = True, engine: Optional[str] = None,
+                                   db: Session = Depends(get_db)):
+    return analysis_stream_response(file_upload_or_404(db, file_id), plots, duration_engine(engine))
+
+def detect_channel_windows(dataset, channels):
+    if not channels:
+        raise HTTPException(status_code=400, detail="No channels selected")
+    if 'Time' not in dataset or not all(channel in dataset for channel in channels):
+        raise HTTPException(status_code=400, detail="Selected columns not found in the data file")
+
+    time = dataset['Time']
+    signals = dataset.stack(channels)
+
+    # One spectral pass over every channel; only those with a clear peak go through the CWT and Isolation Forest
+    with stage("screen"):
+        screens = screen_channels(signals, time)
+    passed = [i for i, screened in enumerate(screens) if screened["passed"]]
+    results = {}
+    if passed:
+        windows = detect_oscillation_windows_multichannel(
+            signals[:, passed], time, CWT_SCALES, CONTAMINATION_VALUES,
+            min_power_threshold=MIN_POWER_THRESHOLD,
+            min_anomaly_duration=MIN_ANOMALY_DURATION,
+            cwt_backend=config.CWT_BACKEND,
+            dtype=config.CWT_DTYPE,
+            executor=get_channel_pool(),
+        )
+        results = dict(zip(passed, windows))
+
+    channel_results = []
+    for i, (channel, screened) in enumerate(zip(channels, screens)):
+        window, best_contamination = results.get(i, (None, None))
+        start_time, end_time, duration = window if window is not None else (None, None, None)
+        channel_results.append({
+            "channel": channel,
+            "detected": window is not None,
+            "start_time": start_time,
+            "end_time": end_time,
+            "duration": duration,
+            "contamination": best_contamination,
+            "screened_out": not screened["passed"],
+            "dominant_frequency": screened["dominant_frequency"] if screened["passed"] else None,
+            "peak_ratio": screened["peak_ratio"],
+            "band_energy": screened["band_energy"],
+        })
+    return channel_results
+
+@app.post("/api/detect_duration/channels")
+async def detect_duration_channels(options: AnalysisOptions, db: Session = Depends(get_db)):
+    return await detect_duration_channels_response(latest_file_upload(db), options)
+
+@app.post("/api/detect_duration/channels/{file_id}")
+async def detect_duration_channels_for_file(file_id: int, options: AnalysisOptions, db: Session = Depends(get_db)):
+    return await detect_duration_channels_response(file_upload_or_404(db, file_id), options)
+
+async def detect_duration_channels_response(file, options: AnalysisOptions):
+    async with executor.slot("detect_duration_channels"):
+        dataset = await executor.run(load_dataset, file, ['Time'] + select_channels(options))
+        with stage("detect_channels"):
+            channel_results = await executor.run(detect_channel_windows, dataset, select_channels(options))
+
+    # Frequency of the channel with the clearest spectral peak
+    strongest = max(channel_results, key=lambda result: result["peak_ratio"])
+    return {
+        "channels": channel_results,
+        "oscillating_channels": [result["channel"] for result in channel_results if result["detected"]],
+        "dominant_frequency": strongest["dominant_frequency"],
+        "skipped_channels": sum(result["screened_out"] for result in channel_results),
+    }
+
+def push_stream_chunk(stream_id: str, chunk: StreamChunk):
+    if len(chunk.values) > config.STREAM_MAX_CHUNK:
+        raise ValueError(f"Chunk exceeds {config.STREAM_MAX_CHUNK} samples")
+    detector = stream_registry.get_or_create(stream_id)
+    events = detector.push(chunk.time, chunk.values)
+    return {"events": events, **detector.status()}
+
+@app.post("/api/stream/{stream_id}")
+async def open_stream(stream_id: str, options: StreamOptions):
+    try:
+        detector = stream_registry.create(
+            stream_id,
+            scales=np.arange(1, options.max_scale + 1),
+            hop=options.hop,
+            window=options.window,
+            warmup=options.warmup,
+            on_ratio=options.on_ratio,
+            off_ratio=options.off_ratio,
+            hold_samples=options.hold_samples,
+            cwt_backend=config.CWT_BACKEND,
+        )
+    except OverflowError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"stream_id": stream_id, **detector.status()}
+
+@app.post("/api/stream/{stream_id}/samples")
+async def append_stream_samples(stream_id: str, chunk: StreamChunk):
+    try:
+        async with executor.slot("stream"):
+            return await executor.run(push_stream_chunk, stream_id, chunk)
+    except OverflowError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.websocket("/api/stream/{stream_id}/ws")
+async def stream_websocket(websocket: WebSocket, stream_id: str):
+    # Each message is a StreamChunk; the reply carries any start/end events it completed
+    await websocket.accept()
+    try:
+        while True:
+            message = await websocket.receive_json()
+            try:
+                async with executor.slot("stream"):
+                    reply = await executor.run(push_stream_chunk, stream_id, StreamChunk(**message))
+            except (ExecutorSaturated, OverflowError, ValueError, TypeError) as e:
+                reply = {"error": str(e)}
+            await websocket.send_json(reply)
+    except WebSocketDisconnect:
+        pass
+
+@app.get("/api/stream/{stream_id}")
+async def stream_status(stream_id: str):
+    detector = stream_registry.get(stream_id)
+    if detector is None:
+        raise HTTPException(status_code=404, detail="Stream not found")
+    return {"stream_id": stream_id, **detector.status()}
+
+@app.delete("/api/stream/{stream_id}")
+async def close_stream(stream_id: str):
+    if not stream_registry.remove(stream_id):
+        raise HTTPException(status_code=404, detail="Stream not found")
+    return {"message": "Stream closed"}
+
 @app.delete("/api/files/clear")
 async def delete_all_files(db: Session = Depends(get_db)):
     try:
+        # Stop background work on the files first; requests waiting on it get a 409
+        cancelled_jobs = preanalysis_jobs.cancel_all()
+        in_flight.cancel_all()
         crud.delete_all_files(db)
-        return {"message": "All files deleted successfully"}
+        crud.delete_analysis_results(db)
+        blob_store.clear()
+        dataset_cache.clear()
+        duration_cache.clear()
+        plot_cache.clear()
+        return {"message": "All files deleted successfully", "cancelled_jobs": cancelled_jobs}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+def collect_runtime_metrics():
+    caches = {
+        "datasets": dataset_cache,
+        "duration_results": duration_cache,
+        "plots": plot_cache,
+    }
+    hits = metrics.Counter("fo_cache_hits_total", "In-memory cache hits", ("cache",))
+    misses = metrics.Counter("fo_cache_misses_total", "In-memory cache misses", ("cache",))
+    evictions = metrics.Counter("fo_cache_evictions_total", "In-memory cache evictions", ("cache",))
+    hit_ratio = metrics.Gauge("fo_cache_hit_ratio", "Cache hits over lookups since startup", ("cache",))
+    cached_bytes = metrics.Gauge("fo_cache_bytes", "Bytes held by each cache", ("cache",))
+    for name, cache in caches.items():
+        cache_stats = cache.stats()
+        hits.inc(cache_stats["hits"], cache=name)
+        misses.inc(cache_stats["misses"], cache=name)
+        evictions.inc(cache_stats["evictions"], cache=name)
+        hit_ratio.set(cache_stats["hit_rate"], cache=name)
+        cached_bytes.set(cache_stats["bytes"], cache=name)
+
+    running = metrics.Gauge("fo_endpoint_running", "Requests holding an executor slot", ("endpoint",))
+    waiting = metrics.Gauge("fo_endpoint_waiting", "Requests queued for an executor slot", ("endpoint",))
+    for endpoint, gate in executor.stats().items():
+        running.set(gate["running"], endpoint=endpoint)
+        waiting.set(gate["waiting"], endpoint=endpoint)
+
+    streams = metrics.Gauge("fo_streams_open", "Open streaming detectors")
+    streams.set(len(stream_registry))
+
+    jobs = metrics.Gauge("fo_preanalysis_jobs", "Pre-analysis jobs by state", ("state",))
+    for state, count in preanalysis_jobs.stats().items():
+        jobs.set(count, state=state)
+    computing = metrics.Gauge("fo_results_in_flight", "Results being computed, shared by everyone waiting on them")
+    computing.set(len(in_flight))
+    return [hits, misses, evictions, hit_ratio, cached_bytes, running, waiting, streams, jobs, computing]
+
+metrics.registry.add_collector(collect_runtime_metrics)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/cache/stats")
+async def cache_stats(db: Session = Depends(get_db)):
+    return {
+        "datasets": dataset_cache.stats(),
+        "duration_results": duration_cache.stats(),
+        "plots": plot_cache.stats(),
+        "cwt_kernels": cwt_kernel_cache.stats(),
+        "stored_results": {
+            "rows": crud.count_analysis_results(db),
+            "max_rows": config.RESULTS_MAX_ROWS,
+            "max_age_seconds": config.RESULTS_MAX_AGE_SECONDS,
+        },
+    }
+
+@app.delete("/api/results")
+async def clear_results(endpoint: Optional[str] = None, db: Session = Depends(get_db)):
+    deleted = crud.delete_analysis_results(db, None if endpoint is None else [endpoint])
+    return {"deleted": deleted}
+
+@app.get("/api/models")
+async def model_stats():
+    return models.stats()
+
+@app.post("/api/models/{name}/reload")
+async def reload_model(name: str, filename: Optional[str] = None, db: Session = Depends(get_db)):
+    # Hot-swap: load the artifact again (or another file from the model directory) and switch over
+    try:
+        artifact = await executor.run(models.reload, name, filename)
+    except (KeyError, FileNotFoundError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Stored results are keyed by model digest already; dropping them just frees the rows early
+    crud.delete_analysis_results(db, [endpoint for endpoint, names in RESULT_MODELS.items() if name in names])
+    return artifact
+
+@app.get("/api/executor/stats")
+async def executor_stats():
+    return executor.stats()
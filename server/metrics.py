@@ -0,0 +1,263 @@
+# metrics.py
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Seconds; spans cache hits (sub-millisecond) up to cold kaleido renders and full pipelines
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values.items()
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # Per-bucket counts (the last one is +Inf), then sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def render(self):
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        lines = self.header()
+        for key, counts in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {counts[-1]!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Metrics rendered in the Prometheus text exposition format.
+
+    Besides the registered metrics, collectors (zero-argument callables
+    returning freshly built metrics) are called at scrape time, for values
+    that already live elsewhere such as cache statistics.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for collector in self._collectors:
+            for metric in collector():
+                lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+REQUEST_SECONDS = registry.histogram(
+    "fo_request_seconds", "HTTP request latency by route", ("method", "route", "status"))
+STAGE_SECONDS = registry.histogram(
+    "fo_stage_seconds", "Latency of individual pipeline stages and DB queries", ("stage",))
+REQUESTS_IN_FLIGHT = registry.gauge(
+    "fo_requests_in_flight", "HTTP requests currently being handled", ("method",))
+
+
+class RequestTrace:
+    """Stage timings collected while one request is handled."""
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.stages = []
+
+    def add(self, name, seconds):
+        self.stages.append((name, seconds))
+
+    def totals(self):
+        totals = {}
+        for name, seconds in self.stages:
+            totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def server_timing(self):
+        """Stage totals as a Server-Timing header value, readable in browser dev tools."""
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.totals().items())
+
+
+_current_trace = ContextVar("fo_request_trace", default=None)
+
+
+def start_trace(method, path):
+    trace = RequestTrace(method, path)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a block as pipeline stage ``name``.
+
+    The timing goes to the stage histogram and, when called while handling a
+    request (including from executor threads, which inherit the request
+    context), to that request's trace.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, elapsed)
+
+
+def instrument_engine(engine):
+    """Time every SQL statement run through ``engine`` as stage 'db'."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("fo_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["fo_query_start"].pop()
+        STAGE_SECONDS.observe(elapsed, stage="db")
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add("db", elapsed)
+
+
+class TraceLog:
+    """
+    Writes one JSON line per request with its stage breakdown.
+
+    ``destination`` is a file path, '-' for stdout, or empty to disable.
+    """
+
+    def __init__(self, destination):
+        self.destination = destination
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.destination)
+
+    def write(self, trace, route, status, seconds):
+        if not self.enabled:
+            return
+        line = json.dumps({
+            "time": time.time(),
+            "method": trace.method,
+            "path": trace.path,
+            "route": route,
+            "status": status,
+            "seconds": round(seconds, 6),
+            "stages": [{"stage": name, "seconds": round(elapsed, 6)} for name, elapsed in trace.stages],
+            "stage_totals": {name: round(total, 6) for name, total in trace.totals().items()},
+        })
+        with self._lock:
+            if self.destination == "-":
+                print(line, flush=True)
+            else:
+                with open(self.destination, "a") as f:
+                    f.write(line + "\n")
@@ -0,0 +1,231 @@
+# model_registry.py
+
+import hashlib
+import importlib
+import os
+import pickle
+import sys
+import threading
+import time
+
+import numpy as np
+
+# XGBoost artifacts can also be stored in XGBoost's own format, which loads
+# without unpickling the sklearn wrapper and survives library upgrades
+NATIVE_EXTENSIONS = ('.ubj', '.json')
+
+ARTIFACTS = {
+    "xgb_model_weighted": "xgb",
+    "xgb_model_weighted_detection": "xgb",
+    "label_encoder": "pickle",
+    "label_encoder_detection": "pickle",
+    "scaler": "pickle",
+    "rf_feature_importances": "pickle",
+    "rf_feature_importances_detection": "pickle",
+}
+
+
+# Class each artifact must load as; a load (or hot-swap) of anything else is refused
+ARTIFACT_TYPES = {
+    "xgb_model_weighted": ("xgboost", "XGBClassifier"),
+    "xgb_model_weighted_detection": ("xgboost", "XGBClassifier"),
+    "label_encoder": ("sklearn.preprocessing", "LabelEncoder"),
+    "label_encoder_detection": ("sklearn.preprocessing", "LabelEncoder"),
+    "scaler": ("sklearn.preprocessing", "StandardScaler"),
+    "rf_feature_importances": ("numpy", "ndarray"),
+    "rf_feature_importances_detection": ("numpy", "ndarray"),
+}
+
+
+def _check_type(name, obj):
+    expected = ARTIFACT_TYPES.get(name)
+    if expected is None:
+        return
+    module, cls = expected
+    if not isinstance(obj, getattr(importlib.import_module(module), cls)):
+        raise ValueError(f"'{name}' must be a {module}.{cls}, "
+                         f"the file holds a {type(obj).__module__}.{type(obj).__name__}")
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def _approx_nbytes(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if hasattr(obj, "get_booster"):
+        return len(obj.get_booster().save_raw())
+    return len(pickle.dumps(obj))
+
+
+def _load_native_xgb(path):
+    import xgboost as xgb
+
+    model = xgb.XGBClassifier()
+    model.load_model(path)
+    return model
+
+
+class LoadedArtifact:
+    def __init__(self, name, obj, path, fmt, load_seconds, version):
+        self.name = name
+        self.obj = obj
+        self.path = path
+        self.format = fmt
+        self.load_seconds = load_seconds
+        self.version = version
+        self.digest = _file_digest(path)
+        self.approx_bytes = _approx_nbytes(obj)
+        self.loaded_at = time.time()
+
+    def describe(self):
+        return {
+            "name": self.name,
+            "loaded": True,
+            "path": os.path.basename(self.path),
+            "format": self.format,
+            "version": self.version,
+            "digest": self.digest,
+            "load_seconds": self.load_seconds,
+            "approx_bytes": self.approx_bytes,
+        }
+
+
+class ModelRegistry:
+    """
+    Loads model artifacts on first use instead of at import time.
+
+    ``get(name)`` returns the loaded object, loading it if needed; concurrent
+    callers wait for the same load. ``warm_up()`` loads everything, optionally
+    in a background thread so startup isn't delayed. ``reload(name)`` loads a
+    new version of an artifact from disk and swaps it in atomically; requests
+    already holding the old object finish with it. A reload only reads the
+    artifact's own files (see ``filenames``) and refuses an object of the
+    wrong type, leaving the current version in place.
+
+    ``prefer`` selects the XGBoost file format: 'native' uses <name>.ubj or
+    <name>.json when present, 'pickle' always uses <name>.pkl.
+    """
+
+    def __init__(self, base_dir, artifacts=ARTIFACTS, prefer="native"):
+        self.base_dir = base_dir
+        self.artifacts = dict(artifacts)
+        self.prefer = prefer
+        self._loaded = {}
+        self._locks = {name: threading.Lock() for name in self.artifacts}
+        self._versions = {name: 0 for name in self.artifacts}
+        self._warmup_thread = None
+
+    def filenames(self, name):
+        """The files an artifact may be loaded from: <name>.pkl, plus the native formats for XGBoost models."""
+        native = [name + ext for ext in NATIVE_EXTENSIONS] if self.artifacts[name] == "xgb" else []
+        return [name + ".pkl"] + native
+
+    def _resolve(self, name, filename=None):
+        if filename is not None:
+            # Only this artifact's own files, so a reload can't install some other pickle under its name
+            allowed = self.filenames(name)
+            if filename not in allowed:
+                raise ValueError(f"'{name}' can only be loaded from {', '.join(allowed)}")
+            path = os.path.join(self.base_dir, filename)
+            if not os.path.exists(path):
+                raise FileNotFoundError(filename)
+            return path
+        if self.artifacts[name] == "xgb" and self.prefer == "native":
+            for ext in NATIVE_EXTENSIONS:
+                path = os.path.join(self.base_dir, name + ext)
+                if os.path.exists(path):
+                    return path
+        return os.path.join(self.base_dir, name + ".pkl")
+
+    def _load(self, name, filename=None):
+        path = self._resolve(name, filename)
+        start = time.perf_counter()
+        if path.endswith(NATIVE_EXTENSIONS):
+            obj, fmt = _load_native_xgb(path), "xgboost-" + path.rsplit(".", 1)[1]
+        else:
+            with open(path, "rb") as f:
+                obj, fmt = pickle.load(f), "pickle"
+        load_seconds = time.perf_counter() - start
+        _check_type(name, obj)
+        self._versions[name] += 1
+        return LoadedArtifact(name, obj, path, fmt, load_seconds, self._versions[name])
+
+    def _artifact(self, name):
+        if name not in self.artifacts:
+            raise KeyError(f"Unknown model artifact '{name}'")
+        artifact = self._loaded.get(name)
+        if artifact is None:
+            with self._locks[name]:
+                artifact = self._loaded.get(name)
+                if artifact is None:
+                    artifact = self._loaded[name] = self._load(name)
+        return artifact
+
+    def get(self, name):
+        return self._artifact(name).obj
+
+    def version(self, name):
+        """Version tag of an artifact: load counter plus file digest."""
+        artifact = self._artifact(name)
+        return f"{artifact.version}:{artifact.digest}"
+
+    def digest(self, name):
+        """Digest of the artifact file currently in use; unlike version() it is stable across restarts."""
+        return self._artifact(name).digest
+
+    def reload(self, name, filename=None):
+        if name not in self.artifacts:
+            raise KeyError(f"Unknown model artifact '{name}'")
+        with self._locks[name]:
+            # Load fully before swapping so readers never see a half-loaded model
+            artifact = self._load(name, filename)
+            self._loaded[name] = artifact
+        return artifact.describe()
+
+    def warm_up(self, background=True):
+        def load_all():
+            for name in self.artifacts:
+                try:
+                    self._artifact(name)
+                except Exception as e:
+                    print(f"Model warm-up failed for {name}: {e}")
+
+        if not background:
+            load_all()
+            return None
+        self._warmup_thread = threading.Thread(target=load_all, name="model-warmup", daemon=True)
+        self._warmup_thread.start()
+        return self._warmup_thread
+
+    def stats(self):
+        stats = []
+        for name in self.artifacts:
+            artifact = self._loaded.get(name)
+            stats.append(artifact.describe() if artifact is not None else {"name": name, "loaded": False})
+        return stats
+
+
+def export_native(base_dir, fmt="ubj"):
+    """Write every pickled XGBoost artifact in ``base_dir`` out in XGBoost's native format."""
+    registry = ModelRegistry(base_dir, prefer="pickle")
+    written = []
+    for name, kind in ARTIFACTS.items():
+        if kind != "xgb":
+            continue
+        path = os.path.join(base_dir, f"{name}.{fmt}")
+        registry.get(name).save_model(path)
+        written.append(path)
+    return written
+
+
+if __name__ == "__main__":
+    # python model_registry.py [ubj|json] -> convert the pickled XGBoost models next to this file
+    target = sys.argv[1] if len(sys.argv) > 1 else "ubj"
+    for path in export_native(os.path.dirname(os.path.abspath(__file__)), target):
+        print(f"Wrote {path}")
@@ -1,6 +1,7 @@
 # models.py
 
-from sqlalchemy import Column, Integer, String, LargeBinary, DateTime
+from sqlalchemy import Column, Integer, String, LargeBinary, Text, DateTime, UniqueConstraint
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from database import Base
 
@@ -9,5 +10,27 @@ class FileUpload(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, index=True)
-    content = Column(LargeBinary)
-    uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    # Upload bytes live in the blob store under content_hash; content only holds rows from older databases
+    content = deferred(Column(LargeBinary, nullable=True))
+    content_hash = Column(String(64), index=True)
+    # Format of the stored blob (see formats.UPLOAD_FORMATS); xlsx uploads are stored converted to 'pmu'
+    format = Column(String)
+    # Digest of the bytes as uploaded, which differs from content_hash when the upload was converted
+    source_hash = Column(String(64), index=True)
+    size = Column(Integer)
+    uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class AnalysisResult(Base):
+    __tablename__ = "analysis_results"
+    # One stored response per input content, endpoint, parameter set and model version
+    __table_args__ = (UniqueConstraint("content_hash", "endpoint", "params_key", "model_version"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), index=True)
+    endpoint = Column(String, index=True)
+    params_key = Column(String(64))
+    model_version = Column(String)
+    result = deferred(Column(Text))  # JSON response body
+    etag = Column(String(64))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_accessed_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
@@ -0,0 +1,156 @@
+# preanalysis.py
+
+import asyncio
+import time
+
+import metrics
+
+
+class AnalysisCancelled(Exception):
+    """Raised to callers waiting on a computation that was cancelled, e.g. by /api/files/clear."""
+
+
+class InFlight:
+    """
+    Single-flight map of running computations.
+
+    ``run(key, fn)`` starts ``fn()`` as a task unless one is already running
+    under ``key``, and awaits it either way, so a request arriving while the
+    same result is being computed (by a pre-analysis job or another request)
+    waits for it instead of starting a second computation. A caller that
+    gives up doesn't cancel the task; ``cancel_all()`` does.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    async def run(self, key, fn):
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._tasks.pop(key, None) if self._tasks.get(key) is done else None)
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                # The computation itself was cancelled, not this caller
+                raise AnalysisCancelled("The analysis was cancelled")
+            raise
+
+    def cancel_all(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        self._tasks.clear()
+        return len(tasks)
+
+    def __len__(self):
+        return len(self._tasks)
+
+
+class PreAnalysisJob:
+    def __init__(self, file_id, steps):
+        self.file_id = file_id
+        self.steps = {name: {"state": "queued"} for name in steps}
+        self.state = "queued"
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stages = {}
+        self.task = None
+
+    def describe(self):
+        return {
+            "file_id": self.file_id,
+            "state": self.state,
+            "steps": self.steps,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            # Seconds per pipeline stage (parse, features, predict, screen, cwt, ...) run by this job
+            "stages": self.stages,
+        }
+
+
+class PreAnalysisJobs:
+    """
+    Background analysis of uploads, so the results are ready before they are asked for.
+
+    ``submit(file_id, steps)`` queues a job running each (name, coroutine
+    function) step in order; at most ``concurrency`` jobs run at once. A
+    step that fails is recorded and the job moves on to the next one.
+    ``cancel_all()`` cancels queued and running jobs. Finished jobs are kept
+    for status queries, up to ``max_jobs``.
+    """
+
+    def __init__(self, concurrency=1, max_jobs=1000):
+        self.concurrency = concurrency
+        self.max_jobs = max_jobs
+        self._jobs = {}
+        self._semaphore = None
+
+    def submit(self, file_id, steps):
+        job = self._jobs.get(file_id)
+        if job is not None and job.state in ("queued", "running", "done"):
+            return job
+        if self._semaphore is None:
+            # Created on first use, inside the event loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        job = self._jobs[file_id] = PreAnalysisJob(file_id, [name for name, _ in steps])
+        job.task = asyncio.ensure_future(self._run(job, steps))
+        self._prune()
+        return job
+
+    async def _run(self, job, steps):
+        trace, token = metrics.start_trace("PREANALYZE", f"/api/files/{job.file_id}")
+        try:
+            async with self._semaphore:
+                job.state, job.started_at = "running", time.time()
+                failed = False
+                for name, step in steps:
+                    job.steps[name] = {"state": "running"}
+                    started = time.perf_counter()
+                    try:
+                        await step()
+                        job.steps[name] = {"state": "done", "seconds": time.perf_counter() - started}
+                    except (asyncio.CancelledError, AnalysisCancelled):
+                        job.steps[name] = {"state": "cancelled"}
+                        raise
+                    except Exception as e:
+                        failed = True
+                        detail = getattr(e, "detail", None) or f"{type(e).__name__}: {e}"
+                        job.steps[name] = {"state": "failed", "error": str(detail)}
+                job.state = "failed" if failed else "done"
+        except (asyncio.CancelledError, AnalysisCancelled):
+            job.state = "cancelled"
+            for step in job.steps.values():
+                if step["state"] == "queued":
+                    step["state"] = "cancelled"
+        finally:
+            job.finished_at = time.time()
+            job.stages = trace.totals()
+            metrics.end_trace(token)
+
+    def get(self, file_id):
+        return self._jobs.get(file_id)
+
+    def cancel_all(self):
+        """Cancel every queued or running job and forget all jobs; returns how many were cancelled."""
+        cancelled = 0
+        for job in self._jobs.values():
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+                cancelled += 1
+        self._jobs.clear()
+        return cancelled
+
+    def _prune(self):
+        finished = [file_id for file_id, job in self._jobs.items() if job.state not in ("queued", "running")]
+        for file_id in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+            del self._jobs[file_id]
+
+    def stats(self):
+        states = {}
+        for job in self._jobs.values():
+            states[job.state] = states.get(job.state, 0) + 1
+        return states
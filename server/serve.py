@@ -0,0 +1,135 @@
+# serve.py
+"""
+Pre-fork server: load the app and every model once, then fork the workers.
+
+    cd server && python serve.py --workers 4 --port 8000
+
+The parent imports main (creating the database tables once), loads all model
+artifacts and feature plans, and freezes the garbage collector so those
+objects are never touched again. It then binds the listening socket and forks
+``--workers`` uvicorn workers that accept from it. The workers inherit the
+models through fork and share their memory pages copy-on-write instead of each
+unpickling a copy. A worker that dies is replaced; SIGINT/SIGTERM stop all
+of them.
+
+State that lives in process memory is per worker: the dataset, duration and
+plot caches, /metrics, live PMU streams, pre-analysis job status and
+/api/models/{name}/reload. Use the
+file id routes (/api/locate_source/{file_id}, ...) rather than "most recent
+upload" when several clients share the server, pin streaming clients to one
+worker (or run streams on a single worker), and size FO_EXECUTOR_WORKERS and
+the cache limits per worker. Stored results live in the shared SQLite
+database, so any worker serves a result another one computed.
+
+Measure scaling on the target machine with benchmarks/bench_workers.py.
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+
+import uvicorn
+
+import config
+
+
+def load_app():
+    """Import the app and load everything workers should share; runs once, in the parent."""
+    import database
+    import main
+
+    main.models.warm_up(background=False)
+    for plan in (main.SOURCE_PLAN, main.DETECTION_PLAN):
+        main.tree_predictors.compiled(plan[0], main.feature_plans.get(*plan))
+    # Connections must not be shared across fork; every worker opens its own
+    database.engine.dispose()
+    # Move everything allocated so far out of the collector's reach, so collections in the
+    # workers don't write to (and thereby copy) the shared pages
+    gc.freeze()
+    return main.app
+
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock, log_level):
+    # The lifespan's background warm-up finds every model already loaded
+    server = uvicorn.Server(uvicorn.Config(app, log_level=log_level, lifespan="on"))
+    server.run(sockets=[sock])
+
+
+def spawn(app, sock, log_level):
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        code = 0
+        try:
+            run_worker(app, sock, log_level)
+        except BaseException as e:
+            print(f"Worker {os.getpid()} failed: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def serve(workers, host, port, log_level="info"):
+    app = load_app()
+    sock = bind_socket(host, port)
+    print(f"Serving on {host}:{port} with {workers} worker(s), models loaded in parent {os.getpid()}")
+
+    children = set()
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for _ in range(workers):
+        children.add(spawn(app, sock, log_level))
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {status}, starting a replacement")
+            children.add(spawn(app, sock, log_level))
+    sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=config.SERVE_WORKERS)
+    parser.add_argument("--host", default=config.SERVE_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVE_PORT)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    if not hasattr(os, "fork"):
+        sys.exit("Pre-fork serving needs os.fork; run uvicorn main:app instead")
+    serve(args.workers, args.host, args.port, args.log_level)
+
+
+if __name__ == "__main__":
+    main()
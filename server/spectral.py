@@ -0,0 +1,99 @@
+# spectral.py
+
+import numpy as np
+from scipy.signal import spectrogram
+
+import config
+
+
+def sample_rate(time):
+    """Samples per second from a time column (seconds), robust to the odd repeated or dropped sample."""
+    step = np.median(np.diff(time))
+    if not step > 0:
+        raise ValueError("Time column must increase")
+    return 1.0 / step
+
+
+def spectral_screen(signals, time, band=(0.1, 5.0), segment_seconds=20.0, min_peak_ratio=0.0):
+    """
+    Cheap spectral check for a forced oscillation in every column of ``signals``.
+
+    One short-time spectrum (Hann windows of ``segment_seconds``, half
+    overlapping, linearly detrended) is computed for all channels at once.
+    In each window the strongest bin inside ``band`` is compared with the
+    median of the band: a sustained sinusoid gives a narrow peak far above
+    it, ambient noise and drift do not. The window with the highest ratio
+    counts, so an oscillation covering only part of the recording is not
+    averaged away.
+
+    Args:
+        signals: (samples x channels) array, or one channel
+        time: Time column in seconds
+        band: (low, high) oscillation band in Hz; high is clipped to Nyquist
+        segment_seconds: Window length; sets the frequency resolution (1 / segment_seconds Hz)
+        min_peak_ratio: Channels whose best peak-to-median ratio is below this are screened out
+
+    Returns:
+        list: Per channel, a dict with dominant_frequency (Hz, interpolated between bins),
+        peak_ratio, band_energy (mean power in the band, signal units squared),
+        band_energy_ratio (share of the detrended signal's power inside the band) and
+        passed (whether the expensive stages should run)
+    """
+    signals = np.asarray(signals, dtype=np.float64)
+    if signals.ndim == 1:
+        signals = signals[:, None]
+    fs = sample_rate(time)
+    nperseg = int(min(len(signals), max(8, round(segment_seconds * fs))))
+    # Channels first, so the result is (channels, frequencies, segments)
+    frequencies, _, power = spectrogram(signals.T, fs=fs, window='hann', nperseg=nperseg, noverlap=nperseg // 2,
+                                        detrend='linear', scaling='density', axis=-1)
+    in_band = (frequencies >= band[0]) & (frequencies <= min(band[1], fs / 2))
+    if in_band.sum() < 3:
+        raise ValueError(f"Band {band} Hz holds fewer than 3 frequency bins at {nperseg} samples per segment")
+    band_frequencies = frequencies[in_band]
+    band_power = power[:, in_band, :]
+
+    peak_bins = band_power.argmax(axis=1)
+    peaks = np.take_along_axis(band_power, peak_bins[:, None, :], axis=1)[:, 0, :]
+    floor = np.median(band_power, axis=1)
+    ratios = peaks / np.maximum(floor, np.finfo(np.float64).tiny)
+    best_segment = ratios.argmax(axis=1)
+
+    channels = np.arange(signals.shape[1])
+    peak_ratio = ratios[channels, best_segment]
+    peak_bin = peak_bins[channels, best_segment]
+    dominant = _interpolated_peak(band_power[channels, :, best_segment], peak_bin, band_frequencies)
+
+    df = frequencies[1] - frequencies[0]
+    band_energy = band_power.sum(axis=1).mean(axis=1) * df
+    total_energy = power.sum(axis=1).mean(axis=1) * df
+
+    return [
+        {
+            "dominant_frequency": float(dominant[i]),
+            "peak_ratio": float(peak_ratio[i]),
+            "band_energy": float(band_energy[i]),
+            "band_energy_ratio": float(band_energy[i] / total_energy[i]) if total_energy[i] > 0 else 0.0,
+            "passed": bool(peak_ratio[i] >= min_peak_ratio),
+        }
+        for i in channels
+    ]
+
+
+def configured_screen(signals, time):
+    """spectral_screen with the FO_SCREEN_* settings, as /api/detect_duration and batch_analysis.py run it."""
+    return spectral_screen(signals, time, band=config.SCREEN_BAND_HZ, segment_seconds=config.SCREEN_SEGMENT_SECONDS,
+                           min_peak_ratio=config.SCREEN_MIN_PEAK_RATIO)
+
+
+def _interpolated_peak(spectra, peak_bin, frequencies):
+    """Peak frequency of each row of ``spectra`` from a parabola through the peak bin and its neighbours."""
+    rows = np.arange(len(spectra))
+    inner = np.clip(peak_bin, 1, spectra.shape[1] - 2)
+    left, centre, right = (spectra[rows, inner + offset] for offset in (-1, 0, 1))
+    curvature = left - 2 * centre + right
+    shift = np.where(curvature < 0, 0.5 * (left - right) / np.where(curvature < 0, curvature, -1), 0.0)
+    # Peaks on the band edge are not interpolated
+    shift = np.where(inner == peak_bin, np.clip(shift, -0.5, 0.5), 0.0)
+    step = frequencies[1] - frequencies[0]
+    return frequencies[peak_bin] + shift * step
@@ -0,0 +1,238 @@
+# streaming.py
+
+import threading
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import detrend, savgol_coeffs
+
+from cwt import cwt_average_power, kernel_support
+
+
+class RingBuffer:
+    """Fixed-capacity buffer addressed by absolute sample index."""
+
+    def __init__(self, capacity, first_index=0, dtype=np.float64):
+        self.capacity = capacity
+        self.first_index = first_index
+        self.end = first_index  # one past the newest sample
+        self._data = np.zeros(capacity, dtype=dtype)
+
+    @property
+    def start(self):
+        return max(self.first_index, self.end - self.capacity)
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self._data.dtype)
+        count = len(values)
+        kept = values[-self.capacity:]
+        positions = np.arange(self.end + count - len(kept), self.end + count) % self.capacity
+        self._data[positions] = kept
+        self.end += count
+
+    def get(self, start, stop):
+        if start < self.start or stop > self.end:
+            raise IndexError(f"Samples [{start}, {stop}) are outside the buffer [{self.start}, {self.end})")
+        return self._data[np.arange(start, stop) % self.capacity]
+
+    def values(self):
+        return self.get(self.start, self.end)
+
+
+class StreamDetector:
+    """
+    Incremental forced-oscillation detector for a single PMU channel.
+
+    Mirrors the detect_oscillation_start_cwt pipeline on a stream: samples are
+    Savitzky-Golay filtered with the same FIR coefficients savgol_filter uses
+    for interior points, and the scale-averaged CWT power is computed in hops
+    of ``hop`` samples over a fixed-length segment padded by the wavelet
+    support on both sides, so interior power matches the whole-signal result
+    up to the (near-zero) wavelet response to the segment's linear detrend.
+
+    Start and end events come from a hysteresis detector on the power
+    relative to a running median baseline of the last ``window`` quiet
+    samples. All state lives in fixed-size ring buffers, so memory and work
+    per sample do not grow with the length of the stream.
+    """
+
+    def __init__(self, scales=np.arange(1, 101), wavelet='morl', hop=30, window=3000, warmup=300,
+                 on_ratio=8.0, off_ratio=3.0, hold_samples=30, savgol_window=50, savgol_polyorder=3,
+                 cwt_backend='fft'):
+        if hop < 1 or window < 1 or hold_samples < 1:
+            raise ValueError("hop, window and hold_samples must be positive")
+        if off_ratio > on_ratio:
+            raise ValueError("off_ratio must not exceed on_ratio")
+
+        self.scales = np.asarray(scales)
+        self.wavelet = wavelet
+        self.hop = hop
+        self.warmup = min(warmup, window)
+        self.on_ratio = on_ratio
+        self.off_ratio = off_ratio
+        self.hold_samples = hold_samples
+        self.cwt_backend = cwt_backend
+
+        self._savgol = savgol_coeffs(savgol_window, savgol_polyorder, use='dot')
+        self._savgol_before = (savgol_window - 1) // 2
+        self._savgol_after = savgol_window - 1 - self._savgol_before
+        self._cwt_before, self._cwt_after = kernel_support(self.scales, wavelet)
+
+        # Samples between an input sample arriving and its power being scored
+        self.latency_samples = self._savgol_after + self._cwt_after + hop - 1
+
+        segment = self._cwt_before + hop + self._cwt_after
+        self._raw = RingBuffer(savgol_window + hop)
+        self._filtered = RingBuffer(segment + hop, first_index=self._savgol_before)
+        self._times = RingBuffer(savgol_window + segment + 2 * hop + hold_samples)
+        self._baseline = RingBuffer(window)
+        self._power_end = self._filtered.first_index + self._cwt_before
+
+        self.in_event = False
+        self._run_above = 0
+        self._run_below = 0
+        self._candidate_start = None
+        self._candidate_end = None
+        self._event_start = None
+        self._lock = threading.Lock()
+
+    @property
+    def samples_received(self):
+        return self._raw.end
+
+    @property
+    def samples_scored(self):
+        return self._power_end - self._filtered.first_index - self._cwt_before
+
+    def push(self, times, values):
+        """Append samples and return the start/end events they completed."""
+        times = np.asarray(times, dtype=np.float64).reshape(-1)
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+        if times.shape != values.shape:
+            raise ValueError("time and values must have the same length")
+        if not np.all(np.isfinite(values)):
+            raise ValueError("values must be finite")
+
+        events = []
+        with self._lock:
+            # Feed at most one hop at a time so every buffer stays at its fixed size
+            for start in range(0, len(values), self.hop):
+                self._raw.extend(values[start:start + self.hop])
+                self._times.extend(times[start:start + self.hop])
+                self._filter_pending()
+                self._score_pending(events)
+        return events
+
+    def _filter_pending(self):
+        start = self._filtered.end
+        stop = self._raw.end - self._savgol_after
+        if stop <= start:
+            return
+        raw = self._raw.get(start - self._savgol_before, stop + self._savgol_after)
+        self._filtered.extend(sliding_window_view(raw, len(self._savgol)) @ self._savgol)
+
+    def _score_pending(self, events):
+        while self._filtered.end >= self._power_end + self.hop + self._cwt_after:
+            segment = self._filtered.get(self._power_end - self._cwt_before,
+                                         self._power_end + self.hop + self._cwt_after)
+            power = cwt_average_power(detrend(segment), self.scales, self.wavelet, backend=self.cwt_backend)
+            self._update_state(self._power_end, power[self._cwt_before:self._cwt_before + self.hop], events)
+            self._power_end += self.hop
+
+    def _update_state(self, first_index, power, events):
+        baseline = np.median(self._baseline.values()) if self._baseline.end >= self.warmup else None
+
+        for index, value in enumerate(power, start=first_index):
+            ratio = value / baseline if baseline else 0.0
+
+            if not self.in_event:
+                if baseline is not None and ratio > self.on_ratio:
+                    if self._run_above == 0:
+                        self._candidate_start = index
+                    self._run_above += 1
+                    if self._run_above >= self.hold_samples:
+                        self.in_event = True
+                        self._run_below = 0
+                        self._event_start = self._time_at(self._candidate_start)
+                        events.append({
+                            "event": "start",
+                            "sample": self._candidate_start,
+                            "time": self._event_start,
+                        })
+                else:
+                    self._run_above = 0
+                    # Only quiet samples feed the baseline, so a long oscillation can't become "normal"
+                    self._baseline.extend([value])
+            else:
+                if ratio < self.off_ratio:
+                    if self._run_below == 0:
+                        self._candidate_end = index - 1
+                    self._run_below += 1
+                    if self._run_below >= self.hold_samples:
+                        self.in_event = False
+                        self._run_above = 0
+                        end_time = self._time_at(self._candidate_end)
+                        events.append({
+                            "event": "end",
+                            "sample": self._candidate_end,
+                            "time": end_time,
+                            "start_time": self._event_start,
+                            "duration": end_time - self._event_start,
+                        })
+                else:
+                    self._run_below = 0
+
+    def _time_at(self, index):
+        return float(self._times.get(index, index + 1)[0])
+
+    def status(self):
+        with self._lock:
+            return {
+                "samples_received": self.samples_received,
+                "samples_scored": self.samples_scored,
+                "latency_samples": self.latency_samples,
+                "in_event": self.in_event,
+                "event_start_time": self._event_start if self.in_event else None,
+                "baseline_samples": min(self._baseline.end, self._baseline.capacity),
+            }
+
+
+class StreamRegistry:
+    """Bounded set of live StreamDetectors keyed by stream id."""
+
+    def __init__(self, max_streams):
+        self.max_streams = max_streams
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def create(self, stream_id, **options):
+        """Open (or reset) a stream with the given StreamDetector options."""
+        with self._lock:
+            return self._create(stream_id, options)
+
+    def get(self, stream_id):
+        with self._lock:
+            return self._streams.get(stream_id)
+
+    def get_or_create(self, stream_id):
+        with self._lock:
+            detector = self._streams.get(stream_id)
+            return detector if detector is not None else self._create(stream_id, {})
+
+    def _create(self, stream_id, options):
+        if stream_id not in self._streams and len(self._streams) >= self.max_streams:
+            raise OverflowError(f"Too many open streams (limit {self.max_streams})")
+        detector = StreamDetector(**options)
+        self._streams[stream_id] = detector
+        return detector
+
+    def remove(self, stream_id):
+        with self._lock:
+            return self._streams.pop(stream_id, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._streams.clear()
+
+    def __len__(self):
+        return len(self._streams)
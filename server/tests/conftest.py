@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# The server modules live one level up; the app under test gets its own database and blob store
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_scratch = tempfile.mkdtemp(prefix="fo-tests-")
+os.environ.setdefault("FO_DATABASE_URL", f"sqlite:///{os.path.join(_scratch, 'test.db')}")
+os.environ.setdefault("FO_BLOB_STORE_DIR", os.path.join(_scratch, "blobs"))
+os.environ.setdefault("FO_MODEL_WARMUP", "lazy")
@@ -0,0 +1,106 @@
+import json
+import os
+
+import numpy as np
+import pytest
+import xgboost as xgb
+
+import config
+from benchmarks.synthetic import generate_pmu_frame
+from compiled_trees import CompiledTrees, compiled_path
+from dataset_cache import DecodedDataset
+from features import PREDICTION_MODELS, FeaturePlans
+from model_registry import ModelRegistry
+
+MODEL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHIPPED_MODELS = [(model_name, importances_name) for _, model_name, _, importances_name in PREDICTION_MODELS]
+
+
+class ScalarBaseScore:
+    """A booster whose saved JSON has one base_score for all classes, as XGBoost 2.x writes for multi:softprob."""
+
+    def __init__(self, booster):
+        self.booster = booster
+
+    def save_raw(self, raw_format):
+        raw = json.loads(self.booster.save_raw(raw_format))
+        raw['learner']['learner_model_param']['base_score'] = '5E-1'
+        return bytearray(json.dumps(raw).encode())
+
+    def __getattr__(self, name):
+        return getattr(self.booster, name)
+
+
+def multiclass_booster(num_classes=4):
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(300, 6)).astype(np.float32)
+    y = np.arange(300) % num_classes
+    model = xgb.XGBClassifier(n_estimators=5, max_depth=3).fit(x, y)
+    raw = json.loads(ScalarBaseScore(model.get_booster()).save_raw("json"))
+    booster = xgb.Booster()
+    booster.load_model(bytearray(json.dumps(raw).encode()))
+    return booster, x
+
+
+def test_multiclass_scalar_base_score():
+    booster, x = multiclass_booster()
+    trees = CompiledTrees.from_model(ScalarBaseScore(booster), np.arange(x.shape[1]))
+    reference = booster.predict(xgb.DMatrix(x), output_margin=True)
+
+    assert trees.num_groups == 4
+    np.testing.assert_array_equal(trees.predict_margin(x), reference)
+    np.testing.assert_array_equal(trees.predict(x), reference.argmax(axis=1))
+    assert trees.predict_proba(x).shape == (len(x), 4)
+
+
+@pytest.fixture(scope="module")
+def registry():
+    return ModelRegistry(MODEL_DIR, prefer="pickle")
+
+
+def synthetic_rows(plan):
+    datasets = [
+        DecodedDataset(dict(generate_pmu_frame(source=source, frequency=frequency, seed=seed)[0]))
+        for seed, (source, frequency) in enumerate(
+            (source, frequency) for source in (None, 1, 3, 5, 8, 10) for frequency in (0.3, 0.8, 1.5))
+    ]
+    return plan.value_matrix(datasets)
+
+
+def perturbed_rows(rows, num_rows=400, seed=0):
+    # Rescaled copies with some missing values, to reach more classes and the default directions
+    rng = np.random.default_rng(seed)
+    values = rows[rng.integers(len(rows), size=num_rows)] * rng.uniform(0, 3, (num_rows, rows.shape[1]))
+    values[rng.random(values.shape) < 0.05] = np.nan
+    return values
+
+
+@pytest.mark.parametrize("model_name, importances_name", SHIPPED_MODELS)
+def test_shipped_models(registry, model_name, importances_name):
+    plan = FeaturePlans(registry).get(model_name, importances_name)
+    model = registry.get(model_name)
+    trees = CompiledTrees.from_model(model, plan.positions)
+
+    rows = synthetic_rows(plan)
+    np.testing.assert_array_equal(trees.predict(rows), model.predict(plan.sparse(rows)))
+    np.testing.assert_array_equal(trees.predict_proba(rows), model.predict_proba(plan.sparse(rows)))
+
+    rows = perturbed_rows(rows)
+    margin = model.get_booster().predict(xgb.DMatrix(plan.sparse(rows)), output_margin=True)
+    np.testing.assert_array_equal(trees.predict_margin(rows), margin.reshape(len(rows), -1))
+    np.testing.assert_array_equal(trees.predict(rows), model.predict(plan.sparse(rows)))
+    # The exponential can round differently from XGBoost's expf in the last bit
+    np.testing.assert_array_max_ulp(trees.predict_proba(rows), model.predict_proba(plan.sparse(rows)), maxulp=1)
+
+
+@pytest.mark.parametrize("model_name, importances_name", SHIPPED_MODELS)
+def test_exported_trees_match_shipped_models(model_name, importances_name):
+    registry = ModelRegistry(MODEL_DIR, prefer=config.MODEL_FORMAT)
+    exported = CompiledTrees.load(compiled_path(MODEL_DIR, model_name))
+    assert exported.source_digest == registry.digest(model_name)
+
+    plan = FeaturePlans(registry).get(model_name, importances_name)
+    np.testing.assert_array_equal(exported.positions, plan.positions)
+    rows = perturbed_rows(synthetic_rows(plan))
+    compiled = CompiledTrees.from_model(registry.get(model_name), plan.positions)
+    np.testing.assert_array_equal(exported.predict_margin(rows), compiled.predict_margin(rows))
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from cwt import CHUNKED_MIN_SAMPLES, cwt_average_power
+from utils import CWT_SCALES
+
+# Largest error allowed against pywt.cwt in float64, relative to the peak power
+TOLERANCE = {np.float64: 4e-15, np.float32: 2e-6}
+
+
+def oscillation(num_samples, channels=None, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(num_samples) / 30.0
+    shape = (num_samples,) if channels is None else (num_samples, channels)
+    tone = np.sin(2 * np.pi * 0.8 * t)
+    return (tone if channels is None else tone[:, np.newaxis]) + 0.1 * rng.standard_normal(shape)
+
+
+def assert_matches_pywt(power, reference, dtype):
+    assert power.shape == reference.shape
+    assert power.dtype == dtype
+    error = np.max(np.abs(power.astype(np.float64) - reference)) / np.max(reference)
+    assert error <= TOLERANCE[dtype]
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+@pytest.mark.parametrize("backend", ["fft", "chunked"])
+@pytest.mark.parametrize("channels", [None, 3])
+def test_matches_pywt(backend, dtype, channels):
+    signal = oscillation(3001, channels)
+    reference = cwt_average_power(signal, CWT_SCALES, backend="pywt")
+    assert_matches_pywt(cwt_average_power(signal, CWT_SCALES, backend=backend, dtype=dtype), reference, dtype)
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_long_signal_matches_pywt(dtype):
+    # Longer than CHUNKED_MIN_SAMPLES, so 'fft' runs chunked too
+    signal = oscillation(CHUNKED_MIN_SAMPLES + 5001)
+    reference = cwt_average_power(signal, CWT_SCALES, backend="pywt")
+    for backend in ("fft", "chunked"):
+        assert_matches_pywt(cwt_average_power(signal, CWT_SCALES, backend=backend, dtype=dtype), reference, dtype)
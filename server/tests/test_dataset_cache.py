@@ -0,0 +1,41 @@
+import threading
+import time
+
+from dataset_cache import DatasetCache
+
+CSV = b"Time,P1,P2\n0.0,1.0,2.0\n0.1,1.5,2.5\n"
+
+
+def test_concurrent_misses_decode_once():
+    cache = DatasetCache(max_bytes=1 << 20)
+    reads = []
+    start = threading.Barrier(8)
+    results = []
+
+    def source():
+        reads.append(1)
+        time.sleep(0.2)
+        return CSV
+
+    def load():
+        start.wait()
+        results.append(cache.get_or_load(1, "digest", "event.csv", source))
+
+    threads = [threading.Thread(target=load) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(reads) == 1
+    assert all(dataset is results[0] for dataset in results)
+    assert (cache.misses, cache.hits) == (1, 7)
+    assert cache._loads == {}
+
+
+def test_narrower_columns_served_from_covering_entry():
+    cache = DatasetCache(max_bytes=1 << 20)
+    cache.get_or_load(1, "digest", "event.csv", lambda: CSV, columns=["P1"], decode_columns=["Time", "P1", "P2"])
+    dataset = cache.get_or_load(1, "digest", "event.csv", lambda: CSV, columns=["P2"])
+    assert dataset.column_names == ["P2"]
+    assert (cache.misses, cache.hits) == (1, 1)
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+import main
+from benchmarks.synthetic import generate_pmu_frame
+from compiled_trees import TreePredictors
+from dataset_cache import DecodedDataset
+from features import FEATURE_COLUMNS
+
+
+def dense_prediction(model_name, encoder_name, importances_name, dataset):
+    # The original path: flatten (3001, 40) -> (1, 120040), weight by the tiled importances, predict
+    row = dataset.stack(FEATURE_COLUMNS).reshape(1, -1)
+    row = row * np.tile(main.models.get(importances_name), dataset.num_samples)
+    predictions = main.models.get(model_name).predict(row)
+    return str(main.models.get(encoder_name).inverse_transform(predictions)[0])
+
+
+def synthetic_uploads():
+    rng = np.random.default_rng(0)
+    uploads = []
+    for seed, source in enumerate((None, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10)):
+        frame, _ = generate_pmu_frame(source=source, frequency=rng.uniform(0.1, 2.0),
+                                      amplitude=rng.uniform(0.01, 0.2), seed=seed)
+        columns = dict(frame)
+        # Rescaled uploads and channels move the rows around the trees' thresholds, reaching more classes
+        scale = rng.choice([0.1, 1.0, 10.0, 100.0])
+        for name in FEATURE_COLUMNS:
+            columns[name] = columns[name] * scale * rng.uniform(0, 3)
+        uploads.append(DecodedDataset(columns))
+    return uploads
+
+
+UPLOADS = synthetic_uploads()
+
+
+@pytest.mark.parametrize("engine", ["compiled", "xgboost"])
+def test_plan_predictions_match_dense_rows(monkeypatch, engine):
+    monkeypatch.setattr(main, "tree_predictors", TreePredictors(main.models, engine))
+    for dataset in UPLOADS:
+        assert main.predict_source(dataset) == dense_prediction(
+            "xgb_model_weighted", "label_encoder", "rf_feature_importances", dataset)
+        assert main.predict_detection_class(dataset) == dense_prediction(
+            "xgb_model_weighted_detection", "label_encoder_detection", "rf_feature_importances_detection", dataset)
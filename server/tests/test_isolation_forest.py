@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from utils import (CONTAMINATION_VALUES, CWT_SCALES, _isolation_forest_refit, _isolation_forest_sweep,
+                   detect_anomalies_with_optimized_isolation_forest, detect_oscillation_start_cwt)
+
+
+def burst_power(size, seed):
+    # Quiet baseline with a burst of higher power, like a scaled CWT envelope
+    rng = np.random.default_rng(seed)
+    power = rng.random(size) * 0.05
+    power[size // 3: size // 2] += 0.5 + 0.5 * rng.random(size // 2 - size // 3)
+    return power
+
+
+def oscillation_power(size, seed):
+    rng = np.random.default_rng(seed)
+    t = np.arange(size) / 30.0
+    signal = 1.0 + 0.002 * rng.standard_normal(size)
+    signal += 0.05 * np.sin(2 * np.pi * 0.8 * t) * ((t >= 30) & (t < 70))
+    power, _, _ = detect_oscillation_start_cwt(signal, CWT_SCALES)
+    return power
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("power", [burst_power, oscillation_power])
+def test_sweep_matches_refit(power, seed):
+    signal = power(3001, seed)
+    refit_labels, refit_contamination = _isolation_forest_refit(signal, CONTAMINATION_VALUES)
+    sweep_labels, sweep_contamination = _isolation_forest_sweep(signal, CONTAMINATION_VALUES)
+    np.testing.assert_array_equal(sweep_labels, refit_labels)
+    assert sweep_contamination == refit_contamination
+
+
+
+def test_detection_matches_refit():
+    signal = oscillation_power(3001, 0)
+    refit = detect_anomalies_with_optimized_isolation_forest(signal, CONTAMINATION_VALUES, sweep=False)
+    sweep = detect_anomalies_with_optimized_isolation_forest(signal, CONTAMINATION_VALUES, sweep=True)
+    np.testing.assert_array_equal(sweep[0], refit[0])
+    assert sweep[1] == refit[1]
@@ -0,0 +1,46 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+from sklearn.preprocessing import LabelEncoder
+
+from model_registry import ModelRegistry
+
+MODEL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def registry(tmp_path):
+    for name in ("label_encoder", "xgb_model_weighted", "rf_feature_importances"):
+        shutil.copy(os.path.join(MODEL_DIR, name + ".pkl"), tmp_path / (name + ".pkl"))
+    return ModelRegistry(str(tmp_path), prefer="pickle")
+
+
+@pytest.mark.parametrize("filename", ["xgb_model_weighted.pkl", "../label_encoder.pkl", "label_encoder.ubj"])
+def test_reload_rejects_other_files(registry, filename):
+    encoder = registry.get("label_encoder")
+    with pytest.raises(ValueError):
+        registry.reload("label_encoder", filename)
+    assert registry.get("label_encoder") is encoder
+
+
+def test_reload_rejects_wrong_type(registry, tmp_path):
+    encoder = registry.get("label_encoder")
+    shutil.copy(tmp_path / "rf_feature_importances.pkl", tmp_path / "label_encoder.pkl")
+    with pytest.raises(ValueError):
+        registry.reload("label_encoder", "label_encoder.pkl")
+    assert registry.get("label_encoder") is encoder
+    assert isinstance(registry.get("label_encoder"), LabelEncoder)
+    assert isinstance(registry.get("rf_feature_importances"), np.ndarray)
+
+
+def test_reload_endpoint_rejects_foreign_pickle():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as client:
+        response = client.post("/api/models/label_encoder/reload", params={"filename": "scaler.pkl"})
+        assert response.status_code == 400
+        assert client.post("/api/models/label_encoder/reload").status_code == 200
@@ -0,0 +1,52 @@
+import io
+
+import numpy as np
+import pytest
+
+import config
+from benchmarks.synthetic import generate_pmu_frame
+from spectral import configured_screen, spectral_screen
+
+
+@pytest.fixture(scope="module")
+def weak_event():
+    # Source-3 event at amplitude 0.01: P1 only carries an attenuated copy
+    frame, truth = generate_pmu_frame(source=3, amplitude=0.01, seed=0)
+    return frame, truth
+
+
+def test_weak_event_peak_ratio_boundary(weak_event):
+    frame, _ = weak_event
+    signal, time = frame['P1'].to_numpy(), frame['Time'].to_numpy()
+    ratio = spectral_screen(signal, time)[0]["peak_ratio"]
+    assert ratio == pytest.approx(47.0, abs=0.5)
+
+    assert spectral_screen(signal, time, min_peak_ratio=ratio)[0]["passed"]
+    assert not spectral_screen(signal, time, min_peak_ratio=np.nextafter(ratio, np.inf))[0]["passed"]
+    # The threshold this screen shipped with first would have dropped the event
+    assert not spectral_screen(signal, time, min_peak_ratio=50.0)[0]["passed"]
+
+
+def test_screen_is_opt_in(weak_event):
+    frame, _ = weak_event
+    assert config.SCREEN_MIN_PEAK_RATIO == 0
+    assert configured_screen(frame['P1'].to_numpy(), frame['Time'].to_numpy())[0]["passed"]
+    # Event-free channels get through too: by default the screen only reports
+    event_free, _ = generate_pmu_frame(source=None, seed=0)
+    assert all(result["passed"] for result in configured_screen(event_free[['P1', 'P2']].to_numpy(),
+                                                                event_free['Time'].to_numpy()))
+
+
+def test_detect_duration_runs_on_weak_event(weak_event):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    frame, truth = weak_event
+    upload = io.BytesIO(frame.to_csv(index=False).encode())
+    with TestClient(main.app) as client:
+        file_id = client.post("/api/upload", files={"file": ("weak_event.csv", upload, "text/csv")}).json()["file_id"]
+        response = client.get(f"/api/detect_duration/{file_id}", params={"plots": False}).json()
+    assert response["screen"]["skipped_channels"] == 0
+    assert response["dominant_frequency"] == pytest.approx(truth["frequency"], abs=0.05)
+    assert response["duration"] > 0
@@ -0,0 +1,32 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import config
+import main
+
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.mark.parametrize("options", [
+    {"window": 1_000_000_000},
+    {"window": config.STREAM_MAX_WINDOW + 1},
+    {"hop": config.STREAM_MAX_HOP + 1},
+    {"max_scale": int(main.CWT_SCALES.max()) + 1},
+    {"hold_samples": 10 ** 9},
+    {"warmup": 10 ** 9},
+    {"window": 0},
+])
+def test_oversized_stream_is_rejected(client, options):
+    response = client.post("/api/stream/oversized", json=options)
+    assert response.status_code == 422
+    assert client.get("/api/stream/oversized").status_code == 404
+
+
+def test_stream_within_limits_opens(client):
+    response = client.post("/api/stream/bounded", json={"window": config.STREAM_MAX_WINDOW, "max_scale": 100})
+    assert response.status_code == 200
+    assert client.delete("/api/stream/bounded").status_code == 200
@@ -1,13 +1,40 @@
 import numpy as np
-import pywt
 import plotly.graph_objects as go
 from sklearn.ensemble import IsolationForest
 from sklearn.metrics import f1_score
 from scipy.signal import detrend, savgol_filter
 from io import BytesIO
 from sklearn.preprocessing import MinMaxScaler
+from cwt import cwt_average_power
+from changepoint import CHANGEPOINT_METHODS, changepoint_window, detect_changepoints
 
-def detect_anomalies_with_optimized_isolation_forest(signal, contamination_values, min_power_threshold=0.02):
+# Engines that turn scaled CWT power into an oscillation window
+DURATION_ENGINES = ('isolation_forest',) + CHANGEPOINT_METHODS
+
+# Duration detection parameters shared by the server endpoints and batch analysis
+CWT_SCALES = np.arange(1, 101)
+CONTAMINATION_VALUES = np.arange(0.05, 0.3, 0.05)
+MIN_ANOMALY_DURATION = 2
+MIN_POWER_THRESHOLD = 0.02
+
+def detect_anomalies_with_optimized_isolation_forest(signal, contamination_values, min_power_threshold=0.02, sweep=True):
+    """
+    Pick the best contamination for an Isolation Forest over a 1-D power signal.
+
+    With ``sweep=True`` the forest is fitted and scored once and every
+    contamination value is applied by thresholding those scores, which is how
+    ``IsolationForest`` derives its decision offset anyway. ``sweep=False``
+    keeps the original one-forest-per-value loop.
+    """
+    if sweep:
+        best_anomalies, best_contamination = _isolation_forest_sweep(signal, contamination_values)
+    else:
+        best_anomalies, best_contamination = _isolation_forest_refit(signal, contamination_values)
+
+    filtered_anomalies = np.where((best_anomalies == -1) & (signal > min_power_threshold), -1, 1)
+    return filtered_anomalies, best_contamination
+
+def _isolation_forest_refit(signal, contamination_values):
     signal_reshaped = signal.reshape(-1, 1)
     best_contamination = contamination_values[0]
     best_f1 = -1
@@ -26,23 +53,161 @@ def detect_anomalies_with_optimized_isolation_forest(signal, contamination_value
                 best_contamination = contamination
                 best_anomalies = anomalies
 
-    filtered_anomalies = np.where((best_anomalies == -1) & (signal > min_power_threshold), -1, 1)
-    return filtered_anomalies, best_contamination
+    return best_anomalies, best_contamination
+
+def _isolation_forest_sweep(signal, contamination_values):
+    signal_reshaped = signal.reshape(-1, 1)
+    contamination_values = np.asarray(contamination_values)
+
+    # Contamination doesn't change the trees, only offset_ = percentile(scores, 100 * c)
+    model = IsolationForest(random_state=42)
+    model.fit(signal_reshaped)
+    scores = model.score_samples(signal_reshaped)
+    offsets = np.percentile(scores, 100.0 * contamination_values)
+
+    # One row of labels per contamination value, same rule as IsolationForest.predict
+    is_anomaly = scores[np.newaxis, :] < offsets[:, np.newaxis]
+    anomaly_counts = is_anomaly.sum(axis=1)
+    if not np.any(anomaly_counts > 0):
+        return None, contamination_values[0]
 
-def detect_oscillation_start_cwt(signal, scales, wavelet='morl'):
+    # f1 against an all-anomaly target: tp = count, fp = 0, fn = n - count
+    f1 = 2.0 * anomaly_counts / (len(scores) + anomaly_counts)
+    f1[anomaly_counts == 0] = -1
+    best = int(np.argmax(f1))
+    return np.where(is_anomaly[best], -1, 1), contamination_values[best]
+
+def detect_oscillation_start_cwt(signal, scales, wavelet='morl', cwt_backend='fft', dtype=np.float64):
     signal_detrended = detrend(signal)
     signal_filtered = savgol_filter(signal_detrended, window_length=50, polyorder=3)
-    coefficients, freqs = pywt.cwt(signal_filtered, scales, wavelet)
-    
-    # Calculate power and rescale it to a common range
-    power = np.abs(coefficients) ** 2
-    avg_power = np.mean(power, axis=0)
+
+    # Scale-averaged power, computed without keeping the (scales x samples) coefficients
+    avg_power = cwt_average_power(signal_filtered, scales, wavelet, backend=cwt_backend, dtype=dtype)
+
+    # Rescale power to a common range
     scaler = MinMaxScaler(feature_range=(0, 1))
     avg_power_scaled = scaler.fit_transform(avg_power.reshape(-1, 1)).flatten()
     
     return avg_power_scaled, signal_filtered, signal_detrended
 
 
+def detect_oscillation_start_cwt_multichannel(signals, scales, wavelet='morl', cwt_backend='fft', dtype=np.float64):
+    """
+    Batched detect_oscillation_start_cwt over a (samples x channels) array.
+
+    Detrending, Savitzky-Golay filtering, CWT power and min-max scaling all run
+    column-wise in one pass, giving the same per-channel results as calling
+    detect_oscillation_start_cwt on each column.
+    """
+    signals_detrended = detrend(signals, axis=0)
+    signals_filtered = savgol_filter(signals_detrended, window_length=50, polyorder=3, axis=0)
+    avg_power = cwt_average_power(signals_filtered, scales, wavelet, backend=cwt_backend, dtype=dtype)
+
+    # MinMaxScaler scales each column independently
+    scaler = MinMaxScaler(feature_range=(0, 1))
+    avg_power_scaled = scaler.fit_transform(avg_power)
+
+    return avg_power_scaled, signals_filtered, signals_detrended
+
+def find_oscillation_window(anomalies, time, min_anomaly_duration=2):
+    """
+    Locate the oscillation from Isolation Forest labels.
+
+    Returns:
+        tuple: (start_time, end_time, duration), or None if nothing was flagged
+    """
+    anomaly_indices = np.where(anomalies == -1)[0]
+    if len(anomaly_indices) == 0:
+        return None
+
+    durations = np.diff(anomaly_indices)
+    is_significant_duration = np.insert(durations >= min_anomaly_duration, 0, True)
+    significant_anomalies = anomaly_indices[is_significant_duration]
+
+    start_time = time[significant_anomalies[0]]
+    end_time = time[significant_anomalies[-1]]
+    return start_time, end_time, end_time - start_time
+
+def detect_oscillation_windows_multichannel(signals, time, scales, contamination_values, min_power_threshold=0.02,
+                                            min_anomaly_duration=2, cwt_backend='fft', dtype=np.float64,
+                                            executor=None):
+    """
+    Run the full duration pipeline over every column of ``signals``.
+
+    The signal processing is vectorized across channels; the per-channel
+    Isolation Forest sweeps are spread over ``executor`` (any
+    concurrent.futures executor) when one is given.
+
+    Returns:
+        list: One (window, best_contamination) pair per channel, where window
+        is the find_oscillation_window result
+    """
+    avg_power, _, _ = detect_oscillation_start_cwt_multichannel(
+        signals, scales, cwt_backend=cwt_backend, dtype=dtype)
+
+    columns = [np.ascontiguousarray(avg_power[:, i]) for i in range(avg_power.shape[1])]
+    map_fn = executor.map if executor is not None else map
+    results = map_fn(
+        detect_anomalies_with_optimized_isolation_forest,
+        columns,
+        [contamination_values] * len(columns),
+        [min_power_threshold] * len(columns),
+    )
+
+    return [
+        (find_oscillation_window(anomalies, time, min_anomaly_duration), best_contamination)
+        for anomalies, best_contamination in results
+    ]
+
+
+def run_duration_pipeline(signal, time, scales, contamination_values, min_anomaly_duration=2,
+                          cwt_backend='fft', dtype=np.float64, min_power_threshold=0.02,
+                          engine='isolation_forest'):
+    """
+    CWT power, anomaly labelling and window search for one signal.
+
+    Returns:
+        tuple: (avg_power, signal_filtered, signal_detrended, anomalies, window)
+    """
+    avg_power, signal_filtered, signal_detrended = detect_oscillation_start_cwt(
+        signal, scales, cwt_backend=cwt_backend, dtype=dtype)
+    anomalies, window = detect_anomaly_window(avg_power, time, contamination_values, min_anomaly_duration,
+                                              min_power_threshold, engine)
+    return avg_power, signal_filtered, signal_detrended, anomalies, window
+
+def detect_anomaly_window(avg_power, time, contamination_values, min_anomaly_duration=2, min_power_threshold=0.02,
+                          engine='isolation_forest'):
+    """
+    Label a CWT power signal with one of DURATION_ENGINES and locate the oscillation; returns (anomalies, window).
+
+    'isolation_forest' is the original contamination sweep plus find_oscillation_window;
+    the change-point engines label contiguous runs and the window spans them.
+    """
+    if engine == 'isolation_forest':
+        anomalies, _ = detect_anomalies_with_optimized_isolation_forest(
+            avg_power, contamination_values, min_power_threshold)
+        return anomalies, find_oscillation_window(anomalies, time, min_anomaly_duration)
+    anomalies = detect_changepoints(avg_power, engine, min_anomaly_duration, min_power_threshold)
+    return anomalies, changepoint_window(anomalies, time)
+
+# Plots served by /api/detect_duration, named as in its JSON response
+PLOT_TYPES = ('original_signal', 'detrended_signal', 'filtered_signal', 'cwt_power_with_anomalies')
+
+def render_plot(plot_type, time, series, start_time=None, end_time=None, anomalies=None, SID=1):
+    """
+    Render one of the PLOT_TYPES to PNG bytes.
+
+    ``series`` is the signal for the *_signal plots and the scaled CWT power
+    for 'cwt_power_with_anomalies', which also needs ``anomalies``.
+    """
+    if plot_type == 'cwt_power_with_anomalies':
+        image_io = plot_cwt_power_with_anomalies(series, time, SID=SID, anomalies=anomalies)
+    elif plot_type in PLOT_TYPES:
+        image_io = plot_signal(series, time, start_time, end_time, SID=SID, plot_type=plot_type.split('_')[0])
+    else:
+        raise ValueError(f"Unknown plot type '{plot_type}'")
+    return image_io.getvalue()
+
 # Modified plotting function to save as image
 # def plot_signal(signal, time, start_time, end_time, SID, plot_type):
 #     fig = go.Figure()